@@ -0,0 +1,165 @@
+import math
+
+
+# (kind, enter, exit) per vital: an alert opens once ENTER_SAMPLES readings in a row are past `enter`
+# and closes when a reading is back past `exit`, so a value hovering at the limit doesn't flap
+THRESHOLDS = {
+    'heart_rate': [('high', 120.0, 110.0), ('low', 40.0, 45.0)],
+    'spo2': [('low', 92.0, 94.0)],
+    'temperature': [('high', 38.0, 37.7), ('low', 35.0, 35.5)],
+}
+ENTER_SAMPLES = 3
+
+# 'deviation' alerts fire on sudden changes relative to the user's own recent readings: the z-score
+# against an exponentially weighted mean and variance (about the last 1 / EWMA_ALPHA readings)
+EWMA_ALPHA = 0.01
+WARMUP_SAMPLES = 100
+Z_ENTER = 4.0
+Z_EXIT = 2.0
+# Floor under the EWMA std so a very steady signal doesn't turn sensor noise into huge z-scores
+MIN_STD = {'heart_rate': 2.0, 'spo2': 0.5, 'temperature': 0.1}
+
+# Column of each monitored vital in an ingested row (user_id, heart_rate, temperature, ecg, spo2, timestamp)
+METRIC_INDEX = {'heart_rate': 1, 'temperature': 2, 'spo2': 4}
+METRIC_LABELS = {'heart_rate': ("Heart rate", "bpm"), 'spo2': ("SpO2", "%"), 'temperature': ("Temperature", "°C")}
+
+
+class _MetricState:
+    __slots__ = ('n', 'mean', 'var', 'pending', 'active')
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.pending = {}   # kind -> readings in a row past the enter threshold
+        self.active = {}    # kind -> the open _Alert
+
+
+class _Alert:
+    # An open alert: its row id once stored (set by store_alert_events) and the most extreme value since it opened
+    __slots__ = ('id', 'peak')
+
+    def __init__(self, peak, id=None):
+        self.id = id
+        self.peak = peak
+
+
+class VitalsMonitor:
+    # Online anomaly detection over each user's stream of readings. Every reading costs O(1): a few
+    # comparisons and one EWMA update per vital. observe() returns events in order:
+    #   ('start', user_id, metric, kind, value, threshold, timestamp, alert)
+    #   ('end', user_id, metric, kind, peak, timestamp, alert)
+    # The first time a user is seen, load_open(user_id) gives the alerts already open in the table
+    # as (id, metric, kind, peak) rows. They are followed up on like this monitor's own, so another
+    # process's ingestor (or an earlier run) and this one agree on what is open.
+    # Not thread-safe: the ingestor calls it from its writer thread only.
+    def __init__(self, load_open=None):
+        self.load_open = load_open
+        self._users = {}
+
+    def observe(self, row, events=None):
+        events = [] if events is None else events
+        user_id, timestamp = row[0], row[5]
+        states = self._users.get(user_id)
+        if states is None:
+            states = self._users[user_id] = {metric: _MetricState() for metric in METRIC_INDEX}
+            for id, metric, kind, peak in (self.load_open(user_id) if self.load_open else ()):
+                if metric in states:
+                    states[metric].active[kind] = _Alert(peak, id)
+
+        for metric, index in METRIC_INDEX.items():
+            value = row[index]
+            # Zero readings mean the sensor isn't attached
+            if value is None or not value > 0 or math.isinf(value):
+                continue
+            state = states[metric]
+            for kind, enter, exit in THRESHOLDS[metric]:
+                high = kind == 'high'
+                self._step(state, events, user_id, metric, kind, value, enter, timestamp,
+                           beyond=value > enter if high else value < enter,
+                           within=value < exit if high else value > exit,
+                           worse=max if high else min)
+
+            if state.n >= WARMUP_SAMPLES:
+                z = (value - state.mean) / max(math.sqrt(state.var), MIN_STD[metric])
+                baseline = state.mean
+                self._step(state, events, user_id, metric, 'deviation', value, baseline, timestamp,
+                           beyond=abs(z) > Z_ENTER, within=abs(z) < Z_EXIT,
+                           worse=lambda a, b: a if abs(a - baseline) >= abs(b - baseline) else b)
+
+            # Incremental exponentially weighted mean and variance
+            if state.n == 0:
+                state.mean = value
+            else:
+                diff = value - state.mean
+                increment = EWMA_ALPHA * diff
+                state.mean += increment
+                state.var = (1 - EWMA_ALPHA) * (state.var + diff * increment)
+            state.n += 1
+        return events
+
+    def _step(self, state, events, user_id, metric, kind, value, threshold, timestamp, beyond, within, worse):
+        alert = state.active.get(kind)
+        if alert is not None:
+            if within:
+                del state.active[kind]
+                events.append(('end', user_id, metric, kind, alert.peak, timestamp, alert))
+            else:
+                alert.peak = worse(alert.peak, value)
+        elif beyond:
+            state.pending[kind] = state.pending.get(kind, 0) + 1
+            if state.pending[kind] >= ENTER_SAMPLES:
+                state.pending[kind] = 0
+                alert = state.active[kind] = _Alert(value)
+                events.append(('start', user_id, metric, kind, value, threshold, timestamp, alert))
+        else:
+            state.pending[kind] = 0
+
+
+def create_alerts_table(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS alerts
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
+                  metric TEXT, kind TEXT, value REAL, threshold REAL, peak REAL,
+                  started_at TEXT, ended_at TEXT,
+                  FOREIGN KEY (user_id) REFERENCES users(id))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_alerts_user_id ON alerts (user_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_alerts_open ON alerts (ended_at, user_id)")
+
+
+def open_alerts(conn, user_id):
+    return conn.execute("SELECT id, metric, kind, peak FROM alerts WHERE user_id = ? AND ended_at IS NULL",
+                        (user_id,)).fetchall()
+
+
+# Applies VitalsMonitor events; call inside the transaction that stores the readings behind them.
+# An end closes the row its start inserted (or that was loaded as open), and only if still open.
+def store_alert_events(conn, events):
+    for event in events:
+        if event[0] == 'start':
+            _, user_id, metric, kind, value, threshold, timestamp, alert = event
+            alert.id = conn.execute("INSERT INTO alerts (user_id, metric, kind, value, threshold, peak, started_at) "
+                                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (user_id, metric, kind, value, threshold, value, timestamp)).lastrowid
+        else:
+            _, user_id, metric, kind, peak, timestamp, alert = event
+            if alert.id is not None:
+                conn.execute("UPDATE alerts SET ended_at = ?, peak = ? WHERE id = ? AND ended_at IS NULL",
+                             (timestamp, peak, alert.id))
+
+
+# After the transaction store_alert_events ran in rolls back, the ids it set for new alerts don't exist
+def reset_alert_ids(events):
+    for event in events:
+        if event[0] == 'start':
+            event[-1].id = None
+
+
+def alert_message(alert):
+    label, unit = METRIC_LABELS.get(alert["metric"], (alert["metric"], ""))
+    if alert["kind"] == 'deviation':
+        return f"{label} changed suddenly: {alert['value']:.1f} {unit} (recent average {alert['threshold']:.1f} {unit})"
+    return f"{label} {alert['kind']}: {alert['value']:.1f} {unit} (limit {alert['threshold']:g} {unit})"
+
+
+def delete_alerts(c, user_id):
+    c.execute("DELETE FROM alerts WHERE user_id = ?", (user_id,))
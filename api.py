@@ -1,13 +1,41 @@
 # File: health_data_api.py
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from starlette.concurrency import run_in_threadpool
+import json
+import queue
 import sqlite3
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from db import migrate
+from ingest import get_ingestor
+from pool import AsyncDatabase
+from rollups import window_stats
+from waveforms import SAMPLE_DTYPE, get_writer
 
 app = FastAPI()
 
+
+db = AsyncDatabase('users.db')
+
+
+@app.on_event("startup")
+def init_db():
+    conn = sqlite3.connect('users.db', isolation_level=None)
+    migrate(conn)
+    conn.close()
+
+
+@app.on_event("shutdown")
+def close_db():
+    if not get_ingestor().flush(timeout=5.0):
+        print("Shutting down with readings still unwritten; the ingest writer did not finish within 5s")
+    db.close()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -22,41 +50,141 @@ class HealthData(BaseModel):
     average_spo2: float
 
 
-def get_average_sensor_data(user_id: int, days: int = 7):
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
+# One reading per NDJSON line; accepts the ESP8266's own field names (heartRate) as well
+class SensorReading(BaseModel):
+    model_config = ConfigDict(populate_by_name=True, allow_inf_nan=False)
 
-    seven_days_ago = datetime.now() - timedelta(days=days)
+    user_id: int
+    heart_rate: float = Field(alias='heartRate')
+    temperature: float
+    ecg: float
+    spo2: float
+    timestamp: Optional[datetime] = None  # naive timestamps are taken as UTC
 
-    c.execute("""
-        SELECT 
-            AVG(heart_rate) as avg_hr,
-            AVG(temperature) as avg_temp,
-            AVG(ecg) as avg_ecg,
-            AVG(spo2) as avg_spo2
-        FROM sensor_data
-        WHERE user_id = ? AND timestamp >= ?
-    """, (user_id, seven_days_ago))
 
-    result = c.fetchone()
-    conn.close()
+MAX_BATCH_SIZE = 10000
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+MAX_WAVEFORM_BYTES = 4 * 1024 * 1024
+# Seconds a client should wait before retrying a batch refused because the ingest queue was full
+RETRY_AFTER = 1
+
+
+# The body, refused before reading it when Content-Length is over the limit (and after, if a
+# chunked body turns out to be)
+async def read_body(request: Request, limit: int):
+    too_large = HTTPException(status_code=413, detail=f"Uploads are limited to {limit} bytes")
+    length = request.headers.get('content-length') or '0'
+    if not length.isdigit():
+        raise HTTPException(status_code=400, detail="Content-Length must be a whole number of bytes")
+    if int(length) > limit:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            raise too_large
+    return bytes(body)
+
 
-    if result[0] is None:
+# Non-empty NDJSON lines with their line numbers; raises 413 before any are parsed if there are too many
+def batch_lines(body: str):
+    lines = [(number, line) for number, line in enumerate(body.splitlines(), start=1) if line.strip()]
+    if len(lines) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batches are limited to {MAX_BATCH_SIZE} readings")
+    return lines
+
+
+def parse_readings(lines):
+    readings, errors = [], []
+    for number, line in lines:
+        try:
+            readings.append(SensorReading.model_validate_json(line))
+        except ValidationError as e:
+            errors.append({"line": number, "errors": json.loads(e.json(include_url=False))})
+    return readings, errors
+
+
+# Blocks while the ingest queue is full, so call it off the event loop. The batch is queued whole
+# or not at all (queue.Full), so a client retrying a refused batch doesn't store part of it twice.
+def store_readings(readings: List[SensorReading]):
+    get_ingestor().submit_many(
+        [(r.user_id, r.heart_rate, r.temperature, r.ecg, r.spo2, r.timestamp) for r in readings]
+    )
+
+
+def get_average_sensor_data(conn: sqlite3.Connection, user_id: int, days: int = 7):
+    end = datetime.now(timezone.utc)
+    stats = window_stats(conn, user_id, end - timedelta(days=days), end)
+
+    if stats['heart_rate']['count'] == 0:
         return None
 
     return HealthData(
-        average_heart_rate=result[0],
-        average_temperature=result[1],
-        average_ecg=result[2],
-        average_spo2=result[3]
+        average_heart_rate=stats['heart_rate']['mean'],
+        average_temperature=stats['temperature']['mean'],
+        average_ecg=stats['ecg']['mean'],
+        average_spo2=stats['spo2']['mean']
     )
 
 
 @app.get("/api/health_data/{user_id}")
-async def health_data_api(user_id: int):
-    data = get_average_sensor_data(user_id)
+async def health_data_api(user_id: int, days: int = Query(7, ge=1, le=3650)):
+    data = await db.run(get_average_sensor_data, user_id, days)
     if data is None:
         raise HTTPException(status_code=404, detail="No data found for this user")
     return data
 
 
+@app.post("/api/ingest")
+async def ingest_api(request: Request):
+    try:
+        body = (await read_body(request, MAX_BATCH_BYTES)).decode()
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Body must be UTF-8 NDJSON")
+    readings, errors = parse_readings(batch_lines(body))
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    try:
+        await run_in_threadpool(store_readings, readings)
+    except queue.Full:
+        raise HTTPException(status_code=503, detail="Ingest queue is full, retry later",
+                            headers={"Retry-After": str(RETRY_AFTER)})
+    return {"accepted": len(readings)}
+
+
+# High-rate ECG: the body is raw little-endian float32 samples at rate_hz, the first taken at
+# `start` (UTC; default: the last sample is now). They go to the waveform store, not SQLite.
+@app.post("/api/ecg/{user_id}")
+async def ecg_waveform_api(user_id: int, request: Request, rate_hz: float = Query(..., gt=0, le=10000),
+                           start: Optional[datetime] = None):
+    body = await read_body(request, MAX_WAVEFORM_BYTES)
+    if len(body) % SAMPLE_DTYPE.itemsize:
+        raise HTTPException(status_code=422, detail="Body must be a whole number of float32 samples")
+    samples = np.frombuffer(body, dtype=SAMPLE_DTYPE)
+    start = start or datetime.now(timezone.utc) - timedelta(seconds=len(samples) / rate_hz)
+    await run_in_threadpool(lambda: get_writer(user_id, rate_hz, start=start).append(samples, start))
+    return {"accepted": len(samples)}
+
+
+@app.websocket("/api/ingest/ws")
+async def ingest_ws(websocket: WebSocket):
+    # Each text message is an NDJSON batch and is acknowledged with the number of readings stored
+    await websocket.accept()
+    try:
+        while True:
+            try:
+                readings, errors = parse_readings(batch_lines(await websocket.receive_text()))
+            except HTTPException:
+                await websocket.send_json({"accepted": 0, "errors": "batch too large"})
+                continue
+            if errors:
+                await websocket.send_json({"accepted": 0, "errors": errors})
+                continue
+            try:
+                await run_in_threadpool(store_readings, readings)
+            except queue.Full:
+                await websocket.send_json({"accepted": 0, "errors": "ingest queue is full", "retry_after": RETRY_AFTER})
+                continue
+            await websocket.send_json({"accepted": len(readings)})
+    except WebSocketDisconnect:
+        pass
@@ -1,53 +1,36 @@
 import streamlit as st
 import sqlite3
-import hashlib
 import os
+from alerts import delete_alerts
+from archive import delete_archive
+from chat_store import delete_chats
+from db import migrate, partition_tables
+from passwords import authenticate, hash_password
+from rollups import delete_rollups
+from utils import db_connection
 
 
 def init_db():
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY, username TEXT UNIQUE, password TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS sensor_data
-                 (id INTEGER PRIMARY KEY, user_id INTEGER, 
-                  heart_rate REAL, temperature REAL, ecg REAL, spo2 REAL, 
-                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (user_id) REFERENCES users(id))''')
-    conn.commit()
-    conn.close()
-
-
-
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
+    with db_connection() as conn:
+        migrate(conn)
 
 
 
 def register_user(username, password):
     hashed_password = hash_password(password)
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    with db_connection() as conn:
+        try:
+            conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
+            return True
+        except sqlite3.IntegrityError:
+            return False
 
 
 
+# Looks the user up by name and checks the password against their salted scrypt hash
 def authenticate_user(username, password):
-    hashed_password = hash_password(password)
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute("SELECT id, username FROM users WHERE username=? AND password=?", (username, hashed_password))
-    result = c.fetchone()
-    conn.close()
-    return result
+    with db_connection() as conn:
+        return authenticate(conn, username, password)
 
 
 
@@ -57,33 +40,29 @@ def logout():
 
 
 def update_username(user_id, new_username):
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    try:
-        c.execute("UPDATE users SET username = ? WHERE id = ?", (new_username, user_id))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    with db_connection() as conn:
+        try:
+            conn.execute("UPDATE users SET username = ? WHERE id = ?", (new_username, user_id))
+            return True
+        except sqlite3.IntegrityError:
+            return False
 
 def update_password(user_id, new_password):
     hashed_password = hash_password(new_password)
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute("UPDATE users SET password = ? WHERE id = ?", (hashed_password, user_id))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        conn.execute("UPDATE users SET password = ? WHERE id = ?", (hashed_password, user_id))
     return True
 
 def delete_account(user_id):
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute("DELETE FROM sensor_data WHERE user_id = ?", (user_id,))
-    c.execute("DELETE FROM users WHERE id = ?", (user_id,))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        c = conn.cursor()
+        for table in ['sensor_data'] + partition_tables(conn):
+            c.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+        delete_rollups(c, user_id)
+        delete_alerts(c, user_id)
+        delete_chats(c, user_id)
+        c.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    delete_archive(user_id)
     return True
 init_db()
 
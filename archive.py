@@ -0,0 +1,146 @@
+import argparse
+import os
+import shutil
+import sqlite3
+from datetime import date, datetime, time, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from db import DB_PATH, drop_empty_partitions, migrate, partition_tables, sensor_source
+
+
+ARCHIVE_DIR = 'archive'
+ARCHIVE_AFTER_DAYS = 30
+CHUNK_ROWS = 500_000
+
+ARCHIVE_COLUMNS = ['id', 'heart_rate', 'temperature', 'ecg', 'spo2', 'timestamp']
+SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('heart_rate', pa.float64()),
+    ('temperature', pa.float64()),
+    ('ecg', pa.float64()),
+    ('spo2', pa.float64()),
+    ('timestamp', pa.timestamp('us', tz='UTC')),
+])
+
+
+# One zstd-compressed Parquet file per user per UTC day: archive/user_<id>/<YYYY-MM-DD>.parquet
+def user_dir(user_id, root=ARCHIVE_DIR):
+    return os.path.join(root, f"user_{user_id}")
+
+
+def day_path(user_id, day, root=ARCHIVE_DIR):
+    return os.path.join(user_dir(user_id, root), f"{day.isoformat()}.parquet")
+
+
+def archived_days(user_id, root=ARCHIVE_DIR):
+    try:
+        names = os.listdir(user_dir(user_id, root))
+    except FileNotFoundError:
+        return []
+    return sorted(date.fromisoformat(name[:-len('.parquet')]) for name in names if name.endswith('.parquet'))
+
+
+def _utc(value):
+    value = pd.Timestamp(value)
+    return value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC')
+
+
+# Archived rows with start <= timestamp < end (UTC datetimes or UTC timestamp text), oldest first,
+# with a tz-aware UTC timestamp column. Files are memory-mapped, and only the days in range are opened.
+def read_archive(user_id, start, end, root=ARCHIVE_DIR):
+    start, end = _utc(start), _utc(end)
+    tables = []
+    for day in archived_days(user_id, root):
+        if start.date() <= day <= end.date():
+            table = pq.read_table(day_path(user_id, day, root), memory_map=True)
+            mask = pc.and_(pc.greater_equal(table['timestamp'], pa.scalar(start, SCHEMA.field('timestamp').type)),
+                           pc.less(table['timestamp'], pa.scalar(end, SCHEMA.field('timestamp').type)))
+            tables.append(table.filter(mask))
+    if not tables:
+        return pd.DataFrame({name: pd.Series(dtype='datetime64[ns, UTC]' if name == 'timestamp' else SCHEMA.field(name).type.to_pandas_dtype()) for name in ARCHIVE_COLUMNS})
+    return pa.concat_tables(tables).to_pandas(coerce_temporal_nanoseconds=True)
+
+
+def archived_rows(user_id, root=ARCHIVE_DIR):
+    return sum(pq.ParquetFile(day_path(user_id, day, root)).metadata.num_rows for day in archived_days(user_id, root))
+
+
+def _write_day(path, table):
+    if os.path.exists(path):
+        table = pa.concat_tables([pq.read_table(path, memory_map=True), table])
+        # Rows archived twice (a run interrupted before its delete) are kept once
+        _, first = np.unique(table['id'].to_numpy(), return_index=True)
+        table = table.take(first)
+    table = table.sort_by('timestamp')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, f"{path}.tmp", compression='zstd')
+    os.replace(f"{path}.tmp", path)
+
+
+# Moves readings from before UTC midnight `older_than_days` ago out of SQLite into the archive.
+# Files are written first and rows deleted after, both bounded by the highest id seen at the start,
+# so rows that arrive meanwhile (even with old timestamps) stay in SQLite until the next run.
+def archive_old_data(conn, older_than_days=ARCHIVE_AFTER_DAYS, root=ARCHIVE_DIR):
+    cutoff = datetime.combine(datetime.now(timezone.utc).date() - timedelta(days=older_than_days), time.min)
+    cutoff = cutoff.isoformat(sep=' ')
+    source = sensor_source(conn)
+    max_id = conn.execute(f"SELECT MAX(id) FROM {source}").fetchone()[0] or 0
+    user_ids = [row[0] for row in conn.execute(
+        f"SELECT DISTINCT user_id FROM {source} WHERE timestamp < ? AND id <= ?", (cutoff, max_id))]
+
+    moved = 0
+    for user_id in user_ids:
+        query = f"""
+        SELECT {', '.join(ARCHIVE_COLUMNS)} FROM {source}
+        WHERE user_id = ? AND timestamp < ? AND id <= ?
+        ORDER BY timestamp
+        """
+        for chunk in pd.read_sql_query(query, conn, params=(user_id, cutoff, max_id), chunksize=CHUNK_ROWS):
+            chunk["timestamp"] = pd.to_datetime(chunk["timestamp"], utc=True, format="ISO8601")
+            for day, rows in chunk.groupby(chunk["timestamp"].dt.date):
+                _write_day(day_path(user_id, day, root), pa.Table.from_pandas(rows, schema=SCHEMA, preserve_index=False))
+            moved += len(chunk)
+
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        for table in ['sensor_data'] + partition_tables(conn):
+            c.execute(f"DELETE FROM {table} WHERE timestamp < ? AND id <= ?", (cutoff, max_id))
+        drop_empty_partitions(c)
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK")
+        raise
+    print(f"Archived {moved:,} readings from before {cutoff} UTC for {len(user_ids)} users")
+    return moved
+
+
+def delete_archive(user_id, root=ARCHIVE_DIR):
+    shutil.rmtree(user_dir(user_id, root), ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old sensor readings into the Parquet archive")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--root', default=ARCHIVE_DIR)
+    parser.add_argument('--older-than', type=int, default=ARCHIVE_AFTER_DAYS, metavar='DAYS')
+    parser.add_argument('--vacuum', action='store_true', help="shrink the database file afterwards")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        migrate(conn)
+        archive_old_data(conn, args.older_than, args.root)
+        if args.vacuum:
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
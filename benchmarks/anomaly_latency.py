@@ -0,0 +1,57 @@
+# Per-reading cost of the anomaly detection that runs in the ingestor's writer thread, on synthetic
+# vitals with a tachycardia episode and an SpO2 desaturation injected, and the alerts it raised.
+#
+#   python -m benchmarks.anomaly_latency --users 100 --samples 2000
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from alerts import VitalsMonitor
+from ingest import utc_timestamp
+
+
+def readings(users, samples):
+    rng = np.random.default_rng(0)
+    values = rng.normal([75, 36.8, 500, 97.5], [3, 0.05, 80, 0.5], size=(samples, users, 4))
+    # A few seconds of tachycardia a third of the way through and a desaturation two thirds through
+    a, b = samples // 3, 2 * samples // 3
+    values[a:a + 50, :, 0] += 70
+    values[b:b + 50, :, 3] -= 8
+    start = datetime.now()
+    stamps = [utc_timestamp(start + timedelta(milliseconds=100 * i)) for i in range(samples)]
+    return [(user_id, *map(float, values[i, user_id]), stamps[i]) for i in range(samples) for user_id in range(users)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--samples', type=int, default=2000, help="readings per user (10 Hz)")
+    args = parser.parse_args()
+    rows = readings(args.users, args.samples)
+
+    monitor = VitalsMonitor()
+    events = []
+    timings = np.empty(len(rows))
+    clock = time.perf_counter_ns
+    start = time.perf_counter()
+    for i, row in enumerate(rows):
+        t = clock()
+        monitor.observe(row, events)
+        timings[i] = clock() - t
+    elapsed = time.perf_counter() - start
+
+    kinds = {}
+    for event in events:
+        if event[0] == 'start':
+            kinds[(event[2], event[3])] = kinds.get((event[2], event[3]), 0) + 1
+    print(f"{len(rows):,} readings for {args.users} users: {len(rows) / elapsed:,.0f} readings/s")
+    print(f"per reading: mean {timings.mean() / 1000:.1f} µs, p99 {np.percentile(timings, 99) / 1000:.1f} µs, "
+          f"p99.9 {np.percentile(timings, 99.9) / 1000:.1f} µs (budget 1000 µs)")
+    for (metric, kind), count in sorted(kinds.items()):
+        print(f"  {metric} {kind}: {count} alerts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Load test for the FastAPI health data endpoint against a locally generated database.
+#
+#   python -m benchmarks.api_load --users 50 --rows-per-user 20000 --requests 5000 --concurrency 64
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from db import migrate
+from rollups import rebuild_rollups
+
+
+def build_dataset(path, users, rows_per_user, days):
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn)
+    end = datetime.now(timezone.utc).replace(tzinfo=None)
+    step = timedelta(seconds=days * 86400 / rows_per_user)
+
+    def generate():
+        for user_id in range(1, users + 1):
+            for i in range(rows_per_user):
+                ts = end - step * i
+                yield (user_id, random.gauss(75, 8), random.gauss(36.8, 0.4), random.gauss(500, 80),
+                       random.gauss(97, 1.5), ts.isoformat(sep=' ', timespec='seconds'))
+
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO users (id, username, password) VALUES (?, ?, '')",
+                     [(i, f"user{i}") for i in range(1, users + 1)])
+    conn.executemany("INSERT INTO sensor_data (user_id, heart_rate, temperature, ecg, spo2, timestamp) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", generate())
+    rebuild_rollups(conn.cursor())
+    conn.execute("COMMIT")
+    conn.close()
+
+
+def start_server(workdir, port):
+    # Separate process so the client doesn't share a GIL with the server being measured
+    env = dict(os.environ, PYTHONPATH=os.getcwd() + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'api:app', '--port', str(port),
+                               '--log-level', 'warning'], cwd=workdir, env=env)
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/docs")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("API server did not start")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def hammer(base_url, users, total, concurrency, max_days):
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                url = f"/api/health_data/{random.randint(1, users)}?days={random.randint(1, max_days)}"
+                start = time.perf_counter()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rows-per-user', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    args = parser.parse_args()
+
+    # api.py opens users.db relative to its working directory
+    workdir = tempfile.mkdtemp()
+    start = time.perf_counter()
+    build_dataset(os.path.join(workdir, 'users.db'), args.users, args.rows_per_user, args.days)
+    print(f"Generated {args.users * args.rows_per_user:,} rows in {time.perf_counter() - start:.1f}s ({workdir})")
+
+    port = free_port()
+    server = start_server(workdir, port)
+    try:
+        latencies, errors, elapsed = asyncio.run(
+            hammer(f"http://127.0.0.1:{port}", args.users, args.requests, args.concurrency, args.days))
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{len(latencies)} requests, {errors} errors, concurrency {args.concurrency}")
+    print(f"{len(latencies) / elapsed:.0f} req/s   p50 {p50:.1f} ms   p99 {p99:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
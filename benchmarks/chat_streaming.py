@@ -0,0 +1,87 @@
+# Rendering a streamed answer from the local fake model server: the old loop (split each chunk on
+# spaces, sleep 50 ms and repaint per word) against chat_stream.stream_response.
+#
+#   python -m benchmarks.chat_streaming --rate 40 --tokens-per-chunk 8
+import argparse
+import socket
+import threading
+import time
+
+import uvicorn
+
+from benchmarks.fake_model_server import create_app
+from chat_stream import ModelServerChat, StreamStats, chunk_text, count_tokens, stream_response
+
+
+class Placeholder:
+    # Stands in for st.empty(): counts repaints and the characters they send to the browser
+    def __init__(self):
+        self.frames = 0
+        self.painted = 0
+        self.first_paint = None
+
+    def markdown(self, text):
+        if self.first_paint is None:
+            self.first_paint = time.perf_counter()
+        self.frames += 1
+        self.painted += len(text)
+
+    write = markdown
+
+
+def start_server(ttft, rate, tokens_per_chunk):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(create_app(ttft, rate, tokens_per_chunk), host='127.0.0.1',
+                                           port=port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}/chat"
+
+
+def old_loop(placeholder, response):
+    full_response = ''
+    for chunk in response:
+        for ch in chunk_text(chunk).split(' '):
+            full_response += ch + ' '
+            time.sleep(0.05)
+            placeholder.write(full_response + '▌')
+    placeholder.write(full_response)
+    return full_response
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ttft', type=float, default=0.4, help="server's time to first token, seconds")
+    parser.add_argument('--rate', type=float, default=40.0, help="server's tokens per second")
+    parser.add_argument('--tokens-per-chunk', type=int, default=8)
+    parser.add_argument('--responses', type=int, default=3)
+    args = parser.parse_args()
+    server, url = start_server(args.ttft, args.rate, args.tokens_per_chunk)
+
+    try:
+        for name in ("old loop", "stream_response"):
+            for i in range(args.responses):
+                placeholder = Placeholder()
+                start = time.perf_counter()
+                chunks = ModelServerChat(url).send_message("How am I doing?")
+                if name == "old loop":
+                    text = old_loop(placeholder, chunks)
+                    stats = None
+                else:
+                    stats = StreamStats()
+                    text, stats = stream_response(placeholder, chunks, stats)
+                elapsed = time.perf_counter() - start
+                first_paint = (placeholder.first_paint - start) * 1000
+                rate = count_tokens(text) / (time.perf_counter() - placeholder.first_paint)
+                print(f"{name:>15}: first paint {first_paint:6.0f} ms, done in {elapsed:5.2f}s, "
+                      f"{placeholder.frames:3d} repaints ({placeholder.painted:,} chars), {rate:5.1f} tokens/s shown"
+                      + (f"  [recorded: {stats.summary()}]" if stats else ""))
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
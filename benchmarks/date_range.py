@@ -0,0 +1,93 @@
+# Compares the old date(timestamp) = ? filter with the half-open range from queries.py
+# on a synthetic sensor_data table.
+#
+#   python -m benchmarks.date_range --rows 10000000
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from db import migrate
+from queries import day_range
+
+
+OLD_QUERY = """
+    SELECT heart_rate, temperature, ecg, spo2, timestamp FROM sensor_data
+    WHERE user_id = ? AND date(timestamp) = date(?)
+    ORDER BY timestamp
+"""
+
+NEW_QUERY = """
+    SELECT heart_rate, temperature, ecg, spo2, timestamp FROM sensor_data
+    WHERE user_id = ? AND timestamp >= ? AND timestamp < ?
+    ORDER BY timestamp
+"""
+
+
+def build_table(path, rows, users, days):
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    start = datetime.combine(date.today() - timedelta(days=days), datetime.min.time())
+    step = days * 86400 / (rows / users)
+    per_user = rows // users
+
+    def generate():
+        for user_id in range(1, users + 1):
+            for i in range(per_user):
+                ts = start + timedelta(seconds=i * step)
+                yield (user_id, random.gauss(75, 8), random.gauss(36.8, 0.4), random.gauss(500, 80),
+                       random.gauss(97, 1.5), ts.isoformat(sep=' ', timespec='milliseconds'))
+
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO sensor_data (user_id, heart_rate, temperature, ecg, spo2, timestamp) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", generate())
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    return conn
+
+
+def timed(conn, query, params, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n = len(conn.execute(query, params).fetchall())
+        best = min(best, time.perf_counter() - start)
+    return best, n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        conn = build_table(path, args.rows, args.users, args.days)
+        print(f"Built {args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+
+        # Synthetic timestamps are generated as UTC, so pass tz=utc to compare identical rows
+        for offset in (1, args.days // 2, args.days - 1):
+            day = date.today() - timedelta(days=offset)
+            user_id = random.randint(1, args.users)
+            old, n_old = timed(conn, OLD_QUERY, (user_id, day.isoformat()), args.repeat)
+            start_utc, end_utc = day_range(day, tz=timezone.utc)
+            new, n_new = timed(conn, NEW_QUERY, (user_id, start_utc, end_utc), args.repeat)
+            print(f"user {user_id} {day}: date() {old * 1000:8.1f} ms ({n_old} rows)   "
+                  f"range {new * 1000:8.1f} ms ({n_new} rows)   {old / new:6.1f}x")
+        conn.close()
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
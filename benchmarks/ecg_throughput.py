@@ -0,0 +1,53 @@
+# ECG pipeline throughput on synthetic ECG: whole-array analysis and streaming in poll-sized chunks,
+# with how many of the simulated beats were found.
+#
+#   python -m benchmarks.ecg_throughput --minutes 10 --rate 250 --bpm 72
+import argparse
+import time
+
+from benchmarks.esp_simulator import fake_ecg
+from ecg import ECGProcessor, analyse, hrv, rr_intervals
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def streamed(samples, rate_hz, chunk):
+    processor = ECGProcessor(rate_hz)
+    for i in range(0, len(samples), chunk):
+        processor.process(samples[i:i + chunk])
+    return processor
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--minutes', type=float, default=10.0)
+    parser.add_argument('--rate', type=float, default=250.0, help="sample rate in Hz")
+    parser.add_argument('--bpm', type=float, default=72.0)
+    parser.add_argument('--chunk', type=float, default=0.1, help="seconds per streamed chunk (one poll at 10 Hz)")
+    args = parser.parse_args()
+
+    n = int(args.minutes * 60 * args.rate)
+    samples = fake_ecg(0, n, args.rate, args.bpm)
+    expected = int(args.minutes * args.bpm)
+    print(f"{n:,} samples ({args.minutes:g} min at {args.rate:g} Hz, {expected} beats)")
+
+    (_, peaks), elapsed = timed(lambda: analyse(samples, args.rate))
+    summary = hrv(rr_intervals(peaks, args.rate))
+    print(f"whole array:    {n / elapsed:>14,.0f} samples/s  {len(peaks)} beats, "
+          f"{summary['heart_rate']:.1f} bpm, RMSSD {summary['rmssd_ms']:.1f} ms")
+
+    for chunk_seconds in (args.chunk, 1.0, 60.0):
+        chunk = max(1, int(chunk_seconds * args.rate))
+        processor, elapsed = timed(lambda: streamed(samples, args.rate, chunk))
+        summary = processor.hrv()
+        print(f"stream {chunk_seconds:>5g}s:   {n / elapsed:>14,.0f} samples/s  {len(processor.peaks)} beats, "
+              f"{summary['heart_rate']:.1f} bpm, RMSSD {summary['rmssd_ms']:.1f} ms "
+              f"({n / elapsed / args.rate:,.0f} boards in real time per core)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# Stands in for a fleet of ESP8266 boards.
+#
+# Push readings to the ingestion API:
+#   uvicorn api:app --port 8000
+#   python -m benchmarks.esp_simulator --url http://127.0.0.1:8000 --devices 2000 --mode ws
+#
+# Serve GET /data like the boards' firmware, for the dashboard or poller.py to poll
+# (--ecg-rate 250 adds a high-rate ECG waveform, as ecgSamples since the previous poll):
+#   python -m benchmarks.esp_simulator --mode serve --port 8080
+#
+# Poll a fake fleet with poller.DevicePoller and report the achieved sample rate:
+#   python -m benchmarks.esp_simulator --mode poll --devices 1000 --rate 10
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+import websockets
+
+from ingest import SensorIngestor
+
+
+def fake_reading(user_id):
+    return {
+        "user_id": user_id,
+        "heartRate": round(random.gauss(75, 8), 1),
+        "temperature": round(random.gauss(36.8, 0.4), 2),
+        "ecg": round(random.gauss(500, 80), 1),
+        "spo2": round(random.gauss(97, 1.5), 1),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def fake_batch(user_id, size):
+    return "\n".join(json.dumps(fake_reading(user_id)) for _ in range(size))
+
+
+class Stats:
+    def __init__(self):
+        self.readings = 0
+        self.batches = 0
+        self.errors = 0
+        self.latencies = []
+
+
+async def http_device(client, user_id, args, stats, deadline):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await client.post("/api/ingest", content=fake_batch(user_id, args.batch),
+                                         headers={"Content-Type": "application/x-ndjson"})
+            response.raise_for_status()
+            stats.readings += response.json()["accepted"]
+            stats.batches += 1
+        except httpx.HTTPError:
+            stats.errors += 1
+        stats.latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(args.interval)
+
+
+async def ws_device(url, user_id, args, stats, deadline):
+    try:
+        async with websockets.connect(url) as ws:
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                await ws.send(fake_batch(user_id, args.batch))
+                ack = json.loads(await ws.recv())
+                stats.latencies.append(time.perf_counter() - start)
+                if ack.get("errors"):
+                    stats.errors += 1
+                stats.readings += ack["accepted"]
+                stats.batches += 1
+                await asyncio.sleep(args.interval)
+    except (OSError, websockets.WebSocketException):
+        stats.errors += 1
+
+
+def firmware_payload():
+    reading = fake_reading(0)
+    return {"heartRate": reading["heartRate"], "temperature": reading["temperature"],
+            "ecg": reading["ecg"], "spo2": reading["spo2"]}
+
+
+# Synthetic ECG: a narrow R wave every beat on a noisy baseline, samples first..first+n-1 at rate_hz
+def fake_ecg(first, n, rate_hz, bpm=75.0):
+    t = (first + np.arange(n)) / rate_hz
+    phase = (t * bpm / 60.0) % 1.0
+    wave = 500 + 350 * np.exp(-((phase - 0.5) / 0.012) ** 2) - 60 * np.exp(-((phase - 0.54) / 0.02) ** 2)
+    wave += 40 * np.exp(-((phase - 0.8) / 0.05) ** 2) + 15 * np.sin(2 * np.pi * 0.3 * t)
+    return wave + np.random.normal(0, 5, n)
+
+
+# Minimal keep-alive HTTP/1.1 server answering GET /data the way esp8266.ino does
+async def serve_firmware(host, port, latency, ecg_rate=0.0):
+    async def handle(reader, writer):
+        sent, started = 0, time.monotonic()
+        try:
+            while True:
+                request = await reader.readuntil(b"\r\n\r\n")
+                if latency:
+                    await asyncio.sleep(latency)
+                if request.startswith(b"GET /data"):
+                    payload = firmware_payload()
+                    if ecg_rate:
+                        due = int((time.monotonic() - started) * ecg_rate)
+                        payload["ecgSamples"] = np.round(fake_ecg(sent, due - sent, ecg_rate), 1).tolist()
+                        payload["ecgRate"] = ecg_rate
+                        sent = due
+                    body, status = json.dumps(payload).encode(), b"200 OK"
+                else:
+                    body, status = b"Not found", b"404 Not Found"
+                writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port, backlog=4096)
+
+
+async def serve(args):
+    server = await serve_firmware('127.0.0.1', args.port, args.latency / 1000, args.ecg_rate)
+    print(f"Fake ESP8266 listening on http://127.0.0.1:{args.port}/data")
+    async with server:
+        await server.serve_forever()
+
+
+def run_poll_benchmark(args):
+    from db import migrate
+    from poller import DevicePoller
+    import sqlite3
+    import threading
+
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(serve_firmware('127.0.0.1', args.port, args.latency / 1000))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn)
+    conn.close()
+    ingestor = SensorIngestor(db_path=path)
+    poller = DevicePoller(ingestor=ingestor, max_connections=args.connections)
+    try:
+        for i in range(args.devices):
+            poller.watch(args.first_user + i, f"127.0.0.1:{args.port}", args.rate)
+        start = time.monotonic()
+        time.sleep(args.duration)
+        elapsed = time.monotonic() - start
+        rates = sorted(poller.samples(args.first_user + i) / elapsed for i in range(args.devices))
+        errors = sum(1 for i in range(args.devices) if poller.last_error(args.first_user + i))
+    finally:
+        poller.close()
+        ingestor.close()
+        loop.call_soon_threadsafe(server.close)
+        os.remove(path)
+
+    print(f"{args.devices} boards at {args.rate} Hz for {elapsed:.1f}s: {sum(rates):,.0f} samples/s total, "
+          f"per board min {rates[0]:.2f} / median {rates[len(rates) // 2]:.2f} Hz, "
+          f"{errors} boards erroring, {ingestor.rows_written:,} stored")
+
+
+async def run(args):
+    stats = Stats()
+    deadline = time.monotonic() + args.duration
+    start = time.perf_counter()
+    if args.mode == "http":
+        limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+            await asyncio.gather(*(http_device(client, args.first_user + i, args, stats, deadline)
+                                   for i in range(args.devices)))
+    else:
+        ws_url = args.url.replace("http", "ws", 1) + "/api/ingest/ws"
+        await asyncio.gather(*(ws_device(ws_url, args.first_user + i, args, stats, deadline)
+                               for i in range(args.devices)))
+    return stats, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--mode', choices=['http', 'ws', 'serve', 'poll'], default='http')
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--batch', type=int, default=10, help="readings per request")
+    parser.add_argument('--interval', type=float, default=1.0, help="seconds between batches per device")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--connections', type=int, default=100, help="HTTP connection pool size")
+    parser.add_argument('--first-user', type=int, default=1)
+    parser.add_argument('--port', type=int, default=8080, help="fake board port (serve/poll)")
+    parser.add_argument('--latency', type=float, default=0.0, help="fake board response delay in ms")
+    parser.add_argument('--rate', type=float, default=10.0, help="poll rate per board in Hz (poll)")
+    parser.add_argument('--ecg-rate', type=float, default=0.0, help="high-rate ECG samples per second (serve)")
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        asyncio.run(serve(args))
+        return
+    if args.mode == 'poll':
+        run_poll_benchmark(args)
+        return
+
+    stats, elapsed = asyncio.run(run(args))
+    stats.latencies.sort()
+    p99 = stats.latencies[int(len(stats.latencies) * 0.99)] * 1000 if stats.latencies else float('nan')
+    print(f"{args.devices} devices over {args.mode}: {stats.readings:,} readings in {stats.batches:,} batches, "
+          f"{stats.errors} errors")
+    print(f"{stats.readings / elapsed:,.0f} readings/s   p99 batch latency {p99:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# A local stand-in for the chat model: streams a canned answer as server-sent events after a set
+# time to first token, at a set token rate, so the chat page can be run and measured offline.
+#
+#   python -m benchmarks.fake_model_server --port 8088 --ttft 0.4 --rate 40
+#   CHAT_MODEL_URL=http://127.0.0.1:8088/chat streamlit run app.py
+import argparse
+import asyncio
+import json
+import re
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+ANSWER = ("Your readings look broadly within normal ranges. An average heart rate in the 60-100 bpm band "
+          "is typical at rest, and SpO2 above 95 % suggests good oxygenation. Body temperature around "
+          "36.5-37.5 °C is normal. Keep monitoring regularly, stay hydrated, sleep well, and talk to a "
+          "healthcare provider if you notice chest pain, shortness of breath or persistent changes.")
+
+
+def create_app(ttft=0.4, rate=40.0, tokens_per_chunk=1, answer=ANSWER):
+    app = FastAPI()
+    # Whitespace stays attached to the token after it, so joining the chunks gives the answer back
+    tokens = re.findall(r"\s*\S+", answer)
+
+    @app.post("/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        turns = len(body.get("history", [])) // 2 + 1
+
+        async def events():
+            await asyncio.sleep(ttft)
+            for i in range(0, len(tokens), tokens_per_chunk):
+                text = "".join(tokens[i:i + tokens_per_chunk])
+                if i == 0:
+                    text = f"(Turn {turns}) {text.lstrip()}"
+                yield f"data: {json.dumps({'text': text})}\n\n"
+                await asyncio.sleep(tokens_per_chunk / rate)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8088)
+    parser.add_argument('--ttft', type=float, default=0.4, help="seconds before the first token")
+    parser.add_argument('--rate', type=float, default=40.0, help="tokens per second")
+    parser.add_argument('--tokens-per-chunk', type=int, default=1)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.ttft, args.rate, args.tokens_per_chunk), host='127.0.0.1', port=args.port)
+
+
+if __name__ == "__main__":
+    main()
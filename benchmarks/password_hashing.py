@@ -0,0 +1,66 @@
+# Login cost at each scrypt setting: single-hash latency, logins/s per core, and logins/s with one
+# login thread per core (passwords.HASH_WORKERS). Marks the largest N within a login latency budget,
+# to set passwords.SCRYPT_N and size the login tier (logins/s needed / logins/s per core = cores).
+#
+#   python -m benchmarks.password_hashing --budget-ms 100 --logins 40
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import passwords
+
+
+COSTS = [2 ** k for k in range(12, 18)]
+
+
+def login_latency(stored, logins):
+    times = []
+    for _ in range(logins):
+        start = time.perf_counter()
+        assert passwords.verify_password("correct horse battery staple", stored)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def concurrent_throughput(stored, logins, workers):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda _: passwords.verify_password("correct horse battery staple", stored),
+                                range(logins)))
+        elapsed = time.perf_counter() - start
+    assert all(results)
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget-ms', type=float, default=100.0, help="login latency budget, milliseconds")
+    parser.add_argument('--logins', type=int, default=40, help="logins timed per setting")
+    parser.add_argument('-r', type=int, default=passwords.SCRYPT_R)
+    parser.add_argument('-p', type=int, default=passwords.SCRYPT_P)
+    args = parser.parse_args()
+    workers = passwords.HASH_WORKERS
+
+    legacy = passwords._legacy_hash("correct horse battery staple")
+    legacy_ms = login_latency(legacy, args.logins * 10) * 1000
+    print(f"legacy SHA-256: {legacy_ms:.3f} ms per login (unsalted, no work factor)")
+    print(f"{'N':>8} {'memory':>8} {'latency':>10} {'logins/s/core':>14} {'logins/s (' + str(workers) + ' workers)':>22}")
+    best = None
+    for n in COSTS:
+        stored = passwords.hash_password("correct horse battery staple", n, args.r, args.p)
+        latency = login_latency(stored, args.logins)
+        throughput = concurrent_throughput(stored, args.logins, workers)
+        within = latency * 1000 <= args.budget_ms
+        if within:
+            best = n
+        print(f"{n:>8} {128 * n * args.r / 2 ** 20:>6.0f}MB {latency * 1000:>8.1f}ms {1 / latency:>14.1f} "
+              f"{throughput:>22.1f}" + ("" if within else "  over budget"))
+    if best is None:
+        print(f"No setting fits {args.budget_ms:.0f} ms; lower r or the budget")
+    else:
+        print(f"Largest N within {args.budget_ms:.0f} ms: {best} (passwords.SCRYPT_N is {passwords.SCRYPT_N})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Renders one nightly report per user with report_jobs.nightly_reports on a synthetic database,
+# with one worker and then one per core, and reports reports per minute. The report cache is
+# empty for every run, so each report is fully rendered.
+#
+#   python -m benchmarks.report_throughput --users 24 --rate 0.1
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from db import migrate
+from ingest import utc_timestamp
+from report_jobs import nightly_reports
+from queries import to_utc
+
+
+def build_database(path, users, day, rate_hz):
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn)
+    start = to_utc(datetime.combine(day, datetime.min.time()))
+    step = timedelta(seconds=1 / rate_hz)
+    per_user = int(86400 * rate_hz)
+
+    def generate():
+        for user_id in range(1, users + 1):
+            for i in range(per_user):
+                yield (user_id, random.gauss(75, 8), random.gauss(36.8, 0.4), random.gauss(500, 80),
+                       random.gauss(97, 1.5), utc_timestamp(start + i * step))
+
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO users (id, username, password) VALUES (?, ?, '')",
+                     [(user_id, f"user{user_id}") for user_id in range(1, users + 1)])
+    conn.executemany("INSERT INTO sensor_data (user_id, heart_rate, temperature, ecg, spo2, timestamp) "
+                     "VALUES (?, ?, ?, ?, ?, ?)", generate())
+    conn.execute("COMMIT")
+    conn.close()
+    return per_user
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=24)
+    parser.add_argument('--rate', type=float, default=0.1, help="samples per second per user")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    day = date.today() - timedelta(days=1)
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'bench.db')
+        per_user = build_database(path, args.users, day, args.rate)
+        print(f"{args.users} users, {per_user:,} readings each on {day}")
+
+        for workers in sorted({1, args.workers}):
+            out_dir = tempfile.mkdtemp(dir=directory)
+            cache_dir = tempfile.mkdtemp(dir=directory)
+            start = time.perf_counter()
+            results = nightly_reports(path, day, out_dir, workers, cache_dir)
+            elapsed = time.perf_counter() - start
+            written = sum(1 for p in results.values() if p)
+            print(f"{workers:>3} workers: {written} reports in {elapsed:6.1f}s = {written / elapsed * 60:7.1f} reports/min")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
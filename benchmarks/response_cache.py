@@ -0,0 +1,94 @@
+# Chat answers through response_cache.ResponseCache against an offline stub model (a set time to
+# first token, then chunks at a set rate): a burst of identical questions sent at once, then a mix
+# of common questions asked repeatedly. Reports model calls, hit rate and hit vs miss latency.
+#
+#   python -m benchmarks.response_cache --ttft 0.4 --rate 40 --burst 8 --requests 200
+import argparse
+import random
+import statistics
+import threading
+import time
+
+from benchmarks.fake_model_server import ANSWER
+from response_cache import ResponseCache, response_key
+
+
+QUESTIONS = ["How am I doing?", "Is my heart rate normal?", "How is my SpO2?", "Should I worry about my temperature?",
+             "How can I sleep better?", "What does my trend mean?", "Am I getting enough exercise?", "Is 98 bpm high?"]
+CONTEXT = "- Heart rate (bpm): 24h mean 72.4 (range 58.0-104.0), 7d mean 71.9, trend +0.12/day"
+
+
+class StubModel:
+    # Stands in for the chat model: counts calls and streams ANSWER after `ttft` seconds
+    def __init__(self, ttft, rate, words_per_chunk=4):
+        self.ttft = ttft
+        self.rate = rate
+        self.words_per_chunk = words_per_chunk
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def send_message(self, prompt):
+        with self._lock:
+            self.calls += 1
+        words = ANSWER.split(' ')
+        time.sleep(self.ttft)
+        for i in range(0, len(words), self.words_per_chunk):
+            yield ' '.join(words[i:i + self.words_per_chunk]) + ' '
+            time.sleep(self.words_per_chunk / self.rate)
+
+
+def ask(cache, model, question, timings):
+    key = response_key('stub', question, CONTEXT)
+    cached = cache.get(key) is not None
+    start = time.perf_counter()
+    text = ''.join(cache.stream(key, lambda: model.send_message(question)))
+    timings.append((cached, time.perf_counter() - start, len(text)))
+
+
+def report(name, cache, model, timings, elapsed):
+    hits = [t for cached, t, _ in timings if cached]
+    misses = [t for cached, t, _ in timings if not cached]
+    stats = cache.stats()
+    print(f"{name}: {len(timings)} requests in {elapsed:.2f}s, {model.calls} model calls, "
+          f"{stats['hits']} hits / {stats['coalesced']} joined / {stats['misses']} misses, "
+          f"hit rate {stats['hit_rate']:.0%}")
+    if misses:
+        print(f"{'':>10}miss (or joined) latency: median {statistics.median(misses) * 1000:7.1f} ms")
+    if hits:
+        print(f"{'':>10}hit latency:              median {statistics.median(hits) * 1000:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ttft', type=float, default=0.4, help="stub model's time to first token, seconds")
+    parser.add_argument('--rate', type=float, default=40.0, help="stub model's words per second")
+    parser.add_argument('--burst', type=int, default=8, help="identical questions sent at once")
+    parser.add_argument('--requests', type=int, default=200, help="questions asked one after another")
+    args = parser.parse_args()
+
+    # Identical requests in flight together make one model call and all get the same answer
+    cache, model, timings = ResponseCache(), StubModel(args.ttft, args.rate), []
+    threads = [threading.Thread(target=ask, args=(cache, model, "How am I doing?", timings))
+               for _ in range(args.burst)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    report("burst", cache, model, timings, time.perf_counter() - start)
+    assert len({n for _, _, n in timings}) == 1
+
+    # Common questions repeat, with small differences in case and punctuation
+    random.seed(0)
+    cache, model, timings = ResponseCache(), StubModel(args.ttft, args.rate), []
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        question = random.choice(QUESTIONS)
+        ask(cache, model, random.choice([question, question.lower(), question.rstrip('?') + ' ?']), timings)
+    report("repeated", cache, model, timings, time.perf_counter() - start)
+    print(f"without the cache: {args.requests} model calls, "
+          f"~{args.requests * statistics.median(t for c, t, _ in timings if not c):.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Appending live samples: pd.concat per sample (the old dashboard loop) vs VitalsBuffer.
+#
+#   python -m benchmarks.ring_buffer --samples 20000
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from ringbuffer import VITAL_COLUMNS, VitalsBuffer
+
+
+def samples(n):
+    rng = np.random.default_rng(0)
+    values = rng.normal([75, 36.8, 500, 97], [8, 0.4, 80, 1.5], size=(n, 4))
+    start = datetime.now()
+    return [(*row, start + timedelta(milliseconds=100 * i)) for i, row in enumerate(values)]
+
+
+def with_concat(rows):
+    data = pd.DataFrame([[0.0, 0.0, 0.0, 0.0, datetime.now()]], columns=VITAL_COLUMNS + ["timestamp"])
+    for row in rows:
+        df2 = pd.DataFrame([row], columns=VITAL_COLUMNS + ["timestamp"])
+        data = pd.concat([data, df2], ignore_index=True)
+    return data
+
+
+def with_buffer(rows, capacity):
+    buffer = VitalsBuffer(capacity)
+    for row in rows:
+        buffer.append(*row)
+    return buffer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=20000)
+    parser.add_argument('--capacity', type=int, default=36000)
+    parser.add_argument('--window', type=int, default=600)
+    parser.add_argument('--display', type=int, default=6000, help="samples the dashboard shows (600 s at 10 Hz)")
+    args = parser.parse_args()
+    rows = samples(args.samples)
+
+    start = time.perf_counter()
+    data = with_concat(rows)
+    concat_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    buffer = with_buffer(rows, args.capacity)
+    buffer_time = time.perf_counter() - start
+
+    repeat = 1000
+    start = time.perf_counter()
+    for _ in range(repeat):
+        data["Heart Rate"].iloc[-args.window:].mean()
+    concat_window = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        buffer.column("Heart Rate", args.window).mean()
+    buffer_window = (time.perf_counter() - start) / repeat
+
+    print(f"{args.samples:,} appends: pd.concat {concat_time:.2f}s ({concat_time / args.samples * 1e6:.0f} us/sample), "
+          f"VitalsBuffer {buffer_time:.3f}s ({buffer_time / args.samples * 1e6:.1f} us/sample), "
+          f"{concat_time / buffer_time:.0f}x")
+    print(f"last-{args.window} window mean: DataFrame {concat_window * 1e6:.1f} us, VitalsBuffer {buffer_window * 1e6:.1f} us")
+    # What a dashboard refresh builds for its table and charts: the whole buffer copied, the whole
+    # buffer wrapped without copying, or a copy of just the display window
+    frames = {}
+    for name, build in [("full copy", lambda: buffer.to_frame()),
+                        ("full, no copy", lambda: buffer.to_frame(copy=False)),
+                        (f"last-{args.display} copy", lambda: buffer.to_frame(args.display))]:
+        start = time.perf_counter()
+        for _ in range(100):
+            build()
+        frames[name] = (time.perf_counter() - start) / 100
+    print("to_frame per refresh: " + ", ".join(f"{name} {t * 1e6:.0f} us" for name, t in frames.items()))
+    print(f"memory: DataFrame {data.memory_usage(deep=True).sum() / 1e6:.1f} MB (grows with session), "
+          f"VitalsBuffer {(buffer._values.nbytes + buffer._timestamps.nbytes) / 1e6:.1f} MB (fixed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import os
+import sqlite3
+
+from db import DB_PATH, migrate
+from ingest import utc_timestamp
+
+
+PAGE_SIZE = 40
+# Messages sent back to the model as context; older turns stay in the store but not in the prompt
+HISTORY_MESSAGES = 40
+MODEL_ROLES = {'user': 'user', 'ai': 'model'}
+
+
+# Chats belong to a user; messages are append-only rows keyed by (chat_id, id), so sending a message
+# is one INSERT and opening a chat reads one page off the index, however long the chat is.
+def create_chat_tables(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS chats
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, title TEXT,
+                  created_at TEXT, updated_at TEXT,
+                  FOREIGN KEY (user_id) REFERENCES users(id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS chat_messages
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER,
+                  role TEXT, content TEXT, avatar TEXT, prompt TEXT, created_at TEXT,
+                  FOREIGN KEY (chat_id) REFERENCES chats(id))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chats_user ON chats (user_id, updated_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_chat ON chat_messages (chat_id, id)")
+
+
+# Time to first token and generation speed of each streamed reply (chat_stream.StreamStats)
+def add_response_metrics(c):
+    c.execute("ALTER TABLE chat_messages ADD COLUMN ttft_ms REAL")
+    c.execute("ALTER TABLE chat_messages ADD COLUMN tokens_per_sec REAL")
+
+
+def create_chat(conn, user_id, title):
+    now = utc_timestamp()
+    cursor = conn.execute("INSERT INTO chats (user_id, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                          (user_id, title, now, now))
+    return cursor.lastrowid
+
+
+# Most recently used first
+def list_chats(conn, user_id, limit=50):
+    rows = conn.execute("SELECT id, title FROM chats WHERE user_id = ? ORDER BY updated_at DESC LIMIT ?",
+                        (user_id, limit))
+    return {chat_id: title for chat_id, title in rows}
+
+
+# `prompt` is what was actually sent to the model when it differs from what the user typed
+def add_message(conn, chat_id, role, content, avatar=None, prompt=None, ttft_ms=None, tokens_per_sec=None):
+    now = utc_timestamp()
+    cursor = conn.execute("INSERT INTO chat_messages (chat_id, role, content, avatar, prompt, created_at, "
+                          "ttft_ms, tokens_per_sec) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                          (chat_id, role, content, avatar, prompt, now, ttft_ms, tokens_per_sec))
+    conn.execute("UPDATE chats SET updated_at = ? WHERE id = ?", (now, chat_id))
+    return cursor.lastrowid
+
+
+# Up to `limit` messages before message id `before_id` (default: the newest), oldest first, and
+# whether there are earlier ones still to load
+def fetch_messages(conn, chat_id, before_id=None, limit=PAGE_SIZE):
+    rows = conn.execute("""
+        SELECT id, role, content, avatar, prompt, ttft_ms, tokens_per_sec FROM chat_messages
+        WHERE chat_id = ? AND id < ?
+        ORDER BY id DESC
+        LIMIT ?
+        """, (chat_id, before_id if before_id is not None else 2 ** 63 - 1, limit + 1)).fetchall()
+    messages = [dict(id=row[0], role=row[1], content=row[2], avatar=row[3], prompt=row[4],
+                     ttft_ms=row[5], tokens_per_sec=row[6])
+                for row in reversed(rows[:limit])]
+    return messages, len(rows) > limit
+
+
+# The last HISTORY_MESSAGES turns in the model's format. Earlier turns carry what the user typed,
+# not the prompt as sent: only the current turn needs the health context.
+def model_history(messages, limit=HISTORY_MESSAGES):
+    return [{"role": MODEL_ROLES.get(message['role'], message['role']), "parts": [message['content']]}
+            for message in messages[-limit:]]
+
+
+def delete_chats(c, user_id):
+    c.execute("DELETE FROM chat_messages WHERE chat_id IN (SELECT id FROM chats WHERE user_id = ?)", (user_id,))
+    c.execute("DELETE FROM chats WHERE user_id = ?", (user_id,))
+
+
+# Copies the chats the old page pickled into data/ (shared by everyone) into one user's store
+def import_legacy_chats(conn, user_id, directory='data'):
+    import joblib
+    try:
+        past_chats = joblib.load(os.path.join(directory, 'past_chats_list'))
+    except FileNotFoundError:
+        return 0
+    imported = 0
+    for legacy_id, title in past_chats.items():
+        try:
+            messages = joblib.load(os.path.join(directory, f'{legacy_id}-st_messages'))
+        except FileNotFoundError:
+            continue
+        with conn:
+            chat_id = create_chat(conn, user_id, title)
+            for message in messages:
+                add_message(conn, chat_id, message['role'], message['content'], message.get('avatar'))
+        imported += 1
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import chats saved by the old joblib-based chat page")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--data', default='data', help="directory holding past_chats_list and the message pickles")
+    parser.add_argument('--user', required=True, help="username to give the imported chats to")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrate(conn)
+        row = conn.execute("SELECT id FROM users WHERE username = ?", (args.user,)).fetchone()
+        if row is None:
+            parser.error(f"No user named {args.user}")
+        print(f"Imported {import_legacy_chats(conn, row[0], args.data)} chats for {args.user}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import json
+import re
+import time
+
+import httpx
+
+
+MAX_FPS = 20
+CURSOR = '▌'
+TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+# Rough token count (words and punctuation); the model APIs don't report tokens per chunk
+def count_tokens(text):
+    return len(TOKEN.findall(text))
+
+
+class StreamStats:
+    # Timings of one streamed response. Create it just before sending the request, so time to first
+    # token includes the round trip; tokens/sec is measured from the first token to the last.
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.first_token = None
+        self.finished = None
+        self.tokens = 0
+        self.frames = 0
+
+    @property
+    def ttft_ms(self):
+        return None if self.first_token is None else (self.first_token - self.started) * 1000
+
+    @property
+    def tokens_per_sec(self):
+        if self.first_token is None or self.finished is None or self.finished <= self.first_token:
+            return None
+        return self.tokens / (self.finished - self.first_token)
+
+    def summary(self):
+        if self.first_token is None:
+            return "No response"
+        rate = self.tokens_per_sec
+        return f"First token {self.ttft_ms:.0f} ms · {self.tokens} tokens" + (f" · {rate:.0f} tokens/s" if rate else "")
+
+
+# Gemini raises ValueError for a chunk without text (e.g. one stopped by a safety filter)
+def chunk_text(chunk):
+    if isinstance(chunk, str):
+        return chunk
+    try:
+        return chunk.text
+    except (ValueError, AttributeError):
+        return ''
+
+
+# Shows chunks as they arrive, repainting the placeholder at most `fps` times a second however
+# fast they come (the last frame always shows the full text). Returns the text and its stats.
+def stream_response(placeholder, chunks, stats=None, fps=MAX_FPS):
+    stats = stats or StreamStats()
+    text = ''
+    next_frame = 0.0
+    for chunk in chunks:
+        piece = chunk_text(chunk)
+        if not piece:
+            continue
+        now = stats.clock()
+        if stats.first_token is None:
+            stats.first_token = now
+        text += piece
+        stats.tokens += count_tokens(piece)
+        if now >= next_frame:
+            placeholder.markdown(text + CURSOR)
+            stats.frames += 1
+            next_frame = now + 1 / fps
+    stats.finished = stats.clock()
+    placeholder.markdown(text)
+    stats.frames += 1
+    return text, stats
+
+
+class ModelServerChat:
+    # A chat against an HTTP model server that streams server-sent events ('data: {"text": ...}'
+    # lines, then 'data: [DONE]'), such as benchmarks/fake_model_server.py. Takes the same history
+    # format as the Gemini chat and yields chunks as they arrive.
+    def __init__(self, url, history=None, timeout=60.0):
+        self.url = url
+        self.history = list(history or [])
+        self.timeout = timeout
+
+    def send_message(self, prompt, stream=True):
+        with httpx.stream("POST", self.url, json={"history": self.history, "prompt": prompt},
+                          timeout=self.timeout) as response:
+            response.raise_for_status()
+            reply = ''
+            for line in response.iter_lines():
+                if not line.startswith('data: '):
+                    continue
+                data = line[len('data: '):]
+                if data == '[DONE]':
+                    break
+                text = json.loads(data)["text"]
+                reply += text
+                yield text
+        self.history += [{"role": "user", "parts": [prompt]}, {"role": "model", "parts": [reply]}]
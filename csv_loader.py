@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from ringbuffer import VITAL_COLUMNS
+from stats import Moments, with_percentiles
+
+
+CHUNK_SIZE = 100_000
+MAX_ROWS = 1_000_000
+
+
+class VitalsUpload:
+    def __init__(self, data, stats, rows, stride):
+        self.data = data
+        self.stats = stats
+        self.rows = rows
+        self.stride = stride
+
+    @property
+    def decimated(self):
+        return self.stride > 1
+
+
+# Reads a vitals CSV in chunks: vitals are parsed straight to float32, timestamps are parsed once,
+# and rows with a zero or missing vital or an unparseable timestamp are dropped in the same pass
+# when drop_invalid is set. Moments cover every row, while the returned frame keeps at most max_rows
+# evenly spaced rows (the stride doubles whenever it fills up), so memory stays bounded for any file size.
+def load_vitals_csv(file, drop_invalid=False, skip_rows=0, chunk_size=CHUNK_SIZE, max_rows=MAX_ROWS):
+    header = pd.read_csv(file, nrows=0).columns
+    file.seek(0)
+    columns = [c for c in VITAL_COLUMNS if c in header]
+    has_timestamp = "timestamp" in header
+    usecols = columns + (["timestamp"] if has_timestamp else [])
+
+    stats = Moments.empty(columns)
+    kept = []
+    kept_rows = 0
+    stride = 1
+    rows = 0
+    reader = pd.read_csv(file, usecols=usecols, dtype={c: np.float32 for c in columns},
+                         chunksize=chunk_size, skiprows=range(1, skip_rows + 1))
+    for chunk in reader:
+        values = chunk[columns].to_numpy()
+        if has_timestamp:
+            chunk = chunk.assign(timestamp=pd.to_datetime(chunk["timestamp"], format="ISO8601", errors="coerce"))
+        if drop_invalid:
+            valid = ~(np.isnan(values) | (values == 0)).any(axis=1)
+            if has_timestamp:
+                valid &= chunk["timestamp"].notna().to_numpy()
+            chunk, values = chunk[valid], values[valid]
+        stats = stats.merge(Moments.of(values, columns))
+
+        # Keep rows whose position among the valid rows falls on the current stride
+        positions = rows + np.arange(len(chunk))
+        take = positions % stride == 0
+        rows += len(chunk)
+        kept.append((chunk[take], positions[take]))
+        kept_rows += int(take.sum())
+        while kept_rows > max_rows:
+            stride *= 2
+            kept = [(part[pos % stride == 0], pos[pos % stride == 0]) for part, pos in kept]
+            kept_rows = sum(len(part) for part, _ in kept)
+
+    data = pd.concat([part for part, _ in kept], ignore_index=True) if kept else pd.DataFrame(columns=usecols)
+    # Percentiles come from the kept rows: exact unless the file was decimated, an even sample if it was
+    return VitalsUpload(data, with_percentiles(stats.summary(), data, columns), rows, stride)
@@ -0,0 +1,190 @@
+import argparse
+import sqlite3
+
+
+DB_PATH = 'users.db'
+
+SENSOR_COLUMNS = "id, user_id, heart_rate, temperature, ecg, spo2, timestamp"
+PARTITION_PREFIX = 'sensor_data_p'
+SENSOR_VIEW = 'sensor_data_all'
+
+
+def _create_base_tables(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS users
+                 (id INTEGER PRIMARY KEY, username TEXT UNIQUE, password TEXT)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sensor_data
+                 (id INTEGER PRIMARY KEY, user_id INTEGER,
+                  heart_rate REAL, temperature REAL, ecg REAL, spo2 REAL,
+                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (user_id) REFERENCES users(id))''')
+
+
+# Rebuild with AUTOINCREMENT so row ids are never reused once old rows are moved out,
+# and add a covering (user_id, timestamp) index for the per-user range / latest-N queries.
+def _index_sensor_data(c):
+    c.execute('''CREATE TABLE sensor_data_new
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER,
+                  heart_rate REAL, temperature REAL, ecg REAL, spo2 REAL,
+                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  FOREIGN KEY (user_id) REFERENCES users(id))''')
+    c.execute(f"INSERT INTO sensor_data_new ({SENSOR_COLUMNS}) SELECT {SENSOR_COLUMNS} FROM sensor_data")
+    c.execute("DROP TABLE sensor_data")
+    c.execute("ALTER TABLE sensor_data_new RENAME TO sensor_data")
+    _create_sensor_index(c, 'sensor_data')
+
+
+def _create_sensor_index(c, table):
+    c.execute(f'''CREATE INDEX IF NOT EXISTS idx_{table}_user_ts
+                  ON {table} (user_id, timestamp, heart_rate, temperature, ecg, spo2)''')
+
+
+def _add_rollups(c):
+    from rollups import create_rollup_tables, rebuild_rollups
+    create_rollup_tables(c)
+    rebuild_rollups(c)
+
+
+# (user_id, id) lets readers ask for "rows since the last id I saw" with one index seek
+def _create_cursor_index(c, table):
+    c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_id ON {table} (user_id, id)")
+
+
+def _index_row_ids(c):
+    for table in ['sensor_data'] + partition_tables(c):
+        _create_cursor_index(c, table)
+
+
+def _add_alerts(c):
+    from alerts import create_alerts_table
+    create_alerts_table(c)
+
+
+def _add_chats(c):
+    from chat_store import create_chat_tables
+    create_chat_tables(c)
+
+
+def _add_chat_metrics(c):
+    from chat_store import add_response_metrics
+    add_response_metrics(c)
+
+
+# Each entry upgrades the schema by one version; PRAGMA user_version records how far a file has got.
+MIGRATIONS = [
+    _create_base_tables,
+    _index_sensor_data,
+    _add_rollups,
+    _index_row_ids,
+    _add_alerts,
+    _add_chats,
+    _add_chat_metrics,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    version = schema_version(conn)
+    if version == 0 and conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sensor_data'").fetchone():
+        # Files created before versioning already have the base tables
+        version = 1
+    for target, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        c = conn.cursor()
+        c.execute("BEGIN")
+        try:
+            step(c)
+            c.execute(f"PRAGMA user_version = {target}")
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+        print(f"Migrated database to schema version {target}")
+    if version < SCHEMA_VERSION:
+        conn.execute("ANALYZE")
+    return schema_version(conn)
+
+
+def partition_tables(conn):
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ORDER BY name",
+                        (PARTITION_PREFIX + '%',)).fetchall()
+    return [row[0] for row in rows]
+
+
+def sensor_source(conn):
+    # Table or view that covers all sensor history, whether or not it has been partitioned
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = ?",
+                          (SENSOR_VIEW,)).fetchone()
+    return SENSOR_VIEW if exists else 'sensor_data'
+
+
+def _refresh_sensor_view(c, partitions):
+    c.execute(f"DROP VIEW IF EXISTS {SENSOR_VIEW}")
+    selects = [f"SELECT {SENSOR_COLUMNS} FROM {table}" for table in ['sensor_data'] + partitions]
+    c.execute(f"CREATE VIEW {SENSOR_VIEW} AS " + " UNION ALL ".join(selects))
+
+
+def drop_empty_partitions(c):
+    partitions = partition_tables(c)
+    empty = [table for table in partitions if c.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None]
+    for table in empty:
+        c.execute(f"DROP TABLE {table}")
+    if empty:
+        _refresh_sensor_view(c, [table for table in partitions if table not in empty])
+    return empty
+
+
+# Moves every row from before the current month into per-month tables (sensor_data_pYYYYMM).
+# sensor_data keeps only the hot month, so writers are unchanged; readers go through sensor_source().
+def partition_by_month(conn):
+    c = conn.cursor()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        months = c.execute("""
+            SELECT DISTINCT strftime('%Y%m', timestamp) FROM sensor_data
+            WHERE timestamp < strftime('%Y-%m-01', 'now')
+        """).fetchall()
+        for (month,) in months:
+            table = f"{PARTITION_PREFIX}{month}"
+            c.execute(f"CREATE TABLE IF NOT EXISTS {table} AS SELECT {SENSOR_COLUMNS} FROM sensor_data WHERE 0")
+            c.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_id ON {table} (id)")
+            _create_sensor_index(c, table)
+            _create_cursor_index(c, table)
+            c.execute(f"""INSERT INTO {table} ({SENSOR_COLUMNS})
+                          SELECT {SENSOR_COLUMNS} FROM sensor_data WHERE strftime('%Y%m', timestamp) = ?""",
+                      (month,))
+            c.execute("DELETE FROM sensor_data WHERE strftime('%Y%m', timestamp) = ?", (month,))
+            print(f"Moved sensor data for {month} into {table}")
+        _refresh_sensor_view(c, partition_tables(conn))
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK")
+        raise
+    conn.execute("ANALYZE")
+    return partition_tables(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade a Health Monitor database in place")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--partition', action='store_true',
+                        help="move rows older than the current month into per-month tables")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    try:
+        version = migrate(conn)
+        print(f"{args.db} is at schema version {version}")
+        if args.partition:
+            tables = partition_by_month(conn)
+            print(f"{len(tables)} monthly partitions")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
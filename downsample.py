@@ -0,0 +1,64 @@
+import numpy as np
+
+
+# About two points per horizontal pixel of a full-width chart; more can't be seen anyway
+MAX_CHART_POINTS = 2000
+
+
+# Largest-Triangle-Three-Buckets: keeps the point in each bucket that spans the largest triangle
+# with its neighbours, which preserves the visual shape (peaks included) of the series.
+def lttb_indices(x, y, n_out):
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        area = np.abs((x[previous] - avg_x) * (y[lo:hi] - y[previous])
+                      - (x[previous] - x[lo:hi]) * (avg_y - y[previous]))
+        previous = lo + int(area.argmax())
+        selected[i + 1] = previous
+    return selected
+
+
+# Keeps the minimum and maximum of every bucket, so no spike (e.g. an R peak) is ever dropped
+def minmax_indices(y, n_out):
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    size = -(-n // (n_out // 2))
+    buckets = -(-n // size)  # rounding size up can leave fewer, never empty, buckets
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    lows = offsets + np.nanargmin(padded, axis=1)
+    highs = offsets + np.nanargmax(padded, axis=1)
+    return np.unique(np.concatenate([lows, highs]))
+
+
+def downsample_indices(y, n_out, method='lttb', x=None):
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.flatnonzero(np.isfinite(y))
+    if len(finite) <= n_out:
+        return finite
+    if method == 'minmax':
+        picked = minmax_indices(y[finite], n_out)
+    else:
+        x = finite if x is None else np.asarray(x, dtype=np.float64)[finite]
+        picked = lttb_indices(x, y[finite], n_out)
+    return finite[picked]
+
+
+# Reduces a pandas Series to at most max_points rows before plotting; raw=True skips it
+def for_chart(series, raw=False, max_points=MAX_CHART_POINTS, method='lttb'):
+    if raw or len(series) <= max_points:
+        return series
+    return series.iloc[downsample_indices(series.to_numpy(dtype=np.float64, na_value=np.nan), max_points, method)]
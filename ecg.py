@@ -0,0 +1,208 @@
+import functools
+import math
+from collections import deque
+
+import numpy as np
+from scipy import signal
+from scipy.ndimage import uniform_filter1d
+
+from waveforms import list_sessions
+
+
+ECG_BAND = (0.5, 40.0)  # Hz; below is baseline wander, above is mains and muscle noise
+QRS_WINDOW = 0.15       # seconds of QRS energy integrated per sample
+REFRACTORY = 0.25       # seconds; no two beats closer than this (240 bpm)
+RR_RANGE = (0.3, 2.0)   # seconds; intervals outside it (missed or extra beats) are left out of HRV
+THRESHOLD = 0.3         # a beat's QRS energy is at least this fraction of the typical beat's
+CHUNK_SECONDS = 60      # recordings are analysed this much at a time
+
+
+@functools.lru_cache(maxsize=16)
+def bandpass_sos(rate_hz, band=ECG_BAND, order=2):
+    high = min(band[1], 0.45 * rate_hz)
+    return signal.butter(order, [band[0], high], btype='bandpass', fs=rate_hz, output='sos')
+
+
+def _odd(n):
+    return max(1, int(n) | 1)
+
+
+# Dropouts are stored as NaN; interpolate across them so filters don't spread the NaN
+def _fill_gaps(x):
+    x = np.asarray(x, dtype=np.float64)
+    missing = np.isnan(x)
+    if missing.any():
+        finite = np.flatnonzero(~missing)
+        if not len(finite):
+            return np.zeros_like(x)
+        x = x.copy()
+        x[missing] = np.interp(np.flatnonzero(missing), finite, x[finite])
+    return x
+
+
+# Baseline wander (breathing, electrode movement) is what survives a 200 ms and then a 600 ms
+# moving average, a cheap stand-in for the usual pair of median filters
+def remove_baseline(x, rate_hz):
+    x = _fill_gaps(x)
+    baseline = uniform_filter1d(x, _odd(0.2 * rate_hz), mode='nearest')
+    return x - uniform_filter1d(baseline, _odd(0.6 * rate_hz), mode='nearest')
+
+
+# Zero-phase (forward and backward) band-pass over a whole recording, so R peaks don't move
+def filter_ecg(x, rate_hz):
+    x = remove_baseline(x, rate_hz)
+    if len(x) <= 15:
+        return x
+    return signal.sosfiltfilt(bandpass_sos(float(rate_hz)), x)
+
+
+# Pan-Tompkins style QRS energy: the squared slope, integrated over a QRS-length window
+def qrs_energy(filtered, rate_hz):
+    slope = np.gradient(filtered) if len(filtered) > 1 else np.zeros_like(filtered)
+    return uniform_filter1d(slope * slope, _odd(QRS_WINDOW * rate_hz), mode='nearest')
+
+
+# Moves each energy peak to the largest deflection within half a QRS window of it
+def _refine(filtered, candidates, rate_hz):
+    if not len(candidates):
+        return candidates
+    half = int(QRS_WINDOW * rate_hz / 2)
+    padded = np.pad(np.abs(filtered), half)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * half + 1)[candidates]
+    return np.unique(candidates - half + windows.argmax(axis=1))
+
+
+# Sample indices of R peaks in a filtered signal. level is the typical beat's QRS energy; by
+# default it is taken from the signal itself (its 98th percentile)
+def detect_r_peaks(filtered, rate_hz, level=None, energy=None):
+    if len(filtered) < 3:
+        return np.empty(0, dtype=np.int64)
+    energy = qrs_energy(filtered, rate_hz) if energy is None else energy
+    level = np.percentile(energy, 98) if level is None else level
+    candidates, _ = signal.find_peaks(energy, height=THRESHOLD * level, distance=max(1, int(REFRACTORY * rate_hz)))
+    return _refine(filtered, candidates, rate_hz)
+
+
+def rr_intervals(peaks, rate_hz):
+    return np.diff(np.asarray(peaks, dtype=np.float64)) / rate_hz
+
+
+# Beat-to-beat heart rate in bpm, one value per interval (at the second peak of each)
+def instantaneous_heart_rate(peaks, rate_hz):
+    return 60.0 / rr_intervals(peaks, rate_hz)
+
+
+# Time-domain HRV from RR intervals (seconds). Successive differences only span pairs of
+# plausible intervals, so one missed beat doesn't show up as a huge RMSSD
+def hrv(rr):
+    rr = np.asarray(rr, dtype=np.float64)
+    valid = (rr >= RR_RANGE[0]) & (rr <= RR_RANGE[1])
+    good = rr[valid]
+    result = {"beats": int(valid.sum()), "heart_rate": math.nan, "mean_rr_ms": math.nan,
+              "sdnn_ms": math.nan, "rmssd_ms": math.nan, "pnn50": math.nan}
+    if len(good):
+        result["mean_rr_ms"] = float(good.mean() * 1000)
+        result["heart_rate"] = float(60.0 / good.mean())
+    if len(good) > 1:
+        result["sdnn_ms"] = float(good.std(ddof=1) * 1000)
+    successive = np.diff(rr)[valid[1:] & valid[:-1]]
+    if len(successive):
+        result["rmssd_ms"] = float(np.sqrt(np.mean(successive * successive)) * 1000)
+        result["pnn50"] = float(np.mean(np.abs(successive) > 0.05) * 100)
+    return result
+
+
+# Whole-array pipeline: the filtered signal and its R peaks
+def analyse(samples, rate_hz):
+    filtered = filter_ecg(samples, rate_hz)
+    return filtered, detect_r_peaks(filtered, rate_hz)
+
+
+class ECGProcessor:
+    # The same pipeline over a stream of chunks of any size. Filtering is causal (sosfilt carrying
+    # its state between chunks; the band-pass alone removes baseline wander), the last second of
+    # filtered signal is kept so beats straddling two chunks are found once, and the threshold
+    # follows the QRS energy of recent beats. Peak indices count samples since the first chunk.
+    def __init__(self, rate_hz, history=None):
+        self.rate_hz = float(rate_hz)
+        self._sos = bandpass_sos(self.rate_hz)
+        self._zi = None
+        self._last_value = 0.0
+        self._tail = np.empty(0)
+        self._offset = 0          # stream index of self._tail[0]
+        self._level = None
+        self._level_at = 0        # stream index when the level was last set without a beat
+        self.last_peak = None
+        self.peaks = deque(maxlen=history)
+        self.rr = deque(maxlen=history)
+
+    def _hold_gaps(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        finite = np.isfinite(x)
+        if finite.all():
+            return x
+        # Dropouts hold the last good value
+        index = np.maximum.accumulate(np.where(finite, np.arange(len(x)), -1))
+        return np.where(index >= 0, x[np.maximum(index, 0)], self._last_value)
+
+    # Feeds the next samples and returns the stream indices of R peaks confirmed by them
+    def process(self, chunk):
+        x = self._hold_gaps(chunk)
+        if not len(x):
+            return np.empty(0, dtype=np.int64)
+        self._last_value = x[-1]
+        if self._zi is None:
+            self._zi = signal.sosfilt_zi(self._sos) * x[0]
+        filtered, self._zi = signal.sosfilt(self._sos, x, zi=self._zi)
+
+        window = np.concatenate([self._tail, filtered])
+        end = self._offset + len(window)
+        energy = qrs_energy(window, self.rate_hz)
+        if self._level is None:
+            if end < 2 * self.rate_hz:
+                self._tail = window
+                return np.empty(0, dtype=np.int64)
+            self._level, self._level_at = np.percentile(energy, 98), end
+        elif end - max(self._level_at, self.last_peak or 0) > 3 * self.rate_hz:
+            # No beat for 3 s: the level was probably set by an artefact
+            self._level, self._level_at = self._level / 2, end
+
+        peaks = detect_r_peaks(window, self.rate_hz, self._level, energy)
+        # Peaks near the end may still grow (or be beaten by a larger one) with the next chunk
+        settled = len(window) - int(QRS_WINDOW * self.rate_hz)
+        peaks = peaks[peaks < settled]
+        new = []
+        for peak in peaks:
+            position = self._offset + int(peak)
+            if self.last_peak is None or position - self.last_peak >= REFRACTORY * self.rate_hz:
+                if self.last_peak is not None:
+                    self.rr.append((position - self.last_peak) / self.rate_hz)
+                self.last_peak = position
+                self.peaks.append(position)
+                self._level = 0.875 * self._level + 0.125 * energy[peak]
+                new.append(position)
+
+        keep = min(len(window), int(self.rate_hz))
+        self._offset = end - keep
+        self._tail = window[-keep:]
+        return np.asarray(new, dtype=np.int64)
+
+    def hrv(self, beats=None):
+        rr = list(self.rr)
+        return hrv(rr[-beats:] if beats else rr)
+
+
+# HRV over every recorded session overlapping [start, end), streamed a chunk at a time from the
+# memory-mapped store so a day of recording never has to be in memory at once
+def ecg_summary(user_id, start, end, channel='ecg'):
+    rr = []
+    for session in list_sessions(user_id, channel):
+        first, samples = session.slice(start, end)
+        if len(samples) < 2 * session.rate_hz:
+            continue
+        processor = ECGProcessor(session.rate_hz)
+        step = int(CHUNK_SECONDS * session.rate_hz)
+        for i in range(0, len(samples), step):
+            processor.process(samples[i:i + step])
+        rr.extend(processor.rr)
+    return hrv(rr)
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from alerts import METRIC_LABELS
+from queries import fetch_alerts, latest_id, local_timezone
+from rollups import rollup_table, window_stats
+
+
+WINDOWS = {'24h': timedelta(days=1), '7d': timedelta(days=7), '30d': timedelta(days=30)}
+CONTEXT_METRICS = ['heart_rate', 'spo2', 'temperature']
+TREND_DAYS = 7
+ALERT_DAYS = 7
+MAX_ALERTS = 3
+
+
+# Changes whenever a reading or an alert is stored for the user, for caching the context
+def context_version(conn, user_id):
+    row = conn.execute("SELECT MAX(id) FROM alerts WHERE user_id = ?", (user_id,)).fetchone()
+    return latest_id(conn, user_id), row[0] or 0
+
+
+# Least-squares slope of the daily means over the last `days` days, in units per day
+def daily_trend(conn, user_id, metric, now, days=TREND_DAYS):
+    start = (now - timedelta(days=days)).strftime('%Y-%m-%d')
+    rows = conn.execute(f"""SELECT julianday(bucket), {metric}_sum / {metric}_n FROM {rollup_table('day')}
+                            WHERE user_id = ? AND bucket >= ? AND {metric}_n > 0
+                            ORDER BY bucket""", (user_id, start)).fetchall()
+    if len(rows) < 3:
+        return None
+    days, means = np.array(rows, dtype=np.float64).T
+    return float(np.polyfit(days, means, 1)[0])
+
+
+# Summaries of a user's stored readings: per-window stats for each vital, the recent daily trend
+# and the latest alerts. Everything comes from the rollups (kept up to date as readings are
+# ingested) and the alerts table, so the cost doesn't grow with the amount of history.
+def build_context(conn, user_id, now=None):
+    now = now or datetime.now(timezone.utc)
+    windows = {name: window_stats(conn, user_id, now - span, now) for name, span in WINDOWS.items()}
+    trends = {metric: daily_trend(conn, user_id, metric, now) for metric in CONTEXT_METRICS}
+    # Alerts come back in naive local time; the cutoff is `now` (naive meaning UTC, as in window_stats)
+    # converted the same way
+    tz = local_timezone()
+    cutoff = now - timedelta(days=ALERT_DAYS)
+    cutoff = (cutoff if cutoff.tzinfo else cutoff.replace(tzinfo=timezone.utc)).astimezone(tz).replace(tzinfo=None)
+    alerts = fetch_alerts(conn, user_id, limit=MAX_ALERTS, tz=tz)
+    alerts = alerts[alerts["started_at"] >= cutoff]
+    return {"windows": windows, "trends": trends,
+            "alerts": [f"{a['started_at']:%Y-%m-%d %H:%M} {a['message']}" for a in alerts.to_dict("records")]}
+
+
+# A compact text block for the model: one line per vital, then recent alerts
+def format_context(context):
+    lines = []
+    for metric in CONTEXT_METRICS:
+        label, unit = METRIC_LABELS[metric]
+        parts = []
+        for name, stats in context["windows"].items():
+            s = stats[metric]
+            if not s['count']:
+                continue
+            part = f"{name} mean {s['mean']:.1f}"
+            if name == '24h':
+                part += f" (range {s['min']:.1f}-{s['max']:.1f})"
+            parts.append(part)
+        if not parts:
+            continue
+        trend = context["trends"][metric]
+        if trend is not None:
+            parts.append(f"trend {trend:+.2f}/day")
+        lines.append(f"- {label} ({unit}): " + ", ".join(parts))
+    if not lines:
+        return "No readings stored yet."
+    if context["alerts"]:
+        lines.append("Recent alerts:")
+        lines += [f"- {alert}" for alert in context["alerts"]]
+    return "\n".join(lines)
@@ -0,0 +1,206 @@
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from alerts import VitalsMonitor, open_alerts, reset_alert_ids, store_alert_events
+from pool import configure_connection
+from rollups import update_rollups
+
+
+INSERT_SENSOR_DATA = ("INSERT INTO sensor_data (user_id, heart_rate, temperature, ecg, spo2, timestamp) "
+                      "VALUES (?, ?, ?, ?, ?, ?)")
+
+
+# Same layout as SQLite's CURRENT_TIMESTAMP (UTC), with milliseconds so 10 Hz samples stay ordered.
+# Whole seconds are written without a fraction so they compare equal to CURRENT_TIMESTAMP rows.
+def utc_timestamp(dt=None):
+    dt = dt or datetime.now(timezone.utc)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    dt = dt.replace(microsecond=dt.microsecond // 1000 * 1000)
+    return dt.isoformat(sep=' ', timespec='milliseconds' if dt.microsecond else 'seconds')
+
+
+class _Flush:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class SensorIngestor:
+    # Buffers readings in a bounded queue and writes them from a background thread,
+    # one executemany/commit per batch instead of one connection + fsync per sample.
+    # Each reading also passes through anomaly detection as it is dequeued; the alerts it raises
+    # are stored in the same transaction as the readings that raised them.
+    def __init__(self, db_path='users.db', batch_size=200, flush_interval_ms=500, max_pending=10000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        # Rows queued but not yet taken by the writer, bounded by max_pending. Counted here rather than
+        # by the queue's maxsize so a whole batch can be admitted or refused at once.
+        self._queue = queue.Queue()
+        self._pending = 0
+        self._space = threading.Condition()
+        self._closed = False
+        self.rows_written = 0
+        self.monitor = VitalsMonitor()
+        self._events = []
+        self._event_rows = []   # position in the write buffer of the reading behind each event
+        self._thread = threading.Thread(target=self._run, name="sensor-ingestor", daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id, heart_rate, temperature, ecg, spo2, timestamp=None, timeout=5.0, block=True):
+        # Blocks while the buffer is full (backpressure); raises queue.Full if the writer can't keep up,
+        # straight away with block=False
+        row = (user_id, heart_rate, temperature, ecg, spo2, utc_timestamp(timestamp))
+        self._reserve(1, block, timeout)
+        self._queue.put(row)
+
+    # rows are (user_id, heart_rate, temperature, ecg, spo2, timestamp or None). All of them are
+    # queued or, if there isn't room for all of them in time, none (queue.Full), so a client can retry
+    # a refused batch without storing part of it twice.
+    def submit_many(self, rows, timeout=5.0, block=True):
+        batch = [(user_id, heart_rate, temperature, ecg, spo2, utc_timestamp(timestamp))
+                 for user_id, heart_rate, temperature, ecg, spo2, timestamp in rows]
+        if not batch:
+            return
+        self._reserve(len(batch), block, timeout)
+        self._queue.put(batch)
+
+    def _reserve(self, n, block, timeout):
+        if self._closed:
+            raise RuntimeError("Ingestor is closed")
+        if n > self.max_pending:
+            raise ValueError(f"Batches are limited to {self.max_pending} readings")
+        with self._space:
+            if not self._space.wait_for(lambda: self._pending + n <= self.max_pending, timeout if block else 0):
+                raise queue.Full
+            self._pending += n
+
+    def _release(self, n):
+        with self._space:
+            self._pending -= n
+            self._space.notify_all()
+
+    def flush(self, timeout=None):
+        if self._closed:
+            return True
+        marker = _Flush()
+        self._queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def close(self, timeout=None):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _write(self, conn, buffer):
+        if not buffer:
+            return
+        try:
+            with conn:
+                conn.executemany(INSERT_SENSOR_DATA, buffer)
+                update_rollups(conn, buffer)
+                store_alert_events(conn, self._events)
+            self.rows_written += len(buffer)
+            buffer.clear()
+            self._clear_events()
+        except sqlite3.OperationalError as e:
+            reset_alert_ids(self._events)
+            if "locked" not in str(e) and "busy" not in str(e):
+                print(f"Error saving data, dropping {len(buffer)} rows: {e}")
+                buffer.clear()
+                self._clear_events()
+                return
+            # Keep the rows and retry on the next flush, but never hold more than max_pending of them
+            print(f"Error saving data, will retry: {e}")
+            self._trim(buffer, len(buffer) - self.max_pending)
+        except Exception as e:
+            reset_alert_ids(self._events)
+            print(f"Error saving data, dropping {len(buffer)} rows: {e}")
+            buffer.clear()
+            self._clear_events()
+
+    def _buffer(self, buffer, row):
+        buffer.append(row)
+        observed = len(self._events)
+        try:
+            self.monitor.observe(row, self._events)
+        except Exception as e:
+            print(f"Anomaly detection failed for {row}: {e}")
+        self._event_rows += [len(buffer) - 1] * (len(self._events) - observed)
+
+    def _clear_events(self):
+        self._events.clear()
+        self._event_rows.clear()
+
+    # Drops the oldest `n` buffered rows along with the alerts they opened, so a retry can't store an
+    # alert for readings that were never stored. Ends are kept: they close alerts that were stored
+    # (or, if the start was dropped too, do nothing). Rollups are computed from the buffer, so they
+    # follow the rows by themselves.
+    def _trim(self, buffer, n):
+        if n <= 0:
+            return
+        del buffer[:n]
+        kept = [(row - n, event) for row, event in zip(self._event_rows, self._events)
+                if row >= n or event[0] == 'end']
+        self._events[:] = [event for _, event in kept]
+        self._event_rows[:] = [max(row, 0) for row, _ in kept]
+
+    def _run(self):
+        conn = configure_connection(sqlite3.connect(self.db_path, timeout=30))
+        # Picks up alerts left open by another process or an earlier run, instead of closing them
+        self.monitor.load_open = lambda user_id: open_alerts(conn, user_id)
+        buffer = []
+        deadline = None
+        try:
+            while True:
+                wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=wait)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    self._write(conn, buffer)
+                    break
+                if isinstance(item, _Flush):
+                    self._write(conn, buffer)
+                    item.done.set()
+                elif item is not None:
+                    rows = item if isinstance(item, list) else [item]
+                    self._release(len(rows))
+                    for row in rows:
+                        self._buffer(buffer, row)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                    if len(buffer) < self.batch_size:
+                        continue
+                    self._write(conn, buffer)
+                else:
+                    self._write(conn, buffer)
+
+                deadline = time.monotonic() + self.flush_interval if buffer else None
+        finally:
+            conn.close()
+
+
+_ingestor = None
+_ingestor_lock = threading.Lock()
+
+
+def get_ingestor():
+    global _ingestor
+    with _ingestor_lock:
+        if _ingestor is None:
+            _ingestor = SensorIngestor()
+            atexit.register(_ingestor.close)
+        return _ingestor
@@ -1,9 +1,15 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
 from datetime import datetime, timedelta
 import plotly.express as px
-from utils import menu_with_redirect
+from utils import menu_with_redirect, db_connection
+from archive import archived_days, archived_rows
+from db import sensor_source
+from queries import fetch_alerts, fetch_day, fetch_since
+from downsample import for_chart
+from stats import Moments
+from query_cache import all_data_version, cache_stats, cached_query
+from response_cache import get_response_cache
 
 st.set_page_config(layout="wide")
 menu_with_redirect()
@@ -13,57 +19,46 @@ def is_admin():
     return st.session_state.get('role') == 'admin'
 
 # Function to fetch all users
+@cached_query(version=all_data_version)
 def fetch_all_users():
-    conn = sqlite3.connect('users.db')
     query = "SELECT id, username FROM users"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
-
-def fetch_all_user_data(user_id):
-    conn = sqlite3.connect('users.db')
-    query = """
-    SELECT heart_rate AS 'Heart Rate', temperature AS Temperature, 
-           ecg AS ECG, spo2 AS SpO2, timestamp
-    FROM sensor_data 
-    WHERE user_id = ?
-    ORDER BY timestamp DESC
-    LIMIT 100
-    """
-    print(f"Executing query: {query} with user_id: {user_id}")
-    df = pd.read_sql_query(query, conn, params=(user_id,))
-    print(f"Number of rows returned: {len(df)}")
-    conn.close()
+    with db_connection() as conn:
+        return pd.read_sql_query(query, conn)
+
+# Latest readings per user, kept in the session and topped up with only the rows stored since
+def fetch_all_user_data(user_id, limit=100):
+    latest = st.session_state.setdefault("latest_readings", {})
+    df, cursor = latest.get(user_id, (None, None))
+    with db_connection() as conn:
+        new_rows, cursor = fetch_since(conn, user_id, cursor, limit=limit)
+    if df is not None and not new_rows.empty:
+        df = pd.concat([df, new_rows], ignore_index=True).tail(limit).reset_index(drop=True)
+    elif df is None:
+        df = new_rows
+    latest[user_id] = (df, cursor)
+    print(f"Number of rows returned: {len(new_rows)} new, {len(df)} total")
     return df
 # Function to fetch user data from the database
+@cached_query()
 def fetch_user_data(user_id, date):
-    conn = sqlite3.connect('users.db')
-    query = """
-    SELECT heart_rate AS 'Heart Rate', temperature AS Temperature, 
-           ecg AS ECG, spo2 AS SpO2, timestamp
-    FROM sensor_data 
-    WHERE user_id = ? 
-    AND date(timestamp) = date(?)
-    ORDER BY timestamp
-    """
-    date_str = date.isoformat()
-    print(f"Executing query: {query} with user_id: {user_id} and date: {date_str}")
-    df = pd.read_sql_query(query, conn, params=(user_id, date_str))
-    print(f"Number of rows returned: {len(df)}")
-    conn.close()
+    with db_connection() as conn:
+        df = fetch_day(conn, user_id, date)
+    print(f"Number of rows returned for user {user_id} on {date.isoformat()}: {len(df)}")
     return df
+@cached_query(version=all_data_version)
 def users_with_data():
-    conn = sqlite3.connect('users.db')
-    query = """
-    SELECT DISTINCT users.id, users.username, COUNT(sensor_data.id) as data_count
-    FROM users
-    LEFT JOIN sensor_data ON users.id = sensor_data.user_id
-    GROUP BY users.id
-    ORDER BY data_count DESC
-    """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+    with db_connection() as conn:
+        query = f"""
+        SELECT DISTINCT users.id, users.username, COUNT(sensor_data.id) as data_count
+        FROM users
+        LEFT JOIN {sensor_source(conn)} AS sensor_data ON users.id = sensor_data.user_id
+        GROUP BY users.id
+        ORDER BY data_count DESC
+        """
+        df = pd.read_sql_query(query, conn)
+    # Readings moved to the archive still count
+    df["data_count"] += df["id"].map(archived_rows)
+    return df.sort_values("data_count", ascending=False, ignore_index=True)
 
 # Check if user is admin
 if not is_admin():
@@ -80,6 +75,21 @@ users_data = users_with_data()
 with st.container(border=True):
     st.dataframe(users_data, use_container_width=True)
 
+# Alerts raised by anomaly detection as readings are stored, for every user
+st.subheader("Alerts")
+with db_connection() as conn:
+    open_alerts = fetch_alerts(conn, open_only=True, limit=200)
+    recent_alerts = fetch_alerts(conn, limit=100)
+with st.container(border=True):
+    alert_columns = ["username", "message", "peak", "started_at", "ended_at"]
+    if open_alerts.empty:
+        st.success("No open alerts.")
+    else:
+        st.error(f"{len(open_alerts)} open alerts")
+        st.dataframe(open_alerts[alert_columns[:-1]], use_container_width=True, hide_index=True)
+    with st.expander("Recent alerts"):
+        st.dataframe(recent_alerts[alert_columns], use_container_width=True, hide_index=True)
+
 
 
 # User selection
@@ -96,10 +106,14 @@ if selected_user:
         max_date = datetime.now().date()
         min_date = max_date - timedelta(days=30)
         selected_date = st.date_input("Select date for analysis", max_date, min_value=min_date, max_value=max_date)
+        raw_charts = st.toggle("Show raw data in time series (no downsampling)")
 
     # Fetch data for the selected user and date
         data = fetch_user_data(user_id, selected_date)
 
+        with st.expander("Latest readings"):
+            st.dataframe(fetch_all_user_data(user_id), use_container_width=True)
+
     if not data.empty:
         # Display raw data
         st.subheader("Raw Data")
@@ -107,55 +121,69 @@ if selected_user:
 
         with st.container(border=True):
             st.subheader("Average Values")
-            avg_values = data[["Heart Rate", "Temperature", "ECG", "SpO2"]].mean()
-            st.write(f"Average Heart Rate: {avg_values['Heart Rate']:.2f} bpm")
-            st.write(f"Average Temperature: {avg_values['Temperature']:.2f} °C")
-            st.write(f"Average ECG: {avg_values['ECG']:.2f}")
-            st.write(f"Average SpO2: {avg_values['SpO2']:.2f} %")
+            stats = Moments.of(data).summary()
+            st.write(f"Average Heart Rate: {stats['Heart Rate']['mean']:.2f} bpm")
+            st.write(f"Average Temperature: {stats['Temperature']['mean']:.2f} °C")
+            st.write(f"Average ECG: {stats['ECG']['mean']:.2f}")
+            st.write(f"Average SpO2: {stats['SpO2']['mean']:.2f} %")
 
         with st.container(border=True):
             # Visualizations
             st.subheader("Visualizations")
 
             # Time series plots
-            fig_hr = px.line(data['Heart Rate'], title='Heart Rate over Time')
+            fig_hr = px.line(for_chart(data['Heart Rate'], raw_charts), title='Heart Rate over Time')
             st.plotly_chart(fig_hr, use_container_width=True)
 
-            fig_temp = px.line(data['Temperature'], title='Temperature over Time')
+            fig_temp = px.line(for_chart(data['Temperature'], raw_charts), title='Temperature over Time')
             st.plotly_chart(fig_temp, use_container_width=True)
 
-            fig_ecg = px.line(data['ECG'], title='ECG over Time')
+            fig_ecg = px.line(for_chart(data['ECG'], raw_charts, method='minmax'), title='ECG over Time')
             st.plotly_chart(fig_ecg, use_container_width=True)
 
-            fig_spo2 = px.line(data['SpO2'], title='SpO2 over Time')
+            fig_spo2 = px.line(for_chart(data['SpO2'], raw_charts), title='SpO2 over Time')
             st.plotly_chart(fig_spo2, use_container_width=True)
 
     else:
         st.warning(f"No data available for user {selected_user} on {selected_date}.")
 
         # Additional debug information
-        conn = sqlite3.connect('users.db')
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            source = sensor_source(conn)
 
-        # Check if user has any data at all
-        cursor.execute("SELECT COUNT(*) FROM sensor_data WHERE user_id = ?", (user_id,))
-        total_records = cursor.fetchone()[0]
-        st.write(f"Debug: Total records for this user: {total_records}")
+            # Check if user has any data at all
+            cursor.execute(f"SELECT COUNT(*) FROM {source} WHERE user_id = ?", (user_id,))
+            total_records = cursor.fetchone()[0]
 
-        # Get the date range of data for this user
-        cursor.execute("SELECT MIN(date(timestamp)), MAX(date(timestamp)) FROM sensor_data WHERE user_id = ?",
-                       (user_id,))
-        date_range = cursor.fetchone()
-        st.write(f"Debug: Data available from {date_range[0]} to {date_range[1]}")
+            # Get the date range of data for this user
+            cursor.execute(f"SELECT MIN(date(timestamp)), MAX(date(timestamp)) FROM {source} WHERE user_id = ?",
+                           (user_id,))
+            date_range = cursor.fetchone()
+
+            # Sample some actual data
+            cursor.execute(f"SELECT * FROM {source} WHERE user_id = ? LIMIT 5", (user_id,))
+            sample_data = cursor.fetchall()
 
-        # Sample some actual data
-        cursor.execute("SELECT * FROM sensor_data WHERE user_id = ? LIMIT 5", (user_id,))
-        sample_data = cursor.fetchall()
+        st.write(f"Debug: Total records for this user: {total_records}")
+        st.write(f"Debug: Data available from {date_range[0]} to {date_range[1]}")
+        days = archived_days(user_id)
+        if days:
+            st.write(f"Debug: {archived_rows(user_id)} archived records from {days[0]} to {days[-1]}")
         st.write("Debug: Sample of raw data from database:")
         for row in sample_data:
             st.write(row)
 
-        conn.close()
-
 else:
-    st.info("Please select a user to view their data.")
\ No newline at end of file
+    st.info("Please select a user to view their data.")
+
+with st.expander("Query cache"):
+    st.dataframe(pd.DataFrame.from_dict(cache_stats(), orient="index"), use_container_width=True)
+
+with st.expander("Assistant response cache"):
+    responses = get_response_cache().stats()
+    cols = st.columns(4)
+    cols[0].metric("Hit rate", f"{responses['hit_rate']:.0%}")
+    cols[1].metric("Model calls", responses['misses'])
+    cols[2].metric("Joined in flight", responses['coalesced'])
+    cols[3].metric("Cached answers", f"{responses['entries']} ({responses['bytes'] / 1024:.0f} KB)")
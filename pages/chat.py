@@ -1,57 +1,46 @@
-import time
 import os
-import joblib
 import streamlit as st
-import google.generativeai as genai
 import datetime
 from dotenv import load_dotenv
-from utils import menu_with_redirect
+from utils import menu_with_redirect, db_connection
+from chat_store import add_message, create_chat, fetch_messages, list_chats, model_history
+from chat_stream import ModelServerChat, StreamStats, chunk_text, stream_response
+from health_context import build_context, context_version, format_context
+from query_cache import cached_query
+from response_cache import get_response_cache, response_key
 
 menu_with_redirect()
 
-GOOGLE_API_KEY = st.secrets['GOOGLE_API_KEY']
+# Set CHAT_MODEL_URL to talk to a local model server (e.g. benchmarks/fake_model_server.py) instead of Gemini
+CHAT_MODEL_URL = os.environ.get('CHAT_MODEL_URL')
 
-genai.configure(api_key=GOOGLE_API_KEY)
+if not CHAT_MODEL_URL:
+    import google.generativeai as genai
+    GOOGLE_API_KEY = st.secrets['GOOGLE_API_KEY']
+    genai.configure(api_key=GOOGLE_API_KEY)
 
-new_chat_id = f'{time.time()}'
 MODEL_ROLE = 'ai'
 AI_AVATAR_ICON = '✨'
 
-# Create a data/ folder if it doesn't already exist
-try:
-    os.mkdir('data/')
-except:
-    # data/ folder already exists
-    pass
+user_id = st.session_state.get('user_id')
 
-# Load past chats (if available)
-try:
-    past_chats: dict = joblib.load('data/past_chats_list')
-except:
-    past_chats = {}
+# Past chats are this user's, most recently used first
+with db_connection() as conn:
+    past_chats = list_chats(conn, user_id)
 
 # Sidebar allows a list of past chats
 with st.sidebar:
     st.write('# Past Chats')
-    if st.session_state.get('chat_id') is None:
-        st.session_state.chat_id = st.selectbox(
-            label='Pick a past chat',
-            options=[new_chat_id] + list(past_chats.keys()),
-            format_func=lambda x: past_chats.get(x, 'New Chat'),
-            placeholder='_',
-        )
-    else:
-        # This will happen the first time AI response comes in
-        st.session_state.chat_id = st.selectbox(
-            label='Pick a past chat',
-            options=[new_chat_id, st.session_state.chat_id] + list(past_chats.keys()),
-            index=1,
-            format_func=lambda x: past_chats.get(x, 'New Chat' if x != st.session_state.chat_id else st.session_state.chat_title),
-            placeholder='_',
-        )
-    # Save new chats after a message has been sent to AI
-    # TODO: Give user a chance to name chat
-    st.session_state.chat_title = f'ChatSession-{st.session_state.chat_id}'
+    # None is a new chat; it gets an id once its first message is stored
+    options = [None] + list(past_chats.keys())
+    current = st.session_state.get('chat_id')
+    st.session_state.chat_id = st.selectbox(
+        label='Pick a past chat',
+        options=options,
+        index=options.index(current) if current in options else 0,
+        format_func=lambda x: past_chats.get(x, 'New Chat'),
+        placeholder='_',
+    )
 
 st.markdown(
     """
@@ -85,24 +74,30 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-# Chat history (allows to ask multiple questions)
-try:
-    st.session_state.messages = joblib.load(
-        f'data/{st.session_state.chat_id}-st_messages'
-    )
-    st.session_state.gemini_history = joblib.load(
-        f'data/{st.session_state.chat_id}-gemini_messages'
+# Chat history (allows to ask multiple questions): the newest page is read when a chat is opened
+# and kept in the session; earlier pages are only read when asked for
+loaded = st.session_state.get('chat_messages')
+if loaded is None or loaded['chat_id'] != st.session_state.chat_id:
+    messages, has_more = [], False
+    if st.session_state.chat_id is not None:
+        with db_connection() as conn:
+            messages, has_more = fetch_messages(conn, st.session_state.chat_id)
+    loaded = st.session_state.chat_messages = dict(chat_id=st.session_state.chat_id, messages=messages, has_more=has_more)
+st.session_state.messages = loaded['messages']
+
+if loaded['has_more'] and st.button('Load earlier messages'):
+    with db_connection() as conn:
+        earlier, loaded['has_more'] = fetch_messages(conn, st.session_state.chat_id, loaded['messages'][0]['id'])
+    loaded['messages'][:0] = earlier
+    st.experimental_rerun()
+
+if CHAT_MODEL_URL:
+    st.session_state.chat = ModelServerChat(CHAT_MODEL_URL, history=model_history(st.session_state.messages))
+else:
+    st.session_state.model = genai.GenerativeModel('gemini-pro')
+    st.session_state.chat = st.session_state.model.start_chat(
+        history=model_history(st.session_state.messages),
     )
-    print('old cache')
-except:
-    st.session_state.messages = []
-    st.session_state.gemini_history = []
-    print('new_cache made')
-
-st.session_state.model = genai.GenerativeModel('gemini-pro')
-st.session_state.chat = st.session_state.model.start_chat(
-    history=st.session_state.gemini_history,
-)
 
 # Display chat messages from history on app rerun
 for message in st.session_state.messages:
@@ -111,89 +106,79 @@ for message in st.session_state.messages:
         avatar=message.get('avatar'),
     ):
         st.markdown(message['content'])
+        if message.get('ttft_ms') is not None:
+            st.caption(f"First token {message['ttft_ms']:.0f} ms · {message['tokens_per_sec'] or 0:.0f} tokens/s")
 
-# Get data from session state
-data_df = st.session_state.get("data")
-
-# Prepare data summary for context
-data_summary = f"""
-Heart Rate: {data_df['Heart Rate'].mean():.2f} bpm (average)
-Temperature: {data_df['Temperature'].mean():.2f} °C (average)
-ECG: {data_df['ECG'].mean():.2f} (average)
-SpO2: {data_df['SpO2'].mean():.2f} % (average)
-"""
+# The user's stored history, summarised: cached until a new reading or alert is stored
+@cached_query(version=context_version)
+def health_context_block(user_id):
+    with db_connection() as conn:
+        return format_context(build_context(conn, user_id))
 
-# Prepare the prompt with the data table
+# Prepare the prompt with the health context
+context_block = health_context_block(user_id)
 data_table_prompt = f"""
 Based on your health data:
 
-| Metric      | Average Value |
-|-------------|---------------|
-| Heart Rate  | {data_df['Heart Rate'].mean():.2f} bpm  |
-| Temperature | {data_df['Temperature'].mean():.2f} °C  |
-| ECG         | {data_df['ECG'].mean():.2f}        |
-| SpO2        | {data_df['SpO2'].mean():.2f} %    |
+{context_block}
 
 How can I assist you further?
 """
 
 # React to user input
 if prompt := st.chat_input('Your message here...'):
-    # Save this as a chat for later
-    if st.session_state.chat_id not in past_chats.keys():
-        past_chats[st.session_state.chat_id] = st.session_state.chat_title
-        joblib.dump(past_chats, 'data/past_chats_list')
+    ## Send message to AI
+    full_prompt = f"{data_table_prompt}\n\nUser query: {prompt}"
+    # The same question against the same health summary and conversation gets the same answer
+    key = response_key(CHAT_MODEL_URL or 'gemini-pro', prompt, context_block, model_history(st.session_state.messages))
+    # Save this as a chat for later, named after its first message; only the new message is written
+    with db_connection() as conn:
+        if st.session_state.chat_id is None:
+            st.session_state.chat_id = create_chat(conn, user_id, prompt[:40])
+            st.session_state.chat_messages['chat_id'] = st.session_state.chat_id
+        message_id = add_message(conn, st.session_state.chat_id, 'user', prompt, prompt=full_prompt)
     # Display user message in chat message container
     with st.chat_message('user'):
         st.markdown(prompt)
     # Add user message to chat history
     st.session_state.messages.append(
         dict(
+            id=message_id,
             role='user',
             content=prompt,
+            prompt=full_prompt,
         )
     )
-    ## Send message to AI
-    full_prompt = f"{data_table_prompt}\n\nUser query: {prompt}"
-    response = st.session_state.chat.send_message(
-        full_prompt,
-        stream=True,
+    cache = get_response_cache()
+    cached = cache.get(key) is not None
+    stats = StreamStats()
+    # Answered from the cache, or by joining an identical request already in flight; the model
+    # is only called when neither has it
+    response = cache.stream(
+        key,
+        lambda: (chunk_text(c) for c in st.session_state.chat.send_message(full_prompt, stream=True)),
     )
     # Display assistant response in chat message container
     with st.chat_message(
         name=MODEL_ROLE,
         avatar=AI_AVATAR_ICON,
     ):
-        message_placeholder = st.empty()
-        full_response = ''
-        assistant_response = response
-        # Streams in a chunk at a time
-        for chunk in response:
-            # Simulate stream of chunk
-            # TODO: Chunk missing `text` if API stops mid-stream ("safety"?)
-            for ch in chunk.text.split(' '):
-                full_response += ch + ' '
-                time.sleep(0.05)
-                # Rewrites with a cursor at end
-                message_placeholder.write(full_response + '▌')
-        # Write full message with placeholder
-        message_placeholder.write(full_response)
+        # Chunks are shown as they arrive, repainted at most MAX_FPS times a second
+        content, stats = stream_response(st.empty(), response, stats)
+        st.caption('Cached answer' if cached else stats.summary())
+    ttft_ms, tokens_per_sec = (None, None) if cached else (stats.ttft_ms, stats.tokens_per_sec)
 
     # Add assistant response to chat history
+    with db_connection() as conn:
+        message_id = add_message(conn, st.session_state.chat_id, MODEL_ROLE, content, AI_AVATAR_ICON,
+                                 ttft_ms=ttft_ms, tokens_per_sec=tokens_per_sec)
     st.session_state.messages.append(
         dict(
+            id=message_id,
             role=MODEL_ROLE,
-            content=st.session_state.chat.history[-1].parts[0].text,
+            content=content,
             avatar=AI_AVATAR_ICON,
+            ttft_ms=ttft_ms,
+            tokens_per_sec=tokens_per_sec,
         )
     )
-    st.session_state.gemini_history = st.session_state.chat.history
-    # Save to file
-    joblib.dump(
-        st.session_state.messages,
-        f'data/{st.session_state.chat_id}-st_messages',
-    )
-    joblib.dump(
-        st.session_state.gemini_history,
-        f'data/{st.session_state.chat_id}-gemini_messages',
-    )
@@ -3,6 +3,12 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objs as go
 from utils import menu_with_redirect
+from downsample import for_chart
+from csv_loader import load_vitals_csv
+from datetime import timedelta
+from queries import local_timezone
+from waveforms import list_sessions
+from ecg import analyse, hrv, rr_intervals
 st.set_page_config(layout="wide")
 menu_with_redirect()
 
@@ -36,8 +42,11 @@ st.markdown(
 uploaded_file = st.file_uploader("Upload your CSV file", type=["csv"])
 
 if uploaded_file is not None:
-    data = pd.read_csv(uploaded_file)
-    data = data.drop(data.index[0])
+    # First row is the dashboard's zero placeholder
+    upload = load_vitals_csv(uploaded_file, skip_rows=1)
+    data = upload.data
+    if upload.decimated:
+        st.info(f"{upload.rows:,} rows uploaded; showing every {upload.stride}th row to keep memory bounded.")
     with st.popover("View Data", use_container_width=True):
         st.dataframe(data, use_container_width=True)
     with st.sidebar:
@@ -50,16 +59,20 @@ if uploaded_file is not None:
             violin_plots = st.checkbox("Violin Plots", True)
             heatmap = st.checkbox("Heatmap", True)
             ecg_signal = st.checkbox("ECG Signal", True)
+            raw_charts = st.checkbox("Raw data in line charts (no downsampling)", False)
 
     if time_series:
         st.write("### Time Series Data")
-        fig_hr = px.line(data, x=data.index, y="Heart Rate", title='Heart Rate over Time')
+        hr = for_chart(data["Heart Rate"], raw_charts).to_frame()
+        fig_hr = px.line(hr, x=hr.index, y="Heart Rate", title='Heart Rate over Time')
         st.plotly_chart(fig_hr, use_container_width=True)
 
-        fig_temp = px.line(data, x=data.index, y="Temperature", title='Temperature over Time')
+        temp = for_chart(data["Temperature"], raw_charts).to_frame()
+        fig_temp = px.line(temp, x=temp.index, y="Temperature", title='Temperature over Time')
         st.plotly_chart(fig_temp, use_container_width=True)
 
-        fig_spo2 = px.line(data, x=data.index, y="SpO2", title='SpO2 over Time')
+        spo2 = for_chart(data["SpO2"], raw_charts).to_frame()
+        fig_spo2 = px.line(spo2, x=spo2.index, y="SpO2", title='SpO2 over Time')
         st.plotly_chart(fig_spo2, use_container_width=True)
 
     if histograms:
@@ -92,7 +105,7 @@ if uploaded_file is not None:
 
     if heatmap:
         st.write("### Correlation Heatmap")
-        correlation = data.corr()
+        correlation = data.select_dtypes("number").corr()
         fig_heatmap = go.Figure(data=go.Heatmap(
             z=correlation.values,
             x=correlation.columns,
@@ -104,6 +117,37 @@ if uploaded_file is not None:
 
     if ecg_signal:
         st.write("### ECG Signal")
-        fig_ecg = px.line(data, x=data.index, y="ECG", title='ECG Signal over Time')
+        ecg = for_chart(data["ECG"], raw_charts, method='minmax').to_frame()
+        fig_ecg = px.line(ecg, x=ecg.index, y="ECG", title='ECG Signal over Time')
         st.plotly_chart(fig_ecg, use_container_width=True)
 
+
+# Full-rate ECG recorded by the boards, read straight from the memory-mapped waveform store
+sessions = list_sessions(st.session_state["user_id"]) if "user_id" in st.session_state else []
+if sessions:
+    st.write("### High-rate ECG")
+    tz = local_timezone()
+    session = st.selectbox("Recording", sessions[::-1],
+                           format_func=lambda s: f"{s.start.astimezone(tz):%Y-%m-%d %H:%M:%S} "
+                                                 f"({len(s) / s.rate_hz:.0f}s at {s.rate_hz:g} Hz)")
+    length = len(session) / session.rate_hz
+    col1, col2 = st.columns(2)
+    window = col1.number_input("Window (seconds)", min_value=1.0, max_value=max(1.0, length), value=min(10.0, max(1.0, length)))
+    offset = col2.slider("Start (seconds into the recording)", 0.0, length - window, 0.0) if length > window else 0.0
+    start = session.start + timedelta(seconds=offset)
+    series = session.to_series(start, start + timedelta(seconds=window))
+    series.index = series.index.tz_localize('UTC').tz_convert(tz).tz_localize(None)
+    filtered, peaks = analyse(series.to_numpy(), session.rate_hz)
+    beats = hrv(rr_intervals(peaks, session.rate_hz))
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Heart rate (ECG)", f"{beats['heart_rate']:.0f} bpm")
+    col2.metric("Beats", len(peaks))
+    col3.metric("SDNN", f"{beats['sdnn_ms']:.0f} ms")
+    col4.metric("RMSSD", f"{beats['rmssd_ms']:.0f} ms")
+    show_filtered = st.checkbox("Filtered (0.5-40 Hz, baseline removed)", False)
+    if show_filtered:
+        series = pd.Series(filtered, index=series.index)
+    waveform = for_chart(series.rename("ECG"), method='minmax').to_frame()
+    fig_waveform = px.line(waveform, y="ECG", title=f'ECG at {session.rate_hz:g} Hz')
+    fig_waveform.add_scatter(x=series.index[peaks], y=series.to_numpy()[peaks], mode='markers', name='R peaks')
+    st.plotly_chart(fig_waveform, use_container_width=True)
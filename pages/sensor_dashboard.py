@@ -4,40 +4,88 @@ import numpy as np
 import serial
 from serial.tools import list_ports
 from PIL import Image
-from utils import menu_with_redirect
+from utils import menu_with_redirect, db_connection
 import time
 import streamviz
-import sqlite3
 from datetime import datetime
-import requests
 import altair as alt
+from ingest import get_ingestor
+from poller import DevicePoller
+from queries import fetch_alerts, fetch_since, to_local
+from ringbuffer import VitalsBuffer
+from ecg import ECGProcessor
+from waveforms import list_sessions
 
 
 ESP_IP_DEFAULT = "192.168.1.11"
+SAMPLE_RATE_DEFAULT = 10.0
+SAMPLE_RATE_MAX = 50.0
+RETENTION_SECONDS = 3600
+# The table and charts start from the latest samples only; the buffer keeps the rest for saving
+DISPLAY_SECONDS = 600
+UI_REFRESH_SECONDS = 0.25
+DEVICE_TIMEOUT = 5.0
+# How long Stop and the end of a reading wait for buffered readings to reach the database
+FLUSH_TIMEOUT = 5.0
+ECG_BACKFILL_SECONDS = 60
+ECG_HRV_BEATS = 60
 
 
 st.set_page_config(layout="wide")
 
 
-def store_sensor_data(user_id, heart_rate, temperature, ecg, spo2):
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO sensor_data (user_id, heart_rate, temperature, ecg, spo2) VALUES (?, ?, ?, ?, ?)",
-                  (user_id, heart_rate, temperature, ecg, spo2))
-        conn.commit()
-        print(f"Data saved for user {user_id}: HR={heart_rate}, Temp={temperature}, ECG={ecg}, SpO2={spo2}")
-    except Exception as e:
-        print(f"Error saving data: {e}")
-    finally:
-        conn.close()
-
-def load_user_data(user_id):
-    conn = sqlite3.connect('users.db')
-    query = "SELECT heart_rate AS 'Heart Rate', temperature AS Temperature, ecg AS ECG, spo2 AS SpO2, timestamp FROM sensor_data WHERE user_id = ? ORDER BY timestamp DESC LIMIT 100"
-    df = pd.read_sql_query(query, conn, params=(user_id,))
-    conn.close()
-    return df
+# The poller stores every reading itself; the page only drains what arrived since the last refresh
+@st.cache_resource(show_spinner=False)
+def get_poller():
+    return DevicePoller()
+
+# Waits for the ingestor to write what it holds; warns instead of hanging if its writer has stalled or died
+def flush_readings():
+    if not get_ingestor().flush(timeout=FLUSH_TIMEOUT):
+        st.warning(f"Readings are still being saved after {FLUSH_TIMEOUT:.0f} seconds; "
+                   "the newest ones may not show until they are.", icon="⚠️")
+
+# Rows stored after `cursor` (at most `limit`, newest kept) and the cursor to use next time
+def load_user_data(user_id, cursor=None, limit=100):
+    with db_connection() as conn:
+        return fetch_since(conn, user_id, cursor, limit=limit)
+
+# Beat detection over the newest full-rate ECG recording, fed only the samples stored since the last
+# refresh (a new recording starts from its last minute). None if the user has no recordings.
+def ecg_metrics(user_id):
+    sessions = list_sessions(user_id)
+    if not sessions:
+        return None
+    session = sessions[-1]
+    state = st.session_state.get("ecg")
+    if state is None or state[0] != session.directory:
+        state = (session.directory, ECGProcessor(session.rate_hz, history=ECG_HRV_BEATS),
+                 max(0, len(session) - int(ECG_BACKFILL_SECONDS * session.rate_hz)))
+    directory, processor, position = state
+    processor.process(session.samples[position:])
+    st.session_state["ecg"] = (directory, processor, len(session))
+    return processor.hrv()
+
+# Open alerts as banners, plus a toast for each alert raised since the last check
+def show_alerts(placeholder, user_id):
+    with db_connection() as conn:
+        new = fetch_alerts(conn, user_id, after_id=st.session_state.get("alert_cursor", 0))
+        active = fetch_alerts(conn, user_id, open_only=True)
+    if not new.empty:
+        if "alert_cursor" in st.session_state:
+            for message in new["message"]:
+                st.toast(message, icon="🚨")
+        st.session_state["alert_cursor"] = int(new["id"].max())
+    with placeholder.container():
+        for alert in active.to_dict("records"):
+            st.error(f"{alert['message']} since {alert['started_at']:%H:%M:%S}", icon="🚨")
+
+def show_ecg_metrics(placeholder, metrics):
+    with placeholder.container(border=True):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Heart rate (ECG)", f"{metrics['heart_rate']:.0f} bpm")
+        col2.metric("SDNN", f"{metrics['sdnn_ms']:.0f} ms")
+        col3.metric("RMSSD", f"{metrics['rmssd_ms']:.0f} ms")
 
 def sensor_dashboard():
     if "user_id" not in st.session_state:
@@ -47,18 +95,30 @@ def sensor_dashboard():
     user_id = st.session_state.user_id
 
     if "data" not in st.session_state:
-        st.session_state["data"] = load_user_data(user_id)
+        st.session_state["data"] = VitalsBuffer.for_retention(RETENTION_SECONDS, SAMPLE_RATE_DEFAULT)
+        rows, st.session_state["cursor"] = load_user_data(user_id)
+        st.session_state["data"].extend(rows)
         if st.session_state["data"].empty:
-            st.session_state["data"] = pd.DataFrame([[0.0, 0.0, 0.0, 0.0, datetime.now()]],
-                                                    columns=["Heart Rate", "Temperature", "ECG", "SpO2", "timestamp"])
+            st.session_state["data"].append(0.0, 0.0, 0.0, 0.0, datetime.now())
+    else:
+        # Pick up readings stored elsewhere (e.g. pushed to the API) since the last run
+        rows, st.session_state["cursor"] = load_user_data(user_id, st.session_state["cursor"],
+                                                          st.session_state["data"].capacity)
+        st.session_state["data"].extend(rows)
 
     st.session_state["start"] = False
     st.session_state["timer"] = 30
 
+    alerts_placeholder = st.empty()
+    show_alerts(alerts_placeholder, user_id)
+
     with st.sidebar:
         with st.container(border=True):
             ESP_IP = st.text_input("Enter ESP IP Address", ESP_IP_DEFAULT)
             time_duration = st.number_input("Set Timer", min_value=10, max_value=300, step=1, placeholder=30)
+            sample_rate = st.number_input("Sample Rate (Hz)", min_value=1.0, max_value=SAMPLE_RATE_MAX, value=SAMPLE_RATE_DEFAULT, step=1.0)
+            # Hold RETENTION_SECONDS at the chosen rate; the buffer only grows, keeping what it has
+            st.session_state["data"].resize(int(RETENTION_SECONDS * sample_rate))
             try:
                 st.success("Arduino connected")
             except Exception as e:
@@ -72,6 +132,7 @@ def sensor_dashboard():
 
             if st.button('Stop', type="secondary", use_container_width=True):
                 st.session_state["start"] = False
+                flush_readings()
                 st.toast("Arduino stopped")
 
 
@@ -79,14 +140,15 @@ def sensor_dashboard():
 
 
             with st.popover("Save Data", use_container_width=True):
-                st.session_state["data"].to_csv('sensor_data.csv', index=False)
+                # Written out straight away, so the buffer needn't be copied first
+                st.session_state["data"].to_frame(copy=False).to_csv('sensor_data.csv', index=False)
                 st.success("Data saved to sensor_data.csv")
                 with open('sensor_data.csv', 'rb') as file:
                     st.download_button(label="Download CSV", data=file, file_name='sensor_data.csv', mime='text/csv')
 
             if st.button('Clear Data', use_container_width=True):
-                st.session_state["data"] = pd.DataFrame([[0.0, 0.0, 0.0, 0.0, datetime.now()]],
-                                                        columns=["Heart Rate", "Temperature", "ECG", "SpO2", "timestamp"])
+                st.session_state["data"].clear()
+                st.session_state["data"].append(0.0, 0.0, 0.0, 0.0, datetime.now())
                 st.toast("Data cleared")
 
     st.markdown(
@@ -136,58 +198,75 @@ def sensor_dashboard():
         with col2:
             with st.container():
                 with st.expander("Data Table", expanded=True):
-                    df = st.session_state["data"]
+                    # Only this window is copied, not the whole retention period
+                    df = st.session_state["data"].to_frame(int(DISPLAY_SECONDS * sample_rate))
                     dataframe_widget = st.dataframe(df[["Heart Rate", "Temperature", "ECG", "SpO2", "timestamp"]],
                                                     use_container_width=True, hide_index=True)
 
+    ecg_placeholder = st.empty()
+    metrics = ecg_metrics(user_id)
+    if metrics is not None:
+        show_ecg_metrics(ecg_placeholder, metrics)
+
     col3, col4 = st.columns(2)
 
+    with st.expander("Recent alerts"):
+        with db_connection() as conn:
+            recent = fetch_alerts(conn, user_id, limit=20)
+        st.dataframe(recent[["started_at", "ended_at", "message", "peak"]], use_container_width=True, hide_index=True)
+
     col3, col4 = st.columns(2)
 
     with col3:
         with st.container(border=True):
-            line_chart_hr = st.line_chart(st.session_state["data"]["Heart Rate"], y="Heart Rate", color="#FF5733")
+            line_chart_hr = st.line_chart(df["Heart Rate"], y="Heart Rate", color="#FF5733")
         with st.container(border=True):
-            line_chart_temp = st.line_chart(st.session_state["data"]["Temperature"], y="Temperature", color="#33FF57")
+            line_chart_temp = st.line_chart(df["Temperature"], y="Temperature", color="#33FF57")
     with col4:
         with st.container(border=True):
-            line_chart_ecg = st.line_chart(st.session_state["data"]["ECG"], y="ECG", color="#3357FF")
+            line_chart_ecg = st.line_chart(df["ECG"], y="ECG", color="#3357FF")
         with st.container(border=True):
-            line_chart_spo2 = st.line_chart(st.session_state["data"]["SpO2"], y="SpO2", color="#FF33F1")
+            line_chart_spo2 = st.line_chart(df["SpO2"], y="SpO2", color="#FF33F1")
 
     if st.session_state["start"]:
-        while st.session_state["timer"] > 0:
-            try:
-                response = requests.get(f"http://{ESP_IP}/data")
-
-                if response.status_code == 200:
-                    df_data = response.json()
-                    heart_rate = float(df_data["heartRate"])
-                    temperature = float(df_data["temperature"])
-                    ecg = float(df_data["ecg"])
-                    spo2 = float(df_data["spo2"])
-                    current_time = datetime.now()
-                    df2 = pd.DataFrame([[heart_rate, temperature, ecg, spo2, current_time]],
-                                       columns=["Heart Rate", "Temperature", "ECG", "SpO2", "timestamp"])
-                    st.session_state["data"] = pd.concat([st.session_state["data"], df2], ignore_index=True)
+        poller = get_poller()
+        poller.watch(user_id, ESP_IP, sample_rate)
+        end_time = time.monotonic() + st.session_state["timer"]
+        last_reading = time.monotonic()
+        try:
+            while st.session_state["timer"] > 0:
+                readings = poller.drain(user_id)
+                if readings:
+                    last_reading = time.monotonic()
+                    # Shown straight away; the buffer gets them from the database with everything else
+                    df2 = to_local(pd.DataFrame(readings, columns=["Heart Rate", "Temperature", "ECG", "SpO2", "timestamp"]))
                     dataframe_widget.add_rows(df2)
                     line_chart_hr.add_rows(df2["Heart Rate"])
                     line_chart_temp.add_rows(df2["Temperature"])
                     line_chart_ecg.add_rows(df2["ECG"])
                     line_chart_spo2.add_rows(df2["SpO2"])
-
-                    store_sensor_data(user_id, heart_rate, temperature, ecg, spo2)
-
-
-                    st.session_state["timer"] -= 0.5
-                    with timer:
-                        st.write(f"Time remaining: {st.session_state['timer']} seconds")
-                    time.sleep(0.1)
-
-            except Exception as e:
-                st.error(f"Error reading data from Arduino: {str(e)}")
-                break
-
+                    metrics = ecg_metrics(user_id)
+                    if metrics is not None:
+                        show_ecg_metrics(ecg_placeholder, metrics)
+                    show_alerts(alerts_placeholder, user_id)
+                elif poller.last_error(user_id) and time.monotonic() - last_reading > DEVICE_TIMEOUT:
+                    st.error(f"Error reading data from Arduino: {poller.last_error(user_id)}")
+                    break
+
+                # Count down in wall-clock time, however long each refresh took
+                st.session_state["timer"] = max(0.0, end_time - time.monotonic())
+                with timer:
+                    st.write(f"Time remaining: {st.session_state['timer']:.0f} seconds")
+                time.sleep(UI_REFRESH_SECONDS)
+        finally:
+            poller.unwatch(user_id)
+            # Make sure everything read this session is on disk, then bring the buffer up to date from
+            # the cursor. That is its only source, so readings polled here and readings pushed to the API
+            # meanwhile all arrive once, in order.
+            flush_readings()
+            rows, st.session_state["cursor"] = load_user_data(user_id, st.session_state["cursor"],
+                                                              st.session_state["data"].capacity)
+            st.session_state["data"].extend(rows)
 
         st.session_state["start"] = False
         st.toast("Sensor reading completed")
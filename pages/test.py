@@ -2,26 +2,21 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objs as go
-from utils import menu_with_redirect
-import sqlite3
+from utils import menu_with_redirect, db_connection
+from queries import fetch_day
+from downsample import for_chart
+from stats import Moments
+from query_cache import cached_query
 from datetime import datetime, timedelta
 
 st.set_page_config(layout="wide")
 menu_with_redirect()
 
 # Function to fetch user data from the database
+@cached_query()
 def fetch_user_data(user_id, date):
-    conn = sqlite3.connect('users.db')
-    query = """
-    SELECT heart_rate AS 'Heart Rate', temperature AS Temperature, 
-           ecg AS ECG, spo2 AS SpO2, timestamp
-    FROM sensor_data 
-    WHERE user_id = ? AND date(timestamp) = ?
-    ORDER BY timestamp
-    """
-    df = pd.read_sql_query(query, conn, params=(user_id, date))
-    conn.close()
-    return df
+    with db_connection() as conn:
+        return fetch_day(conn, user_id, date)
 
 # Check if user is logged in
 if "user_id" not in st.session_state:
@@ -90,16 +85,18 @@ st.markdown(
 max_date = datetime.now().date()
 min_date = max_date - timedelta(days=30)  # Allow selection up to 30 days in the past
 selected_date = st.date_input("Select date for analysis", max_date, min_value=min_date, max_value=max_date)
+raw_charts = st.toggle("Show raw data in time series (no downsampling)")
 
 # Fetch data for the selected date
 data = fetch_user_data(st.session_state.user_id, selected_date)
 
 if not data.empty:
     # Calculate average values
-    avg_heart_rate = data['Heart Rate'].mean()
-    avg_temperature = data['Temperature'].mean()
-    avg_ecg = data['ECG'].mean()
-    avg_spo2 = data['SpO2'].mean()
+    stats = Moments.of(data).summary()
+    avg_heart_rate = stats['Heart Rate']['mean']
+    avg_temperature = stats['Temperature']['mean']
+    avg_ecg = stats['ECG']['mean']
+    avg_spo2 = stats['SpO2']['mean']
 
     # Average value boxes
     st.markdown(
@@ -129,16 +126,16 @@ if not data.empty:
     # Plotly visualizations
 
     # 1. Line chart for Heart Rate
-    fig_hr = px.line(data["Heart Rate"], title='Heart Rate over Time', color_discrete_sequence=['#FF5733'])
+    fig_hr = px.line(for_chart(data["Heart Rate"], raw_charts), title='Heart Rate over Time', color_discrete_sequence=['#FF5733'])
 
     # 2. Line chart for Temperature
-    fig_temp = px.line(data['Temperature'], title='Temperature over Time', color_discrete_sequence=['#33CFFF'])
+    fig_temp = px.line(for_chart(data['Temperature'], raw_charts), title='Temperature over Time', color_discrete_sequence=['#33CFFF'])
 
     # 3. Line chart for ECG
-    fig_ecg = px.line(data['ECG'], title='ECG over Time', color_discrete_sequence=['#33FF57'])
+    fig_ecg = px.line(for_chart(data['ECG'], raw_charts, method='minmax'), title='ECG over Time', color_discrete_sequence=['#33FF57'])
 
     # 4. Line chart for SpO2
-    fig_spo2 = px.line(data['SpO2'], title='SpO2 over Time', color_discrete_sequence=['#FF33A1'])
+    fig_spo2 = px.line(for_chart(data['SpO2'], raw_charts), title='SpO2 over Time', color_discrete_sequence=['#FF33A1'])
 
     # 5. Correlation heatmap
     corr = data[["Heart Rate", "Temperature", "ECG", "SpO2"]].corr()
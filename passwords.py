@@ -0,0 +1,97 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+
+
+# scrypt cost: N (CPU/memory), r (block size), p (parallelism). Memory per hash is 128 * N * r
+# bytes (16 MB here). Pick N with `python -m benchmarks.password_hashing --budget-ms 100`; stored
+# hashes carry their own parameters, so raising it upgrades each user at their next login.
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+KEY_BYTES = 32
+# Each hash holds its memory until done, so concurrent hashing is capped at one per core
+HASH_WORKERS = os.cpu_count() or 1
+_hash_slots = threading.BoundedSemaphore(HASH_WORKERS)
+
+SCHEME = 'scrypt'
+
+
+def _b64(data):
+    return base64.b64encode(data).decode().rstrip('=')
+
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+# hashlib.scrypt releases the GIL, so a login hashing on one Streamlit script thread doesn't hold up
+# other sessions or the API; beyond HASH_WORKERS at once, callers wait for a slot
+def _scrypt(password, salt, n, r, p):
+    with _hash_slots:
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=KEY_BYTES,
+                              maxmem=256 * n * r * p + 2 ** 20)
+
+
+# 'scrypt$N$r$p$salt$key' with a fresh random salt
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    salt = secrets.token_bytes(SALT_BYTES)
+    return f"{SCHEME}${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def _legacy_hash(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def _is_legacy(stored):
+    return len(stored) == 64 and all(c in '0123456789abcdef' for c in stored)
+
+
+# Hashes made before scrypt (bare SHA-256 hex) or with other cost parameters than the current ones
+def needs_rehash(stored):
+    if _is_legacy(stored):
+        return True
+    scheme, n, r, p = stored.split('$')[:4]
+    return (scheme, int(n), int(r), int(p)) != (SCHEME, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+def verify_password(password, stored):
+    if not stored:
+        return False
+    if _is_legacy(stored):
+        return hmac.compare_digest(_legacy_hash(password), stored)
+    try:
+        scheme, n, r, p, salt, key = stored.split('$')
+        if scheme != SCHEME:
+            return False
+        return hmac.compare_digest(_scrypt(password, _unb64(salt), int(n), int(r), int(p)), _unb64(key))
+    except ValueError:
+        return False
+
+
+# Checked when the username doesn't exist, so an unknown user takes as long as a wrong password
+_DUMMY_HASH = None
+
+
+def _dummy_hash():
+    global _DUMMY_HASH
+    if _DUMMY_HASH is None:
+        _DUMMY_HASH = hash_password(secrets.token_hex(8))
+    return _DUMMY_HASH
+
+
+# (id, username) if the password matches. A match against a legacy or outdated hash replaces it
+# with one at the current cost; the update only applies if the hash hasn't changed meanwhile.
+def authenticate(conn, username, password):
+    row = conn.execute("SELECT id, username, password FROM users WHERE username = ?", (username,)).fetchone()
+    stored = row[2] if row and row[2] else _dummy_hash()
+    if not verify_password(password, stored) or row is None:
+        return None
+    if needs_rehash(stored):
+        upgraded = hash_password(password)
+        conn.execute("UPDATE users SET password = ? WHERE id = ? AND password = ?", (upgraded, row[0], stored))
+    return row[0], row[1]
@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import math
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import numpy as np
+
+from db import migrate
+from ingest import SensorIngestor, get_ingestor
+from waveforms import close_writer, get_writer
+
+
+def device_url(address):
+    return address if address.startswith("http") else f"http://{address}/data"
+
+
+# A field's value as a finite float; ValueError for anything else (null, text, NaN), so a bad
+# payload is reported like a malformed one
+def _number(payload, field):
+    value = payload[field]
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{field} must be a number, got {value!r}")
+    return float(value)
+
+
+def parse_reading(payload):
+    if not isinstance(payload, dict):
+        raise ValueError(f"Expected a JSON object, got {type(payload).__name__}")
+    reading = {
+        "Heart Rate": _number(payload, "heartRate"),
+        "Temperature": _number(payload, "temperature"),
+        "ECG": _number(payload, "ecg"),
+        "SpO2": _number(payload, "spo2"),
+        "timestamp": datetime.now(timezone.utc),
+    }
+    # Boards that sample ECG faster than they are polled send the samples since the last poll
+    if "ecgSamples" in payload:
+        rate = _number(payload, "ecgRate")
+        if rate <= 0:
+            raise ValueError(f"ecgRate must be positive, got {rate}")
+        if not isinstance(payload["ecgSamples"], list):
+            raise ValueError("ecgSamples must be a list of numbers")
+        try:
+            reading["ecg_samples"] = np.asarray(payload["ecgSamples"], dtype=np.float32)
+        except (TypeError, ValueError):
+            raise ValueError("ecgSamples must be a list of numbers")
+        reading["ecg_rate"] = rate
+    return reading
+
+
+class DevicePoller:
+    # Polls ESP8266 boards from one asyncio loop on a background thread, sharing a keep-alive
+    # httpx connection pool. Every reading is queued for storage and kept in a per-user buffer
+    # that the dashboard drains. Nothing on the loop blocks: readings the ingestor has no room for
+    # are dropped and counted, and ECG samples are written to disk on a separate thread.
+    def __init__(self, ingestor=None, timeout=2.0, max_connections=200, buffer_size=10000):
+        self.ingestor = ingestor
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.buffer_size = buffer_size
+        self._buffers = {}
+        self._errors = {}
+        self._tasks = {}
+        self._samples = {}
+        self._dropped = {}
+        self._lock = threading.Lock()
+        self._client = None
+        # One thread, so each board's sample blocks reach its file in order
+        self._waveforms = ThreadPoolExecutor(max_workers=1, thread_name_prefix="waveform-writer")
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="device-poller", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        limits = httpx.Limits(max_connections=self.max_connections,
+                              max_keepalive_connections=self.max_connections)
+        self._client = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+        self._ready.set()
+        self._loop.run_forever()
+
+    def watch(self, user_id, address, rate_hz=10.0):
+        self.unwatch(user_id)
+        with self._lock:
+            self._buffers[user_id] = deque(maxlen=self.buffer_size)
+            self._errors.pop(user_id, None)
+            self._samples[user_id] = 0
+            self._dropped[user_id] = 0
+        future = asyncio.run_coroutine_threadsafe(self._start(user_id, device_url(address), rate_hz), self._loop)
+        future.result()
+
+    async def _start(self, user_id, url, rate_hz):
+        self._tasks[user_id] = asyncio.create_task(self._poll(user_id, url, 1.0 / rate_hz))
+
+    def unwatch(self, user_id):
+        asyncio.run_coroutine_threadsafe(self._stop(user_id), self._loop).result()
+
+    async def _stop(self, user_id):
+        task = self._tasks.pop(user_id, None)
+        if task is not None:
+            task.cancel()
+        self._waveforms.submit(close_writer, user_id)
+
+    def drain(self, user_id):
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if not buffer:
+                return []
+            readings = list(buffer)
+            buffer.clear()
+            return readings
+
+    def last_error(self, user_id):
+        return self._errors.get(user_id)
+
+    def samples(self, user_id):
+        return self._samples.get(user_id, 0)
+
+    # Readings not stored because the ingestor's queue was full
+    def dropped(self, user_id):
+        return self._dropped.get(user_id, 0)
+
+    def _write_waveform(self, user_id, samples, rate, first):
+        try:
+            get_writer(user_id, rate, start=first).append(samples, first)
+        except OSError as e:
+            self._errors[user_id] = f"Error saving ECG samples: {e}"
+
+    # True if the reading was queued for storage
+    def _publish(self, user_id, reading):
+        ingestor = self.ingestor or get_ingestor()
+        stored = True
+        try:
+            ingestor.submit(user_id, reading["Heart Rate"], reading["Temperature"], reading["ECG"],
+                            reading["SpO2"], reading["timestamp"], block=False)
+        except queue.Full:
+            with self._lock:
+                self._dropped[user_id] = self._dropped.get(user_id, 0) + 1
+            self._errors[user_id] = "Storage is falling behind, reading dropped"
+            stored = False
+        samples = reading.pop("ecg_samples", None)
+        rate = reading.pop("ecg_rate", None)
+        if samples is not None and len(samples):
+            first = reading["timestamp"] - timedelta(seconds=len(samples) / rate)
+            self._waveforms.submit(self._write_waveform, user_id, samples, rate, first)
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is not None:
+                buffer.append(reading)
+            self._samples[user_id] += 1
+        return stored
+
+    # Ticks are scheduled on an absolute grid (start + k * period), so request time doesn't
+    # accumulate as drift; if a request overruns, the missed ticks are skipped, not burst.
+    async def _poll(self, user_id, url, period):
+        next_tick = self._loop.time()
+        while True:
+            try:
+                response = await self._client.get(url)
+                response.raise_for_status()
+                if self._publish(user_id, parse_reading(response.json())):
+                    self._errors.pop(user_id, None)
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                self._errors[user_id] = f"{type(e).__name__}: {e}"
+            except Exception as e:
+                # Anything else is a bug, but one bad reading mustn't end polling for this board
+                print(f"Polling user {user_id} failed: {type(e).__name__}: {e}")
+                self._errors[user_id] = f"{type(e).__name__}: {e}"
+
+            next_tick += period
+            now = self._loop.time()
+            if next_tick < now:
+                next_tick += (now - next_tick) // period * period + period
+            await asyncio.sleep(next_tick - now)
+
+    def close(self):
+        async def shutdown():
+            for task in list(self._tasks.values()):
+                task.cancel()
+            self._tasks.clear()
+            await self._client.aclose()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._waveforms.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Poll ESP8266 boards and store their readings")
+    parser.add_argument('--device', action='append', required=True, metavar="USER_ID=ADDRESS",
+                        help="e.g. 1=192.168.1.11; repeat for more boards")
+    parser.add_argument('--rate', type=float, default=10.0, help="samples per second per board")
+    parser.add_argument('--duration', type=float, default=None, help="seconds to run (default: forever)")
+    parser.add_argument('--db', default='users.db')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    migrate(conn)
+    conn.close()
+
+    ingestor = SensorIngestor(db_path=args.db)
+    poller = DevicePoller(ingestor=ingestor)
+    devices = dict(device.split("=", 1) for device in args.device)
+    start = time.monotonic()
+    for user_id, address in devices.items():
+        poller.watch(int(user_id), address, args.rate)
+
+    try:
+        while args.duration is None or time.monotonic() - start < args.duration:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        elapsed = time.monotonic() - start
+        poller.close()
+        ingestor.close()
+
+    total = sum(poller.samples(int(user_id)) for user_id in devices)
+    print(f"{len(devices)} boards, {total:,} samples in {elapsed:.1f}s: "
+          f"{total / elapsed / len(devices):.2f} Hz per board (target {args.rate}), {ingestor.rows_written:,} stored")
+    for user_id in devices:
+        error = poller.last_error(int(user_id))
+        if error:
+            print(f"user {user_id}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+
+
+def configure_connection(conn, readonly=False):
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class ConnectionPool:
+    # Hands out already-configured connections one caller at a time. Streamlit runs every rerun on a
+    # fresh script thread, so connections are checked out per use rather than pinned to a thread.
+    def __init__(self, db_path='users.db', size=8):
+        self.db_path = db_path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        return configure_connection(conn)
+
+    # Commits on success and rolls back on error before the connection goes back to the pool
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class AsyncDatabase:
+    # Runs blocking sqlite3 work on a small thread pool so async handlers never touch disk on the
+    # event loop. Every worker thread keeps one connection open (WAL, so readers don't block the
+    # ingest writer) and reuses it for every call it serves.
+    def __init__(self, db_path='users.db', size=8, readonly=True):
+        self.db_path = db_path
+        self.readonly = readonly
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="db")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            configure_connection(conn, self.readonly)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _call(self, fn, args, kwargs):
+        return fn(self._connection(), *args, **kwargs)
+
+    # await db.run(fn, *args) calls fn(conn, *args) on a pooled connection
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(self._call, fn, args, kwargs))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
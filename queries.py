@@ -0,0 +1,149 @@
+import os
+from datetime import datetime, date, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import pandas as pd
+
+from alerts import alert_message
+from archive import read_archive
+from db import sensor_source
+from ingest import utc_timestamp
+
+
+DISPLAY_COLUMNS = """heart_rate AS 'Heart Rate', temperature AS Temperature,
+                     ecg AS ECG, spo2 AS SpO2, timestamp"""
+
+
+# The server's zone by IANA name, so conversions follow its DST rules rather than today's offset: TZ if
+# set, else the zone /etc/localtime links to. Only where neither names one, the current fixed offset.
+def local_timezone():
+    name = os.environ.get('TZ', '').lstrip(':')
+    if not name and os.path.islink('/etc/localtime'):
+        name = os.path.realpath('/etc/localtime').partition('zoneinfo/')[2]
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return datetime.now().astimezone().tzinfo
+
+
+# Timestamps are stored as UTC text, so every bound is converted to UTC before it reaches SQL.
+# Naive datetimes are taken to be in the server's local time, like datetime.now().
+def to_utc(value, tz=None):
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime.combine(value, time.min)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=tz or local_timezone())
+    return value.astimezone(timezone.utc)
+
+
+def time_range(start, end, tz=None):
+    return utc_timestamp(to_utc(start, tz)), utc_timestamp(to_utc(end, tz))
+
+
+# Half-open [midnight, next midnight) in local time, so the timestamp column stays sargable
+def day_range(day, tz=None):
+    start = datetime.combine(day, time.min)
+    return time_range(start, start + timedelta(days=1), tz)
+
+
+def last_days_range(days, now=None, tz=None):
+    now = now or datetime.now()
+    return time_range(now - timedelta(days=days), now, tz)
+
+
+def to_local(df, tz=None):
+    if not df.empty:
+        stamps = pd.to_datetime(df["timestamp"], utc=True, format="ISO8601")
+        df["timestamp"] = stamps.dt.tz_convert(tz or local_timezone()).dt.tz_localize(None)
+    return df
+
+
+ARCHIVE_DISPLAY_NAMES = {"heart_rate": "Heart Rate", "temperature": "Temperature", "ecg": "ECG", "spo2": "SpO2"}
+
+
+# Reads both tiers: recent rows from SQLite and older ones from the Parquet archive
+def fetch_range(conn, user_id, start, end, tz=None):
+    start_utc, end_utc = time_range(start, end, tz)
+    query = f"""
+    SELECT {DISPLAY_COLUMNS}
+    FROM {sensor_source(conn)}
+    WHERE user_id = ? AND timestamp >= ? AND timestamp < ?
+    ORDER BY timestamp
+    """
+    hot = pd.read_sql_query(query, conn, params=(user_id, start_utc, end_utc))
+    cold = read_archive(user_id, start_utc, end_utc)
+    if cold.empty:
+        return to_local(hot, tz)
+    hot["timestamp"] = pd.to_datetime(hot["timestamp"], utc=True, format="ISO8601")
+    cold = cold.drop(columns="id").rename(columns=ARCHIVE_DISPLAY_NAMES)
+    frames = [cold, hot] if not hot.empty else [cold]
+    merged = pd.concat(frames, ignore_index=True).sort_values("timestamp", kind="stable", ignore_index=True)
+    return to_local(merged, tz)
+
+
+def fetch_day(conn, user_id, day, tz=None):
+    start = datetime.combine(day, time.min)
+    return fetch_range(conn, user_id, start, start + timedelta(days=1), tz)
+
+
+def fetch_latest(conn, user_id, limit=100, tz=None):
+    query = f"""
+    SELECT {DISPLAY_COLUMNS}
+    FROM {sensor_source(conn)}
+    WHERE user_id = ?
+    ORDER BY timestamp DESC
+    LIMIT ?
+    """
+    return to_local(pd.read_sql_query(query, conn, params=(user_id, limit)), tz)
+
+
+# Incremental reads keyed on the row id, which only ever grows (sensor_data is AUTOINCREMENT and
+# partitions keep their ids): returns the rows stored after after_id (the newest `limit` of them if
+# set), oldest first, and the cursor to pass next time. after_id=None starts from the beginning.
+def fetch_since(conn, user_id, after_id=None, limit=None, tz=None):
+    after_id = after_id or 0
+    query = f"""
+    SELECT * FROM (
+        SELECT id, {DISPLAY_COLUMNS} FROM {sensor_source(conn)}
+        WHERE user_id = ? AND id > ?
+        ORDER BY id DESC
+        LIMIT ?
+    ) ORDER BY id
+    """
+    df = pd.read_sql_query(query, conn, params=(user_id, after_id, -1 if limit is None else limit))
+    cursor = int(df["id"].iloc[-1]) if not df.empty else after_id
+    return to_local(df.drop(columns="id"), tz), cursor
+
+
+def latest_id(conn, user_id):
+    row = conn.execute(f"SELECT id FROM {sensor_source(conn)} WHERE user_id = ? ORDER BY id DESC LIMIT 1",
+                       (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+# Alerts newest first, optionally for one user, only the open ones, or only those after an alert id,
+# with local start/end times and a readable message
+def fetch_alerts(conn, user_id=None, open_only=False, after_id=None, limit=50, tz=None):
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append("alerts.user_id = ?")
+        params.append(user_id)
+    if open_only:
+        conditions.append("ended_at IS NULL")
+    if after_id is not None:
+        conditions.append("alerts.id > ?")
+        params.append(after_id)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+    SELECT alerts.id, alerts.user_id, users.username, metric, kind, value, threshold, peak, started_at, ended_at
+    FROM alerts LEFT JOIN users ON users.id = alerts.user_id
+    {where}
+    ORDER BY alerts.id DESC
+    LIMIT ?
+    """
+    df = pd.read_sql_query(query, conn, params=params + [limit])
+    df["message"] = [alert_message(alert) for alert in df.to_dict("records")]
+    for column in ["started_at", "ended_at"]:
+        stamps = pd.to_datetime(df[column], utc=True, format="ISO8601")
+        df[column] = stamps.dt.tz_convert(tz or local_timezone()).dt.tz_localize(None)
+    return df
@@ -0,0 +1,67 @@
+import functools
+import os
+import threading
+
+import streamlit as st
+
+from db import sensor_source
+from queries import latest_id
+from utils import db_connection
+
+
+CACHE_TTL_SECONDS = 600
+CACHE_MAX_ENTRIES = 256
+
+
+# Version tokens are part of every cache key. Each one is a single index seek, and it changes
+# whenever an ingestion path stores a row, so entries go stale exactly when their data changes.
+# That holds for any writer: this process's ingestor, the API or another app process.
+def user_data_version(conn, user_id, *args):
+    return latest_id(conn, user_id)
+
+
+def all_data_version(conn, *args):
+    users = conn.execute("SELECT COUNT(*), MAX(id) FROM users").fetchone()
+    row = conn.execute(f"SELECT id FROM {sensor_source(conn)} ORDER BY id DESC LIMIT 1").fetchone()
+    return users + (row[0] if row else 0,)
+
+
+_counts = {}
+_counts_lock = threading.Lock()
+_local = threading.local()
+
+
+def _count(name, hit):
+    with _counts_lock:
+        counts = _counts.setdefault(name, {"hits": 0, "misses": 0})
+        counts["hits" if hit else "misses"] += 1
+
+
+def cache_stats():
+    with _counts_lock:
+        return {name: dict(counts) for name, counts in _counts.items()}
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def _cached_call(name, version, args, _fn):
+    _local.missed = True
+    return _fn(*args)
+
+
+# Caches fn(*args) with st.cache_data, keyed on fn, its arguments (user and range) and
+# version(conn, *args), and counts hits and misses per function
+def cached_query(version=user_data_version):
+    def decorator(fn):
+        # Pages all run as __main__, so name functions by file
+        name = f"{os.path.basename(fn.__code__.co_filename)}:{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args):
+            with db_connection() as conn:
+                token = version(conn, *args)
+            _local.missed = False
+            result = _cached_call(name, token, args, fn)
+            _count(name, not _local.missed)
+            return result
+        return wrapper
+    return decorator
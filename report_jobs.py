@@ -0,0 +1,194 @@
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+from db import sensor_source
+from ecg import ecg_summary
+from queries import day_range, fetch_day
+from reports import ReportCache, generate_health_report, report_pdf
+from stats import describe
+
+
+NIGHTLY_DIR = 'nightly_reports'
+
+# Set in each worker process by _init_worker
+_progress = None
+
+
+def _init_worker(progress):
+    global _progress
+    _progress = progress
+
+
+def _reporter(job_id):
+    def report(fraction, stage):
+        if _progress is not None:
+            _progress.put((job_id, fraction, stage))
+    return report
+
+
+def render_report(job_id, report, summary, data):
+    return report_pdf(report, summary, data, progress=_reporter(job_id))
+
+
+# Renders one user's report for one (local) day and writes it to out_dir/<day>/user_<id>.pdf.
+# Returns the path, or None if the user has no readings that day.
+def render_user_report(job_id, db_path, user_id, day, out_dir=NIGHTLY_DIR, cache_dir=None):
+    progress = _reporter(job_id)
+    progress(0.0, "Loading data")
+    conn = sqlite3.connect(db_path)
+    try:
+        data = fetch_day(conn, user_id, day)
+    finally:
+        conn.close()
+    if data.empty:
+        progress(1.0, "No data")
+        return None
+
+    summary, report = generate_health_report(describe(data), ecg_summary(user_id, *day_range(day)))
+    cache = ReportCache(cache_dir) if cache_dir else None
+    pdf = report_pdf(report, summary, data, cache=cache,
+                     progress=lambda fraction, stage: progress(0.05 + 0.9 * fraction, stage))
+
+    directory = os.path.join(out_dir, day.isoformat())
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"user_{user_id}.pdf")
+    with open(f"{path}.tmp", 'wb') as f:
+        f.write(pdf)
+    os.replace(f"{path}.tmp", path)
+    progress(1.0, "Done")
+    return path
+
+
+class ReportJob:
+    def __init__(self, job_id, future):
+        self.id = job_id
+        self.progress = 0.0
+        self.stage = "Queued"
+        self.submitted = time.time()
+        self._future = future
+
+    @property
+    def status(self):
+        if self._future.done():
+            return "failed" if self._future.exception() is not None else "done"
+        return "running" if self._future.running() else "queued"
+
+    @property
+    def done(self):
+        return self._future.done()
+
+    @property
+    def error(self):
+        if not self._future.done():
+            return None
+        e = self._future.exception()
+        return f"{type(e).__name__}: {e}" if e is not None else None
+
+    def result(self, timeout=None):
+        return self._future.result(timeout)
+
+
+class ReportQueue:
+    # Report rendering runs in a pool of worker processes (spawned, so they don't inherit the
+    # caller's threads or locks) and is tracked by job id. Workers post (job_id, fraction, stage)
+    # updates on a shared queue, which a listener thread applies to the jobs. Only the most recent
+    # max_jobs finished jobs (and their results) are kept.
+    def __init__(self, workers=None, max_jobs=256):
+        context = multiprocessing.get_context('spawn')
+        self.max_jobs = max_jobs
+        self._progress = context.Queue()
+        self._executor = ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                             initargs=(self._progress,))
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener = threading.Thread(target=self._listen, name="report-progress", daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        for job_id, fraction, stage in iter(self._progress.get, None):
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.progress, job.stage = fraction, stage
+
+    def submit(self, fn, *args):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = ReportJob(job_id, self._executor.submit(fn, job_id, *args))
+            finished = [key for key, job in self._jobs.items() if job.done]
+            for key in finished[:max(0, len(finished) - self.max_jobs)]:
+                del self._jobs[key]
+        return job_id
+
+    def submit_report(self, report, summary, data):
+        return self.submit(render_report, report, summary, data)
+
+    def job(self, job_id):
+        return self._jobs.get(job_id)
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._progress.put(None)
+        self._listener.join()
+
+
+def users_with_data(conn, day, tz=None):
+    start, end = day_range(day, tz)
+    query = f"""
+    SELECT id FROM users
+    WHERE EXISTS (SELECT 1 FROM {sensor_source(conn)} WHERE user_id = users.id AND timestamp >= ? AND timestamp < ?)
+    ORDER BY id
+    """
+    return [row[0] for row in conn.execute(query, (start, end))]
+
+
+# One report per user with readings on `day` (default: yesterday), rendered across all cores
+def nightly_reports(db_path='users.db', day=None, out_dir=NIGHTLY_DIR, workers=None, cache_dir=None):
+    day = day or date.today() - timedelta(days=1)
+    conn = sqlite3.connect(db_path)
+    try:
+        user_ids = users_with_data(conn, day)
+    finally:
+        conn.close()
+
+    queue = ReportQueue(workers)
+    try:
+        jobs = {user_id: queue.submit(render_user_report, db_path, user_id, day, out_dir, cache_dir)
+                for user_id in user_ids}
+        results = {}
+        for user_id, job_id in jobs.items():
+            job = queue.job(job_id)
+            try:
+                results[user_id] = job.result()
+            except Exception as e:
+                print(f"Report for user {user_id} failed: {type(e).__name__}: {e}")
+                results[user_id] = None
+        return results
+    finally:
+        queue.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the nightly health report for every user")
+    parser.add_argument('--date', type=date.fromisoformat, default=None, help="YYYY-MM-DD (default: yesterday)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--db', default='users.db')
+    parser.add_argument('--out', default=NIGHTLY_DIR)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = nightly_reports(args.db, args.date, args.out, args.workers)
+    elapsed = time.perf_counter() - start
+    written = [path for path in results.values() if path]
+    print(f"{len(written)} reports written to {args.out} in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import seaborn as sns
+from fpdf import FPDF
+from matplotlib.figure import Figure
+
+from downsample import for_chart
+from stats import rolling
+
+
+ROLLING_WINDOW = 60
+REPORT_CACHE_DIR = os.path.join('cache', 'reports')
+REPORT_CACHE_BYTES = 256 * 1024 * 1024
+# Bump when the report layout changes so older cached files are no longer served
+REPORT_VERSION = 1
+
+
+class PDF(FPDF):
+    def header(self):
+        self.set_font('Times', 'B', 16)
+        self.cell(0, 10, 'Health Report', 0, 1, 'C')
+
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Times', 'I', 8)
+        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+
+    def chapter_title(self, title):
+        self.set_font('Times', 'B', 14)
+        self.set_fill_color(200, 220, 255)
+        self.cell(0, 10, title, 0, 1, 'L', 1)
+        self.ln(4)
+
+    def chapter_body(self, body):
+        self.set_font('Times', '', 12)
+        self.multi_cell(0, 10, body)
+        self.ln()
+
+    def add_border(self):
+        self.set_line_width(1)
+        self.rect(5, 5, self.w - 10, self.h - 10)
+
+    def add_table(self, data):
+        self.set_font('Times', 'B', 12)
+        self.set_fill_color(200, 220, 255)
+        self.cell(60, 10, 'Metric', 1, 0, 'C', 1)
+        self.cell(60, 10, 'Value', 1, 1, 'C', 1)
+
+        self.set_font('Times', '', 12)
+        for key, value in data.items():
+            self.cell(60, 10, key, 1)
+            self.cell(60, 10, f"{value:.2f}", 1, 1)
+
+    def add_image(self, path, x, y, w, h):
+        self.image(path, x, y, w, h)
+
+
+# stats maps each vital to its count/mean/std/min/max (Moments.summary(), as merged by load_vitals_csv);
+# ecg is the HRV summary of the high-rate recordings over the same period (ecg.ecg_summary), if any
+def generate_health_report(stats, ecg=None):
+    summary = {
+        "Average Heart Rate": stats["Heart Rate"]["mean"],
+        "Heart Rate Std Dev": stats["Heart Rate"]["std"],
+        "Average Temperature": stats["Temperature"]["mean"],
+        "Temperature Std Dev": stats["Temperature"]["std"],
+        "Max Heart Rate": stats["Heart Rate"]["max"],
+        "Min Heart Rate": stats["Heart Rate"]["min"],
+        "Max Temperature": stats["Temperature"]["max"],
+        "Min Temperature": stats["Temperature"]["min"],
+        "Average SpO2": stats["SpO2"]["mean"],
+        "SpO2 Std Dev": stats["SpO2"]["std"],
+        "Max SpO2": stats["SpO2"]["max"],
+        "Min SpO2": stats["SpO2"]["min"]
+    }
+
+    report_template = """
+       Analysis:
+       ---------
+       - The average heart rate over the monitoring period was {Average Heart Rate:.2f} bpm.
+         - Standard deviation: {Heart Rate Std Dev:.2f}
+         - Maximum heart rate: {Max Heart Rate:.2f} bpm
+         - Minimum heart rate: {Min Heart Rate:.2f} bpm
+{Heart Rate_range}
+       - The average body temperature over the monitoring period was {Average Temperature:.2f} °C.
+         - Standard deviation: {Temperature Std Dev:.2f}
+         - Maximum temperature: {Max Temperature:.2f} °F
+         - Minimum temperature: {Min Temperature:.2f} °F
+{Temperature_range}
+       - The average SpO2 over the monitoring period was {Average SpO2:.2f} %.
+         - Standard deviation: {SpO2 Std Dev:.2f}
+         - Maximum SpO2: {Max SpO2:.2f} %
+         - Minimum SpO2: {Min SpO2:.2f} %
+{SpO2_range}
+{ecg_section}       Rolling averages for heart rate, temperature, and SpO2 were calculated to analyze trends 
+       over time. Significant deviations from these averages might indicate periods of increased 
+       physical activity or potential health issues that warrant further investigation.
+
+       Recommendations:
+       ----------------
+       - Maintain regular monitoring to ensure consistent heart rate, temperature, and SpO2.
+       - Consult with a healthcare provider if there are significant anomalies or concerns.
+       - Maintain a healthy lifestyle with a balanced diet, regular exercise, and adequate rest.
+
+       Please remember that this report is based on the data provided and should not replace 
+       professional medical advice.
+       """
+
+    ecg_section = ""
+    if ecg and ecg["beats"] > 1:
+        summary.update({
+            "ECG Heart Rate": ecg["heart_rate"],
+            "SDNN (ms)": ecg["sdnn_ms"],
+            "RMSSD (ms)": ecg["rmssd_ms"],
+            "pNN50 (%)": ecg["pnn50"],
+        })
+        ecg_section = """       - {beats} beat-to-beat intervals were measured in the recorded ECG, at an average of {heart_rate:.2f} bpm.
+         - Heart rate variability (SDNN): {sdnn_ms:.1f} ms
+         - Beat-to-beat variability (RMSSD): {rmssd_ms:.1f} ms, pNN50 {pnn50:.1f} %
+
+""".format(**ecg)
+
+    # Median and 5th-95th percentile range, when the stats include percentiles (stats.describe)
+    ranges = {}
+    for column, unit in [("Heart Rate", "bpm"), ("Temperature", "°C"), ("SpO2", "%")]:
+        ranges[f"{column}_range"] = ""
+        if "p50" in stats[column]:
+            summary[f"Median {column}"] = stats[column]["p50"]
+            ranges[f"{column}_range"] = (f"         - Median: {stats[column]['p50']:.2f} {unit}, 90 % of readings between "
+                                         f"{stats[column]['p5']:.2f} and {stats[column]['p95']:.2f} {unit}\n")
+
+    return summary, report_template.format(ecg_section=ecg_section, **ranges, **summary)
+
+
+# A Figure owned by the caller (not pyplot's global state), so sessions can render concurrently
+def plot_graphs(data):
+    sns.set(style="whitegrid")
+    fig = Figure(figsize=(10, 20))
+    axs = fig.subplots(4, 1)
+    trend = rolling(data, ROLLING_WINDOW)
+
+    sns.lineplot(data=for_chart(data["Heart Rate"]), ax=axs[0], color='r')
+    sns.lineplot(data=for_chart(trend["Heart Rate Rolling Mean"]), ax=axs[0], color='k', linewidth=1)
+    axs[0].set_title('Heart Rate over Time')
+    axs[0].set_xlabel('Time')
+    axs[0].set_ylabel('Heart Rate (bpm)')
+
+    sns.lineplot(data=for_chart(data["Temperature"]), ax=axs[1], color='b')
+    sns.lineplot(data=for_chart(trend["Temperature Rolling Mean"]), ax=axs[1], color='k', linewidth=1)
+    axs[1].set_title('Temperature over Time')
+    axs[1].set_xlabel('Time')
+    axs[1].set_ylabel('Temperature (°C)')
+
+    sns.lineplot(data=for_chart(data["SpO2"]), ax=axs[2], color='g')
+    sns.lineplot(data=for_chart(trend["SpO2 Rolling Mean"]), ax=axs[2], color='k', linewidth=1)
+    axs[2].set_title('SpO2 over Time')
+    axs[2].set_xlabel('Time')
+    axs[2].set_ylabel('SpO2 (%)')
+
+    sns.heatmap(data[["Heart Rate", "Temperature", "SpO2", "ECG"]].corr(), annot=True, cmap='coolwarm', ax=axs[3])
+    axs[3].set_title('Correlation Heatmap')
+
+    fig.tight_layout()
+    return fig
+
+
+def render_graphs(data):
+    buffer = io.BytesIO()
+    plot_graphs(data).savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+# fpdf 1.7 only embeds images from a path, so graph_path is the cached (content-named) PNG
+def build_pdf(report, summary, graph_path):
+    pdf = PDF()
+    pdf.add_page()
+    pdf.add_border()
+    pdf.chapter_title("Health Report")
+    pdf.chapter_body(report)
+    pdf.add_page()
+    pdf.add_border()
+    pdf.chapter_title("Summary Table")
+    pdf.add_table(summary)
+
+    pdf.add_page()
+    pdf.add_border()
+    pdf.chapter_title("Graphs")
+    pdf.add_image(graph_path, 10, 20, pdf.w - 20, pdf.h-20)  # Adjust height to maintain aspect ratio
+
+    return pdf.output(dest='S').encode('latin1')
+
+
+# Same data and summary give the same key, whichever session or process asks
+def report_key(report, summary, data):
+    digest = hashlib.sha256(f"v{REPORT_VERSION}".encode())
+    digest.update(report.encode())
+    digest.update(repr(sorted(summary.items())).encode())
+    digest.update(",".join(map(str, data.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class ReportCache:
+    # Content-addressed files on disk (<key>.png, <key>.pdf), evicted least recently used first
+    # once they exceed max_bytes, plus the last few PDFs in memory. Files are written to a temp
+    # name and renamed into place, so concurrent writers of the same key never see a partial file.
+    def __init__(self, directory=REPORT_CACHE_DIR, max_bytes=REPORT_CACHE_BYTES, memory_items=16):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key, suffix):
+        with self._lock:
+            if (key, suffix) in self._memory:
+                self._memory.move_to_end((key, suffix))
+                self.hits += 1
+                return self._memory[(key, suffix)]
+        path = self.path(key, suffix)
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+            os.utime(path)  # mtime marks recent use for eviction
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        self._remember(key, suffix, content)
+        with self._lock:
+            self.hits += 1
+        return content
+
+    def put(self, key, suffix, content):
+        path = self.path(key, suffix)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        self._remember(key, suffix, content)
+        self._evict(keep=path)
+        return path
+
+    def _remember(self, key, suffix, content):
+        if suffix != '.pdf':
+            return
+        with self._lock:
+            self._memory[(key, suffix)] = content
+            self._memory.move_to_end((key, suffix))
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _evict(self, keep=None):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.path != keep and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep else 0)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_report_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ReportCache()
+        return _cache
+
+
+# Returns the PDF bytes, rendering the graphs and the document only on a cache miss.
+# progress(fraction, stage) is called as each step starts, for job queues to report.
+def report_pdf(report, summary, data, cache=None, progress=None):
+    progress = progress or (lambda fraction, stage: None)
+    cache = cache or get_report_cache()
+    progress(0.05, "Checking cache")
+    key = report_key(report, summary, data)
+    pdf = cache.get(key, '.pdf')
+    if pdf is not None:
+        progress(1.0, "Done")
+        return pdf
+    graph_path = cache.path(key, '.png')
+    if not os.path.exists(graph_path):
+        progress(0.1, "Rendering graphs")
+        cache.put(key, '.png', render_graphs(data))
+    progress(0.8, "Building PDF")
+    pdf = build_pdf(report, summary, graph_path)
+    cache.put(key, '.pdf', pdf)
+    progress(1.0, "Done")
+    return pdf
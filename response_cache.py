@@ -0,0 +1,159 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+RESPONSE_TTL_SECONDS = 3600
+RESPONSE_CACHE_ENTRIES = 512
+RESPONSE_CACHE_BYTES = 8 * 1024 * 1024
+FOLLOW_TIMEOUT = 120.0
+
+
+# Case, spacing and trailing punctuation don't change the question
+def normalize_prompt(prompt):
+    return re.sub(r"\s+", " ", prompt).strip().lower().rstrip("?!. ")
+
+
+# Same model, question, health context and conversation so far give the same key
+def response_key(model, prompt, context, history=()):
+    digest = hashlib.sha256(model.encode())
+    digest.update(b"\0" + normalize_prompt(prompt).encode())
+    digest.update(b"\0" + hashlib.sha256(context.encode()).digest())
+    digest.update(b"\0" + json.dumps(list(history), sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class _Flight:
+    # A response being generated: the chunks so far, for requests that join it midway
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.changed = threading.Condition()
+
+
+class ResponseCache:
+    # Model responses by key, expiring after `ttl` seconds and evicted least recently used first
+    # beyond max_entries or max_bytes of text. A request for a key already being generated follows
+    # that generation, getting its chunks as they arrive, instead of calling the model again.
+    def __init__(self, ttl=RESPONSE_TTL_SECONDS, max_entries=RESPONSE_CACHE_ENTRIES, max_bytes=RESPONSE_CACHE_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (expires, text)
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses + self.coalesced
+        return (self.hits + self.coalesced) / total if total else 0.0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits,
+                    "coalesced": self.coalesced, "misses": self.misses, "hit_rate": self.hit_rate}
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, text):
+        size = len(text.encode())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, text)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1].encode())
+
+    # Yields the response's text chunks: the cached text, the chunks of an identical request in
+    # flight, or those of produce() (an iterable of text chunks, only called on a miss). Only
+    # complete responses are cached; if the caller stops early, requests following it get an error.
+    def stream(self, key, produce):
+        with self._lock:
+            text = self._get(key)
+            following = leading = None
+            if text is not None:
+                self.hits += 1
+            elif key in self._flights:
+                following = self._flights[key]
+                self.coalesced += 1
+            else:
+                leading = self._flights[key] = _Flight()
+                self.misses += 1
+        if text is not None:
+            yield text
+        elif following is not None:
+            yield from self._follow(following)
+        else:
+            yield from self._lead(key, leading, produce)
+
+    def _lead(self, key, flight, produce):
+        try:
+            for chunk in produce():
+                with flight.changed:
+                    flight.chunks.append(chunk)
+                    flight.changed.notify_all()
+                yield chunk
+            self.put(key, "".join(flight.chunks))
+        except BaseException as e:
+            flight.error = e if isinstance(e, Exception) else RuntimeError("The request was abandoned")
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+
+    def _follow(self, flight):
+        sent = 0
+        while True:
+            with flight.changed:
+                if not flight.changed.wait_for(lambda: len(flight.chunks) > sent or flight.done, FOLLOW_TIMEOUT):
+                    raise TimeoutError("Timed out waiting for an identical request")
+                # Nothing is appended once done is set, so this is everything that is left
+                chunks, done, error = flight.chunks[sent:], flight.done, flight.error
+            sent += len(chunks)
+            yield from chunks
+            if done:
+                if error is not None:
+                    raise RuntimeError(f"The identical request this one joined failed: {error}")
+                return
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
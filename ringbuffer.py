@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+
+VITAL_COLUMNS = ["Heart Rate", "Temperature", "ECG", "SpO2"]
+
+
+class VitalsBuffer:
+    # Fixed-capacity ring buffer for the live vitals. Every sample is written twice, at i and
+    # i + capacity, so the most recent n samples are always one contiguous slice: appends are O(1)
+    # and values()/timestamps() windows are NumPy views, never copies (only valid until the next
+    # append). The oldest samples fall off once it is full.
+    def __init__(self, capacity=36000):
+        self.capacity = capacity
+        self._values = np.zeros((2 * capacity, len(VITAL_COLUMNS)), dtype=np.float64)
+        self._timestamps = np.zeros(2 * capacity, dtype='datetime64[ns]')
+        self._next = 0
+        self._size = 0
+
+    @classmethod
+    def for_retention(cls, seconds, rate_hz):
+        return cls(max(1, int(seconds * rate_hz)))
+
+    # Grows to hold `capacity` samples, keeping the ones already buffered; never shrinks
+    def resize(self, capacity):
+        if capacity <= self.capacity:
+            return
+        values, timestamps = self.values().copy(), self.timestamps().copy()
+        self.__init__(capacity)
+        n = len(values)
+        self._values[:n] = self._values[capacity:capacity + n] = values
+        self._timestamps[:n] = self._timestamps[capacity:capacity + n] = timestamps
+        self._next = n % capacity
+        self._size = n
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def empty(self):
+        return self._size == 0
+
+    def append(self, heart_rate, temperature, ecg, spo2, timestamp):
+        i = self._next
+        row = (heart_rate, temperature, ecg, spo2)
+        self._values[i] = row
+        self._values[i + self.capacity] = row
+        self._timestamps[i] = self._timestamps[i + self.capacity] = np.datetime64(timestamp, 'ns')
+        self._next = (i + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    # Bulk append from a frame with VITAL_COLUMNS and a timestamp column, in chronological order
+    def extend(self, frame):
+        values = frame[VITAL_COLUMNS].to_numpy(dtype=np.float64)[-self.capacity:]
+        timestamps = pd.to_datetime(frame["timestamp"]).to_numpy(dtype='datetime64[ns]')[-self.capacity:]
+        n = len(values)
+        if n == 0:
+            return
+        positions = (self._next + np.arange(n)) % self.capacity
+        self._values[positions] = values
+        self._values[positions + self.capacity] = values
+        self._timestamps[positions] = timestamps
+        self._timestamps[positions + self.capacity] = timestamps
+        self._next = (self._next + n) % self.capacity
+        self._size = min(self._size + n, self.capacity)
+
+    def _window(self, last):
+        n = self._size if last is None else min(last, self._size)
+        end = self._next + self.capacity
+        return slice(end - n, end)
+
+    def values(self, last=None):
+        return self._values[self._window(last)]
+
+    def timestamps(self, last=None):
+        return self._timestamps[self._window(last)]
+
+    def column(self, name, last=None):
+        return self.values(last)[:, VITAL_COLUMNS.index(name)]
+
+    # The last `last` samples as a frame. By default a copy, so later appends don't change a frame
+    # already handed to a chart or table; copy=False wraps the buffer itself (no copy at all) for a
+    # frame that is used up before the next append, e.g. written straight to a file
+    def to_frame(self, last=None, copy=True):
+        values, timestamps = self.values(last), self.timestamps(last)
+        if copy:
+            values, timestamps = values.copy(), timestamps.copy()
+        frame = pd.DataFrame(values, columns=VITAL_COLUMNS, copy=False)
+        frame["timestamp"] = timestamps
+        return frame
+
+    def clear(self):
+        self._next = 0
+        self._size = 0
@@ -0,0 +1,168 @@
+import math
+from datetime import datetime, timedelta, timezone
+
+from archive import read_archive
+from db import sensor_source
+
+
+METRICS = ['heart_rate', 'temperature', 'ecg', 'spo2']
+
+# Bucket key is a prefix of the UTC timestamp text, padded back to a full timestamp
+LEVELS = {
+    'minute': (timedelta(minutes=1), 16, ':00'),
+    'hour': (timedelta(hours=1), 13, ':00:00'),
+    'day': (timedelta(days=1), 10, ' 00:00:00'),
+}
+
+STAT_COLUMNS = [f"{m}_{s}" for m in METRICS for s in ('n', 'sum', 'min', 'max', 'sq')]
+
+RAW_AGGREGATES = ", ".join(f"COUNT({m}), TOTAL({m}), MIN({m}), MAX({m}), TOTAL({m} * {m})" for m in METRICS)
+ROLLUP_AGGREGATES = ", ".join(f"{c[-3:].upper()}({c})" if c.endswith(('_min', '_max')) else f"SUM({c})"
+                              for c in STAT_COLUMNS)
+
+
+def rollup_table(level):
+    return f"sensor_rollup_{level}"
+
+
+def create_rollup_tables(c):
+    columns = ", ".join(f"{name} REAL" for name in STAT_COLUMNS)
+    for level in LEVELS:
+        c.execute(f"""CREATE TABLE IF NOT EXISTS {rollup_table(level)}
+                      (user_id INTEGER, bucket TEXT, {columns},
+                       PRIMARY KEY (user_id, bucket)) WITHOUT ROWID""")
+
+
+def _upsert_sql(level):
+    updates = []
+    for m in METRICS:
+        updates += [f"{m}_n = {m}_n + excluded.{m}_n",
+                    f"{m}_sum = {m}_sum + excluded.{m}_sum",
+                    f"{m}_min = min(coalesce({m}_min, excluded.{m}_min), coalesce(excluded.{m}_min, {m}_min))",
+                    f"{m}_max = max(coalesce({m}_max, excluded.{m}_max), coalesce(excluded.{m}_max, {m}_max))",
+                    f"{m}_sq = {m}_sq + excluded.{m}_sq"]
+    placeholders = ", ".join("?" * (len(STAT_COLUMNS) + 2))
+    return (f"INSERT INTO {rollup_table(level)} (user_id, bucket, {', '.join(STAT_COLUMNS)}) "
+            f"VALUES ({placeholders}) ON CONFLICT (user_id, bucket) DO UPDATE SET {', '.join(updates)}")
+
+
+_UPSERTS = {level: _upsert_sql(level) for level in LEVELS}
+
+
+def _bucket(timestamp, level):
+    _, width, pad = LEVELS[level]
+    return timestamp[:width] + pad
+
+
+# Folds a batch of (user_id, heart_rate, temperature, ecg, spo2, timestamp) rows into the rollups.
+# Call inside the transaction that inserts the rows so both stay consistent.
+def update_rollups(conn, rows):
+    minutes = {}
+    for row in rows:
+        key = (row[0], _bucket(row[5], 'minute'))
+        stats = minutes.get(key)
+        if stats is None:
+            stats = minutes[key] = [0.0, 0.0, None, None, 0.0] * len(METRICS)
+        for j, value in zip(range(0, len(stats), 5), row[1:5]):
+            if value is None:
+                continue
+            stats[j] += 1
+            stats[j + 1] += value
+            stats[j + 2] = value if stats[j + 2] is None else min(stats[j + 2], value)
+            stats[j + 3] = value if stats[j + 3] is None else max(stats[j + 3], value)
+            stats[j + 4] += value * value
+
+    for level in LEVELS:
+        params = [(user_id, _bucket(minute, level), *stats) for (user_id, minute), stats in minutes.items()]
+        conn.executemany(_UPSERTS[level], params)
+
+
+def rebuild_rollups(c, user_id=None):
+    where = "" if user_id is None else "WHERE user_id = ?"
+    params = () if user_id is None else (user_id,)
+    for level in LEVELS:
+        c.execute(f"DELETE FROM {rollup_table(level)} {where}", params)
+    for level, (_, width, pad) in LEVELS.items():
+        c.execute(f"""INSERT INTO {rollup_table(level)} (user_id, bucket, {', '.join(STAT_COLUMNS)})
+                      SELECT user_id, substr(timestamp, 1, {width}) || '{pad}', {RAW_AGGREGATES}
+                      FROM {sensor_source(c.connection)} {where}
+                      GROUP BY user_id, substr(timestamp, 1, {width})""", params)
+
+
+def delete_rollups(c, user_id):
+    for level in LEVELS:
+        c.execute(f"DELETE FROM {rollup_table(level)} WHERE user_id = ?", (user_id,))
+
+
+def _floor(dt, unit):
+    return datetime.min + (dt - datetime.min) // unit * unit
+
+
+def _ceil(dt, unit):
+    floor = _floor(dt, unit)
+    return floor if floor == dt else floor + unit
+
+
+# Splits [start, end) into the coarsest aligned rollup pieces, leaving sub-minute edges as raw ranges
+def split_window(start, end, levels=('day', 'hour', 'minute')):
+    if start >= end:
+        return []
+    if not levels:
+        return [('raw', start, end)]
+    unit = LEVELS[levels[0]][0]
+    lo, hi = _ceil(start, unit), _floor(end, unit)
+    if lo >= hi:
+        return split_window(start, end, levels[1:])
+    return split_window(start, lo, levels[1:]) + [(levels[0], lo, hi)] + split_window(hi, end, levels[1:])
+
+
+def _format(dt):
+    return dt.isoformat(sep=' ', timespec='milliseconds' if dt.microsecond else 'seconds')
+
+
+def _merge(total, row):
+    for i, m in enumerate(METRICS):
+        n, s, lo, hi, sq = row[i * 5:i * 5 + 5]
+        if not n:
+            continue
+        t = total[m]
+        t['count'] += n
+        t['sum'] += s
+        t['sum_sq'] += sq
+        t['min'] = lo if t['min'] is None else min(t['min'], lo)
+        t['max'] = hi if t['max'] is None else max(t['max'], hi)
+
+
+def _frame_aggregates(df):
+    row = []
+    for m in METRICS:
+        values = df[m].dropna()
+        row += [len(values), float(values.sum()), values.min() if len(values) else None,
+                values.max() if len(values) else None, float((values * values).sum())]
+    return row
+
+
+# Per-metric count/sum/min/max/sum_sq/mean/std for [start, end), given as UTC datetimes
+def window_stats(conn, user_id, start, end):
+    start = start.astimezone(timezone.utc).replace(tzinfo=None) if start.tzinfo else start
+    end = end.astimezone(timezone.utc).replace(tzinfo=None) if end.tzinfo else end
+    total = {m: {'count': 0, 'sum': 0.0, 'sum_sq': 0.0, 'min': None, 'max': None} for m in METRICS}
+    source = sensor_source(conn)
+
+    for level, lo, hi in split_window(start, end):
+        if level == 'raw':
+            query = f"""SELECT {RAW_AGGREGATES} FROM {source}
+                        WHERE user_id = ? AND timestamp >= ? AND timestamp < ?"""
+        else:
+            query = f"""SELECT {ROLLUP_AGGREGATES} FROM {rollup_table(level)}
+                        WHERE user_id = ? AND bucket >= ? AND bucket < ?"""
+        _merge(total, conn.execute(query, (user_id, _format(lo), _format(hi))).fetchone())
+        if level == 'raw':
+            # Rollups outlive the raw rows, but partial-bucket edges need the archived readings too
+            _merge(total, _frame_aggregates(read_archive(user_id, lo, hi)))
+
+    for t in total.values():
+        n = t['count']
+        t['mean'] = t['sum'] / n if n else None
+        t['std'] = math.sqrt(max(0.0, (t['sum_sq'] - n * t['mean'] ** 2) / (n - 1))) if n > 1 else None
+    return total
@@ -0,0 +1,139 @@
+import math
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from ringbuffer import VITAL_COLUMNS
+
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class Moments:
+    # Count, mean, M2 (sum of squared deviations), min and max for each column. Partials built
+    # from separate chunks, days or workers combine exactly with merge() (Chan et al.), so a
+    # large dataset never has to be in memory at once.
+    def __init__(self, columns, count, mean, m2, minimum, maximum):
+        self.columns = list(columns)
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = minimum
+        self.max = maximum
+
+    @classmethod
+    def empty(cls, columns=VITAL_COLUMNS):
+        k = len(columns)
+        return cls(columns, np.zeros(k), np.zeros(k), np.zeros(k), np.full(k, np.inf), np.full(k, -np.inf))
+
+    # Values are laid out one contiguous row per metric, so every reduction streams through memory
+    # once per metric instead of striding across columns; NaNs are ignored
+    @classmethod
+    def of(cls, data, columns=VITAL_COLUMNS):
+        if isinstance(data, pd.DataFrame):
+            rows = np.stack([data[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in columns]) \
+                if len(columns) else np.empty((0, 0))
+        else:
+            rows = np.ascontiguousarray(np.asarray(data, dtype=np.float64).reshape(len(data), len(columns)).T)
+        if rows.size == 0:
+            return cls.empty(columns)
+        valid = ~np.isnan(rows)
+        if valid.all():
+            count = np.full(len(rows), float(rows.shape[1]))
+            mean = rows.mean(axis=1)
+            deviations = rows - mean[:, None]
+            return cls(columns, count, mean, np.einsum('ij,ij->i', deviations, deviations),
+                       rows.min(axis=1), rows.max(axis=1))
+        count = valid.sum(axis=1).astype(np.float64)
+        filled = np.where(valid, rows, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, filled.sum(axis=1) / count, 0.0)
+        deviations = np.where(valid, rows - mean[:, None], 0.0)
+        m2 = np.einsum('ij,ij->i', deviations, deviations)
+        minimum = np.where(valid, rows, np.inf).min(axis=1)
+        maximum = np.where(valid, rows, -np.inf).max(axis=1)
+        return cls(columns, count, mean, m2, minimum, maximum)
+
+    def merge(self, other):
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(count > 0, other.count / count, 0.0)
+            m2 = self.m2 + other.m2 + delta * delta * self.count * weight
+        return Moments(self.columns, count, self.mean + delta * weight, m2,
+                       np.minimum(self.min, other.min), np.maximum(self.max, other.max))
+
+    __add__ = merge
+
+    @property
+    def std(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+    def summary(self):
+        std = self.std
+        result = {}
+        for i, column in enumerate(self.columns):
+            n = int(self.count[i])
+            result[column] = {
+                "count": n,
+                "mean": float(self.mean[i]) if n else math.nan,
+                "std": float(std[i]),
+                "min": float(self.min[i]) if n else math.nan,
+                "max": float(self.max[i]) if n else math.nan,
+            }
+        return result
+
+
+# Moments plus percentiles for a frame that is in memory
+def describe(data, columns=VITAL_COLUMNS, percentiles=PERCENTILES):
+    columns = [c for c in columns if c in data]
+    return with_percentiles(Moments.of(data, columns).summary(), data, columns, percentiles)
+
+
+# Adds 'p5', 'p50'... to each column's summary. Percentiles are not mergeable, so they are computed
+# here in one np.nanpercentile call over every column of the in-memory frame
+def with_percentiles(summary, data, columns=VITAL_COLUMNS, percentiles=PERCENTILES):
+    columns = [c for c in columns if c in data and c in summary]
+    values = data[columns].to_numpy(dtype=np.float64)
+    if len(values):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN column
+            quantiles = np.nanpercentile(values, percentiles, axis=0)
+        for i, column in enumerate(columns):
+            for j, p in enumerate(percentiles):
+                summary[column][f"p{p}"] = float(quantiles[j, i])
+    return summary
+
+
+# Rolling mean and std over the last `window` samples from cumulative sums: O(n) for any window
+def rolling(data, window, columns=VITAL_COLUMNS):
+    columns = [c for c in columns if c in data]
+    values = data[columns].to_numpy(dtype=np.float64)
+    n = len(values)
+    result = pd.DataFrame(index=data.index)
+    if n == 0:
+        return result
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    # Centre on the first window's mean so the running sums stay small (better conditioned)
+    shift = np.nanmean(values[:window], axis=0)
+    shift = np.where(np.isnan(shift), 0.0, shift)
+    centred = np.where(valid, filled - shift, 0.0)
+    zero = np.zeros((1, len(columns)))
+    s1 = np.vstack([zero, np.cumsum(centred, axis=0)])
+    s2 = np.vstack([zero, np.cumsum(centred * centred, axis=0)])
+    c = np.vstack([zero, np.cumsum(valid, axis=0)])
+    lo = np.maximum(np.arange(1, n + 1) - window, 0)
+    hi = np.arange(1, n + 1)
+    count = c[hi] - c[lo]
+    total = s1[hi] - s1[lo]
+    total_sq = s2[hi] - s2[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        var = (total_sq - count * mean * mean) / (count - 1)
+    for i, column in enumerate(columns):
+        result[f"{column} Rolling Mean"] = np.where(count[:, i] > 0, mean[:, i] + shift[i], np.nan)
+        result[f"{column} Rolling Std"] = np.where(count[:, i] > 1, np.sqrt(np.maximum(var[:, i], 0.0)), np.nan)
+    return result
@@ -0,0 +1,20 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import migrate
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "users.db")
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.execute("INSERT INTO users (id, username, password) VALUES (1, 'alice', '')")
+    conn.commit()
+    conn.close()
+    return path
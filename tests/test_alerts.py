@@ -0,0 +1,71 @@
+import sqlite3
+
+from alerts import ENTER_SAMPLES, VitalsMonitor, open_alerts, store_alert_events
+from ingest import SensorIngestor
+
+
+def reading(heart_rate, second):
+    return (1, heart_rate, 36.8, 0, 97.0, f"2026-01-01 00:00:{second:02d}")
+
+
+def open_rows(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT id, kind FROM alerts WHERE ended_at IS NULL").fetchall()
+
+
+def test_end_closes_the_row_its_start_inserted(db_path):
+    conn = sqlite3.connect(db_path)
+    monitor = VitalsMonitor(load_open=lambda user_id: open_alerts(conn, user_id))
+    events = []
+    for second in range(ENTER_SAMPLES):
+        monitor.observe(reading(130, second), events)
+    store_alert_events(conn, events)
+    conn.commit()
+    # An alert of the same kind opened by another process stays open
+    conn.execute("INSERT INTO alerts (user_id, metric, kind, value, threshold, peak, started_at) "
+                 "VALUES (1, 'heart_rate', 'high', 125, 120, 125, '2026-01-01 00:00:00')")
+    other = conn.execute("SELECT MAX(id) FROM alerts").fetchone()[0]
+
+    events = []
+    monitor.observe(reading(80, 10), events)
+    store_alert_events(conn, events)
+    conn.commit()
+    assert open_rows(db_path) == [(other, 'high')]
+
+
+def test_open_alerts_are_resumed_not_cleared(db_path):
+    first = SensorIngestor(db_path, flush_interval_ms=10)
+    for second in range(ENTER_SAMPLES):
+        first.submit(1, 130, 36.8, 0, 97.0)
+    first.flush()
+    opened = open_rows(db_path)
+    assert len(opened) == 1
+
+    # A second ingestor seeing the user for the first time keeps the alert open until it recovers
+    second = SensorIngestor(db_path, flush_interval_ms=10)
+    second.submit(1, 128, 36.8, 0, 97.0)
+    second.flush()
+    assert open_rows(db_path) == opened
+    second.submit(1, 80, 36.8, 0, 97.0)
+    second.flush()
+    assert open_rows(db_path) == []
+    first.close()
+    second.close()
+
+
+def test_trimmed_rows_take_their_alerts_with_them(db_path):
+    ingestor = SensorIngestor(db_path, max_pending=4)
+    ingestor.close()
+    ingestor.monitor = VitalsMonitor()
+    buffer = []
+    # Three high readings open an alert on the third, then two normal ones end it
+    for second, heart_rate in enumerate([130, 130, 130, 80, 80]):
+        ingestor._buffer(buffer, reading(heart_rate, second))
+    assert [e[0] for e in ingestor._events] == ['start', 'end']
+    ingestor._trim(buffer, 3)
+    assert len(buffer) == 2 and [e[0] for e in ingestor._events] == ['end']
+
+    conn = sqlite3.connect(db_path)
+    store_alert_events(conn, ingestor._events)
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0] == 0
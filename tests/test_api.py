@@ -0,0 +1,79 @@
+import queue
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from db import sensor_source
+from ingest import SensorIngestor
+
+
+LINE = '{"user_id": 1, "heartRate": 72, "temperature": 36.8, "ecg": 512, "spo2": 97}'
+
+
+@pytest.fixture
+def ingestor(db_path, monkeypatch):
+    ingestor = SensorIngestor(db_path, flush_interval_ms=10, max_pending=4)
+    monkeypatch.setattr(api, "get_ingestor", lambda: ingestor)
+    yield ingestor
+    ingestor.close()
+
+
+@pytest.fixture
+def client():
+    # Not entered as a context manager, so startup doesn't migrate ./users.db
+    return TestClient(api.app)
+
+
+def stored(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {sensor_source(conn)}").fetchone()[0]
+
+
+def test_ingest_stores_batch(client, ingestor, db_path):
+    response = client.post("/api/ingest", content="\n".join([LINE] * 3))
+    assert response.status_code == 200 and response.json() == {"accepted": 3}
+    ingestor.flush()
+    assert stored(db_path) == 3
+
+
+def test_batch_is_queued_whole_or_not_at_all(ingestor, db_path):
+    # Two of the four slots are taken, so a batch of three doesn't fit and none of it is queued
+    ingestor._reserve(2, False, None)
+    with pytest.raises(queue.Full):
+        ingestor.submit_many([(1, 70, 36.8, 0, 97, None)] * 3, block=False)
+    ingestor._release(2)
+    ingestor.submit_many([(1, 70, 36.8, 0, 97, None)] * 3, block=False)
+    ingestor.flush()
+    assert stored(db_path) == 3
+
+
+def test_full_queue_is_503_with_retry_after(client, ingestor, monkeypatch):
+    def full(rows, timeout=5.0, block=True):
+        raise queue.Full
+    monkeypatch.setattr(ingestor, "submit_many", full)
+    response = client.post("/api/ingest", content="\n".join([LINE] * 3))
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(api.RETRY_AFTER)
+
+
+def test_non_utf8_body_is_a_client_error(client, ingestor):
+    assert client.post("/api/ingest", content=b"\xff\xfe" + LINE.encode()).status_code == 400
+
+
+@pytest.mark.parametrize("length", ["abc", "-5", "1e3"])
+def test_malformed_content_length_is_a_client_error(client, ingestor, length):
+    response = client.post("/api/ingest", content=LINE, headers={"content-length": length})
+    assert response.status_code == 400
+
+
+def test_oversized_bodies_are_refused_before_parsing(client, ingestor, monkeypatch):
+    monkeypatch.setattr(api, "MAX_BATCH_BYTES", 100)
+    assert client.post("/api/ingest", content="\n".join([LINE] * 3)).status_code == 413
+    monkeypatch.setattr(api, "MAX_BATCH_BYTES", 1 << 20)
+    monkeypatch.setattr(api, "MAX_BATCH_SIZE", 2)
+    parsed = []
+    monkeypatch.setattr(api, "parse_readings", lambda lines: parsed.append(lines))
+    assert client.post("/api/ingest", content="\n".join([LINE] * 3)).status_code == 413
+    assert parsed == []
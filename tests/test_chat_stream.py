@@ -0,0 +1,39 @@
+import re
+
+import pytest
+
+from benchmarks.chat_streaming import Placeholder, start_server
+from benchmarks.fake_model_server import ANSWER
+from chat_stream import CURSOR, ModelServerChat, StreamStats, count_tokens, stream_response
+
+
+@pytest.fixture(scope="module")
+def model_url():
+    server, url = start_server(ttft=0.05, rate=400.0, tokens_per_chunk=2)
+    yield url
+    server.should_exit = True
+
+
+def test_chunks_arrive_in_order_and_complete(model_url):
+    chat = ModelServerChat(model_url)
+    chunks = list(chat.send_message("How am I doing?"))
+    tokens = re.findall(r"\s*\S+", ANSWER)
+    assert len(chunks) == -(-len(tokens) // 2)
+    assert "".join(chunks) == "(Turn 1) " + ANSWER
+    # The finished reply goes into the history, so the next turn is numbered after it
+    assert chat.history[-1] == {"role": "model", "parts": ["".join(chunks)]}
+    assert next(iter(chat.send_message("And now?"))).startswith("(Turn 2)")
+
+
+def test_stream_response_shows_everything_at_a_limited_frame_rate(model_url):
+    placeholder = Placeholder()
+    frames = []
+    placeholder.markdown = frames.append
+    text, stats = stream_response(placeholder, ModelServerChat(model_url).send_message("Hi"), StreamStats(), fps=20)
+    assert text == "(Turn 1) " + ANSWER
+    assert frames[-1] == text
+    assert all(frame.endswith(CURSOR) and text.startswith(frame[:-1]) for frame in frames[:-1])
+    # ~0.2 s of streaming at 20 frames/s, plus the final frame
+    assert stats.frames == len(frames) < -(-len(re.findall(r"\s*\S+", ANSWER)) // 2)
+    assert stats.tokens == count_tokens(text)
+    assert stats.ttft_ms >= 50 and stats.tokens_per_sec > 0
@@ -0,0 +1,24 @@
+import io
+
+from csv_loader import load_vitals_csv
+
+
+CSV = """Heart Rate,Temperature,ECG,SpO2,timestamp
+72,36.8,512,97,2026-01-01 00:00:00
+0,36.8,512,97,2026-01-01 00:00:01
+74,36.9,510,,2026-01-01 00:00:02
+75,36.9,509,98,not a time
+76,37.0,508,98,2026-01-01 00:00:04
+"""
+
+
+def test_drop_invalid_drops_missing_vitals_and_bad_timestamps():
+    upload = load_vitals_csv(io.StringIO(CSV), drop_invalid=True)
+    assert list(upload.data["Heart Rate"]) == [72, 76]
+    assert upload.data["timestamp"].notna().all()
+    assert upload.rows == 2 and upload.stats["Heart Rate"]["count"] == 2
+
+
+def test_rows_are_kept_without_drop_invalid():
+    upload = load_vitals_csv(io.StringIO(CSV))
+    assert len(upload.data) == 5 and upload.data["timestamp"].isna().sum() == 1
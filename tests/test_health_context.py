@@ -0,0 +1,20 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from health_context import ALERT_DAYS, build_context
+
+
+def add_alert(conn, started_at):
+    conn.execute("INSERT INTO alerts (user_id, metric, kind, value, threshold, peak, started_at) "
+                 "VALUES (1, 'heart_rate', 'high', 130, 120, 130, ?)", (started_at.strftime('%Y-%m-%d %H:%M:%S'),))
+
+
+def test_alerts_are_filtered_relative_to_now(db_path):
+    conn = sqlite3.connect(db_path)
+    now = datetime(2025, 6, 15, 12, 0, tzinfo=timezone.utc)
+    add_alert(conn, now - timedelta(days=ALERT_DAYS, hours=1))
+    add_alert(conn, now - timedelta(days=ALERT_DAYS - 1))
+    # Relative to the real clock both are long past, so only `now` can keep the newer one
+    alerts = build_context(conn, 1, now)["alerts"]
+    assert len(alerts) == 1 and "Heart rate high" in alerts[0]
+    assert build_context(conn, 1, now.replace(tzinfo=None))["alerts"] == alerts
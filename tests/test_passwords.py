@@ -0,0 +1,42 @@
+import hashlib
+import sqlite3
+
+import passwords
+
+
+def set_password(db_path, stored):
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE users SET password = ? WHERE id = 1", (stored,))
+
+
+def stored_password(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT password FROM users WHERE id = 1").fetchone()[0]
+
+
+def test_hashes_are_salted_and_verify():
+    first, second = passwords.hash_password("pw", n=2 ** 10), passwords.hash_password("pw", n=2 ** 10)
+    assert first != second and first.startswith("scrypt$1024$8$1$")
+    assert passwords.verify_password("pw", first) and not passwords.verify_password("wrong", first)
+    assert not passwords.verify_password("pw", "") and not passwords.verify_password("pw", "scrypt$bad")
+
+
+def test_login_upgrades_legacy_hash(db_path):
+    set_password(db_path, hashlib.sha256(b"pw").hexdigest())
+    conn = sqlite3.connect(db_path)
+    assert passwords.authenticate(conn, "alice", "wrong") is None
+    assert passwords.authenticate(conn, "nobody", "pw") is None
+    assert passwords.authenticate(conn, "alice", "pw") == (1, "alice")
+    conn.commit()
+    upgraded = stored_password(db_path)
+    assert upgraded.startswith(f"scrypt${passwords.SCRYPT_N}$") and not passwords.needs_rehash(upgraded)
+    assert passwords.authenticate(conn, "alice", "pw") == (1, "alice")
+    assert stored_password(db_path) == upgraded
+
+
+def test_login_raises_outdated_cost(db_path):
+    set_password(db_path, passwords.hash_password("pw", n=2 ** 10))
+    conn = sqlite3.connect(db_path)
+    assert passwords.authenticate(conn, "alice", "pw") == (1, "alice")
+    conn.commit()
+    assert not passwords.needs_rehash(stored_password(db_path))
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from benchmarks.esp_simulator import serve_firmware
+from db import sensor_source
+from ingest import SensorIngestor
+from poller import DevicePoller, parse_reading
+from waveforms import list_sessions
+
+
+@pytest.fixture
+def board():
+    # A fake ESP8266 answering GET /data on its own loop, sending 250 Hz ECG samples with each reading
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(serve_firmware('127.0.0.1', 0, 0, ecg_rate=250.0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f"127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    loop.call_soon_threadsafe(server.close)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+class FullIngestor:
+    # Storage that has fallen behind: every reading is refused
+    def __init__(self):
+        self.blocking_calls = 0
+
+    def submit(self, *row, timeout=5.0, block=True):
+        if block:
+            self.blocking_calls += 1
+        raise queue.Full
+
+
+def poll(poller, address, seconds, rate_hz=20.0):
+    poller.watch(1, address, rate_hz)
+    time.sleep(seconds)
+    poller.unwatch(1)
+
+
+def test_polls_board_and_stores_readings(db_path, board, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ingestor = SensorIngestor(db_path, flush_interval_ms=10)
+    poller = DevicePoller(ingestor=ingestor)
+    try:
+        poll(poller, board, 1.0)
+        readings = poller.drain(1)
+    finally:
+        poller.close()
+        ingestor.close()
+
+    assert 15 <= len(readings) <= 21
+    assert poller.last_error(1) is None and poller.dropped(1) == 0
+    assert all(r.keys() == {"Heart Rate", "Temperature", "ECG", "SpO2", "timestamp"} for r in readings)
+    assert [r["timestamp"] for r in readings] == sorted(r["timestamp"] for r in readings)
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {sensor_source(conn)} WHERE user_id = 1").fetchone()[0] == len(readings)
+    sessions = list_sessions(1)
+    assert len(sessions) == 1 and sessions[0].rate_hz == 250.0 and len(sessions[0]) > 100
+
+
+def test_full_storage_drops_readings_without_stalling_the_loop(board, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ingestor = FullIngestor()
+    poller = DevicePoller(ingestor=ingestor)
+    try:
+        poll(poller, board, 1.0)
+    finally:
+        poller.close()
+
+    assert ingestor.blocking_calls == 0
+    assert poller.samples(1) >= 15
+    assert poller.dropped(1) == poller.samples(1)
+    assert poller.last_error(1) == "Storage is falling behind, reading dropped"
+
+
+@pytest.mark.parametrize("change", [{"heartRate": None}, {"spo2": "97"}, {"temperature": float("nan")},
+                                    {"ecgSamples": [1.0], "ecgRate": 0}, {"ecgSamples": "abc", "ecgRate": 250}])
+def test_bad_payloads_are_value_errors(change):
+    payload = {"heartRate": 72, "temperature": 36.8, "ecg": 512, "spo2": 97}
+    with pytest.raises(ValueError):
+        parse_reading({**payload, **change})
+
+
+@pytest.fixture
+def flaky_board():
+    # Answers the first two polls with a null field and a zero ECG rate, then with good readings
+    payloads = iter([{"heartRate": None, "temperature": 36.8, "ecg": 512, "spo2": 97},
+                     {"heartRate": 72, "temperature": 36.8, "ecg": 512, "spo2": 97, "ecgSamples": [1.0], "ecgRate": 0}])
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                await reader.readuntil(b"\r\n\r\n")
+                payload = next(payloads, {"heartRate": 72, "temperature": 36.8, "ecg": 512, "spo2": 97})
+                body = json.dumps(payload).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: "
+                             + str(len(body)).encode() + b"\r\n\r\n" + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(handle, '127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f"127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    loop.call_soon_threadsafe(server.close)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+def test_bad_readings_are_reported_and_polling_continues(flaky_board, db_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ingestor = SensorIngestor(db_path, flush_interval_ms=10)
+    poller = DevicePoller(ingestor=ingestor)
+    errors = []
+    try:
+        poller.watch(1, flaky_board, 20.0)
+        for _ in range(10):
+            time.sleep(0.05)
+            errors.append(poller.last_error(1))
+        time.sleep(0.5)
+        poller.unwatch(1)
+    finally:
+        poller.close()
+        ingestor.close()
+    assert any(e and "heartRate must be a number" in e for e in errors)
+    assert poller.samples(1) >= 8 and poller.last_error(1) is None
@@ -0,0 +1,21 @@
+from datetime import date, datetime
+
+import pandas as pd
+
+from queries import day_range, local_timezone, to_local, to_utc
+
+
+def test_conversions_follow_dst(monkeypatch):
+    monkeypatch.setenv('TZ', 'Europe/London')
+    assert str(local_timezone()) == 'Europe/London'
+    assert to_utc(datetime(2025, 1, 15, 12)).hour == 12
+    assert to_utc(datetime(2025, 7, 15, 12)).hour == 11
+    # The day the clocks go forward is 23 hours long
+    assert day_range(date(2025, 3, 30)) == ('2025-03-30 00:00:00', '2025-03-30 23:00:00')
+    frame = to_local(pd.DataFrame({"timestamp": ["2025-01-15T12:00:00Z", "2025-07-15T12:00:00Z"]}))
+    assert [t.hour for t in frame["timestamp"]] == [12, 13]
+
+
+def test_unknown_zone_falls_back_to_current_offset(monkeypatch):
+    monkeypatch.setenv('TZ', 'Nowhere/Special')
+    assert local_timezone() == datetime.now().astimezone().tzinfo
@@ -0,0 +1,74 @@
+import threading
+import time
+
+from benchmarks.response_cache import StubModel
+from response_cache import ResponseCache, response_key
+
+
+def ask(cache, model, question, context="context"):
+    return "".join(cache.stream(response_key("stub", question, context), lambda: model.send_message(question)))
+
+
+def test_repeated_question_is_a_hit():
+    cache, model = ResponseCache(), StubModel(ttft=0.0, rate=1000.0)
+    first = ask(cache, model, "How am I doing?")
+    assert ask(cache, model, "  how am I   doing ") == first
+    assert ask(cache, model, "How am I doing?", context="other context") == first
+    assert model.calls == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_identical_concurrent_requests_make_one_upstream_call():
+    cache, model = ResponseCache(), StubModel(ttft=0.2, rate=400.0)
+    answers = []
+    barrier = threading.Barrier(8)
+
+    def request():
+        barrier.wait()
+        answers.append(ask(cache, model, "Is my heart rate normal?"))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert model.calls == 1
+    assert len(answers) == 8 and len(set(answers)) == 1 and answers[0]
+    assert cache.stats()["misses"] == 1 and cache.stats()["coalesced"] == 7
+
+
+def test_failed_requests_are_not_cached_and_followers_see_the_error():
+    cache = ResponseCache()
+    key = response_key("stub", "q", "c")
+
+    def failing():
+        yield "partial "
+        time.sleep(0.1)
+        raise ConnectionError("model went away")
+
+    errors = []
+
+    def follower():
+        time.sleep(0.05)
+        try:
+            "".join(cache.stream(key, failing))
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=follower)
+    thread.start()
+    try:
+        "".join(cache.stream(key, failing))
+    except ConnectionError:
+        pass
+    thread.join()
+    assert len(errors) == 1 and cache.get(key) is None
+
+
+def test_entries_expire_and_are_evicted_by_size():
+    cache = ResponseCache(ttl=0.05, max_entries=2, max_bytes=10)
+    cache.put("a", "12345")
+    cache.put("b", "123456")
+    assert cache.get("a") is None and cache.get("b") == "123456"
+    time.sleep(0.06)
+    assert cache.get("b") is None and cache.stats()["bytes"] == 0
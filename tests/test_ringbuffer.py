@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import numpy as np
+
+from ringbuffer import VitalsBuffer
+
+
+def fill(buffer, values, minute=0):
+    for i, value in enumerate(values):
+        buffer.append(value, 36.8, 512, 97, datetime(2026, 1, 1, 0, minute, i))
+
+
+def test_frames_are_not_changed_by_later_appends():
+    buffer = VitalsBuffer(4)
+    fill(buffer, range(6))
+    frame = buffer.to_frame()
+    fill(buffer, [99, 98], minute=1)
+    assert list(frame["Heart Rate"]) == [2, 3, 4, 5]
+    assert [t.second for t in frame["timestamp"]] == [2, 3, 4, 5]
+
+
+def test_to_frame_window_and_view():
+    buffer = VitalsBuffer(4)
+    fill(buffer, range(6))
+    window = buffer.to_frame(2)
+    view = buffer.to_frame(copy=False)
+    assert list(window["Heart Rate"]) == [4, 5] and list(view["Heart Rate"]) == [2, 3, 4, 5]
+    assert np.shares_memory(view["Heart Rate"].to_numpy(), buffer.values())
+    assert not np.shares_memory(window["Heart Rate"].to_numpy(), buffer.values())
+
+
+def test_resize_keeps_newest_samples_in_order():
+    buffer = VitalsBuffer(4)
+    fill(buffer, range(6))
+    buffer.resize(8)
+    assert buffer.capacity == 8 and list(buffer.column("Heart Rate")) == [2, 3, 4, 5]
+    fill(buffer, range(10, 15), minute=1)
+    assert list(buffer.column("Heart Rate")) == [3, 4, 5, 10, 11, 12, 13, 14]
+    assert buffer.timestamps()[-1] == buffer.to_frame()["timestamp"].iloc[-1]
+    buffer.resize(2)
+    assert buffer.capacity == 8 and len(buffer) == 8
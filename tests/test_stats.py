@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from reports import generate_health_report
+from stats import Moments, describe
+
+
+def frame(n=1001, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"Heart Rate": rng.normal(75, 5, n), "Temperature": rng.normal(36.8, 0.2, n),
+                         "ECG": rng.normal(500, 5, n), "SpO2": rng.normal(97, 1, n)})
+
+
+def test_merged_moments_match_one_pass():
+    data = frame()
+    merged = Moments.of(data[:400]).merge(Moments.of(data[400:])).summary()
+    whole = Moments.of(data).summary()
+    for column in data:
+        for key in ("mean", "std", "min", "max"):
+            assert np.isclose(merged[column][key], whole[column][key])
+
+
+def test_describe_adds_percentiles_to_the_report():
+    data = frame()
+    stats = describe(data)
+    assert np.isclose(stats["Heart Rate"]["p50"], data["Heart Rate"].median())
+    assert np.isclose(stats["SpO2"]["p95"], data["SpO2"].quantile(0.95))
+    summary, report = generate_health_report(stats)
+    assert summary["Median Heart Rate"] == stats["Heart Rate"]["p50"]
+    assert "90 % of readings between" in report
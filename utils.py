@@ -1,4 +1,15 @@
 import streamlit as st
+from pool import ConnectionPool
+
+
+@st.cache_resource(show_spinner=False)
+def get_connection_pool():
+    return ConnectionPool('users.db')
+
+
+# Usage: with db_connection() as conn: ...
+def db_connection():
+    return get_connection_pool().connection()
 
 
 def logout():
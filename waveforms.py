@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+
+WAVEFORM_DIR = 'waveforms'
+SAMPLE_DTYPE = np.dtype('<f4')
+# A batch arriving later than expected by more than this is a dropout: the gap is padded with NaN
+# so every sample stays at start + i / rate
+MAX_CLOCK_SKEW = timedelta(seconds=0.5)
+
+
+def _utc(value):
+    if value is None:
+        return datetime.now(timezone.utc)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def user_dir(user_id, root=WAVEFORM_DIR):
+    return os.path.join(root, f"user_{user_id}")
+
+
+# A session is one contiguous fixed-rate recording: waveforms/user_<id>/<start>/<channel>.f32 holds
+# raw little-endian float32 samples (append-only) and meta.json its start time and rate, so the
+# time of sample i is implicit and finding a time is arithmetic, not a search.
+class WaveformWriter:
+    def __init__(self, user_id, rate_hz, start=None, channel='ecg', root=WAVEFORM_DIR):
+        self.user_id = user_id
+        self.rate_hz = float(rate_hz)
+        self.start = _utc(start)
+        self.channel = channel
+        self.directory = os.path.join(user_dir(user_id, root), self.start.strftime('%Y%m%dT%H%M%S%fZ'))
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump({"start": self.start.isoformat(), "rate_hz": self.rate_hz,
+                       "channel": channel, "dtype": SAMPLE_DTYPE.str}, f)
+        self._file = open(os.path.join(self.directory, f"{channel}.f32"), 'ab')
+        self._lock = threading.Lock()
+        self.samples = 0
+
+    def expected_time(self):
+        return self.start + timedelta(seconds=self.samples / self.rate_hz)
+
+    # `timestamp` is the time of the first sample in the batch; if given, dropouts are padded
+    def append(self, samples, timestamp=None):
+        samples = np.ascontiguousarray(samples, dtype=SAMPLE_DTYPE)
+        with self._lock:
+            if timestamp is not None:
+                gap = (_utc(timestamp) - self.expected_time()).total_seconds()
+                if gap > MAX_CLOCK_SKEW.total_seconds():
+                    self._file.write(np.full(int(round(gap * self.rate_hz)), np.nan, SAMPLE_DTYPE).tobytes())
+                    self.samples += int(round(gap * self.rate_hz))
+            self._file.write(samples.tobytes())
+            self._file.flush()  # readers map whatever has reached the file
+            self.samples += len(samples)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class WaveformSession:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        self.start = _utc(meta["start"])
+        self.rate_hz = meta["rate_hz"]
+        self.channel = meta["channel"]
+        self.path = os.path.join(directory, f"{self.channel}.f32")
+        self.refresh()
+
+    # Maps the file as it is now; call again to see samples appended since
+    def refresh(self):
+        size = os.path.getsize(self.path) // SAMPLE_DTYPE.itemsize
+        self.samples = np.memmap(self.path, dtype=SAMPLE_DTYPE, mode='r', shape=(size,)) if size \
+            else np.empty(0, SAMPLE_DTYPE)
+
+    def __len__(self):
+        return len(self.samples)
+
+    @property
+    def end(self):
+        return self.start + timedelta(seconds=len(self) / self.rate_hz)
+
+    def index(self, when):
+        offset = (_utc(when) - self.start).total_seconds() * self.rate_hz
+        return int(min(max(np.ceil(offset), 0), len(self)))
+
+    # Samples with start <= time < end as a view of the mapped file (no copy), and the time of the first
+    def slice(self, start=None, end=None):
+        i = self.index(start) if start is not None else 0
+        j = self.index(end) if end is not None else len(self)
+        return self.start + timedelta(seconds=i / self.rate_hz), self.samples[i:max(i, j)]
+
+    def times(self, first, count):
+        step = np.timedelta64(int(round(1e9 / self.rate_hz)), 'ns')
+        t0 = np.datetime64(first.replace(tzinfo=None), 'ns')
+        return t0 + np.arange(count) * step
+
+    # A Series over the mapped samples (UTC, naive index); only the time index is materialised
+    def to_series(self, start=None, end=None):
+        first, values = self.slice(start, end)
+        return pd.Series(values, index=self.times(first, len(values)), name=self.channel, copy=False)
+
+
+def list_sessions(user_id, channel='ecg', root=WAVEFORM_DIR):
+    try:
+        names = sorted(os.listdir(user_dir(user_id, root)))
+    except FileNotFoundError:
+        return []
+    sessions = []
+    for name in names:
+        directory = os.path.join(user_dir(user_id, root), name)
+        if os.path.exists(os.path.join(directory, f"{channel}.f32")):
+            sessions.append(WaveformSession(directory))
+    return sessions
+
+
+# Sessions overlapping [start, end), each sliced to it
+def read_waveform(user_id, start, end, channel='ecg', root=WAVEFORM_DIR):
+    start, end = _utc(start), _utc(end)
+    return [session.to_series(start, end) for session in list_sessions(user_id, channel, root)
+            if session.start < end and session.end > start]
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+# One open session per user and channel in this process; a new one starts if the rate changes
+def get_writer(user_id, rate_hz, channel='ecg', start=None):
+    with _writers_lock:
+        writer = _writers.get((user_id, channel))
+        if writer is None or writer.rate_hz != float(rate_hz):
+            if writer is not None:
+                writer.close()
+            writer = _writers[(user_id, channel)] = WaveformWriter(user_id, rate_hz, start, channel)
+        return writer
+
+
+def close_writer(user_id, channel='ecg'):
+    with _writers_lock:
+        writer = _writers.pop((user_id, channel), None)
+    if writer is not None:
+        writer.close()